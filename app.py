@@ -1,18 +1,213 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+import sys
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog, font as tkfont
 import json
 import os
 import hashlib
+import functools
+import shutil
 from datetime import datetime
-import webbrowser
 import csv
-from PIL import Image, ImageTk
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
+import math
+import re
+import heapq
+from bisect import bisect_left, bisect_right, insort
+import sqlite3
+import threading
+import queue
+import io
+import mmap
+import struct
+import base64
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import timedelta
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
 
+# matplotlib and NumPy cost far more to import than the rest of the app
+# together, so they are imported on first use (see load_numpy, show_chart).
+# The worker pool (concurrent.futures) is likewise imported by TaskRunner.
+np = False
 
 
+def load_numpy():
+    # NumPy is optional: None when it isn't installed
+    global np
+    if np is False:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+
+def preload_modules():
+    # Warm the chart imports in the background once the first window is up
+    def load():
+        try:
+            import matplotlib.figure
+            import matplotlib.backends.backend_agg
+        except Exception as e:
+            print("Error preloading matplotlib:", e)
+    threading.Thread(target=load, daemon=True).start()
+
+# ---------- Startup Timing ----------
+STARTUP_MARKS = [("start", STARTUP_STARTED)]
+
+
+def mark_startup(name):
+    STARTUP_MARKS.append((name, time.perf_counter()))
+
+
+def startup_report():
+    lines = ["Startup timing (ms since app.py started):"]
+    previous = STARTUP_STARTED
+    for name, at in STARTUP_MARKS[1:]:
+        lines.append(f"  {name:14} {(at - STARTUP_STARTED) * 1000:8.1f}  (+{(at - previous) * 1000:.1f})")
+        previous = at
+    return "\n".join(lines)
+
+# ---------- Diagnostics ----------
+class Diagnostics:
+    # Per-operation latency histograms plus row and byte counts for the hot
+    # paths marked with @instrumented. Off by default (set
+    # BUDGETBASE_DIAGNOSTICS=1 or use the Diagnostics window); while off an
+    # instrumented call costs one attribute check.
+    BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+    PROFILE_LINES = 30
+
+    def __init__(self):
+        self.enabled = bool(os.environ.get("BUDGETBASE_DIAGNOSTICS"))
+        self.lock = threading.Lock()
+        self.operations = {}
+        # profile_next: the next instrumented call runs under cProfile
+        self.profile_next = False
+        self.profiling = False
+        self.profile = None
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.profile = None
+
+    def record(self, name, seconds, rows=None, nbytes=None):
+        ms = seconds * 1000
+        with self.lock:
+            op = self.operations.get(name)
+            if op is None:
+                op = self.operations[name] = {"calls": 0, "total_ms": 0.0, "min_ms": ms, "max_ms": ms,
+                                              "rows": 0, "bytes": 0, "buckets": [0] * (len(self.BUCKETS_MS) + 1)}
+            op["calls"] += 1
+            op["total_ms"] += ms
+            op["min_ms"] = min(op["min_ms"], ms)
+            op["max_ms"] = max(op["max_ms"], ms)
+            op["buckets"][bisect_left(self.BUCKETS_MS, ms)] += 1
+            if rows is not None:
+                op["rows"] += rows
+            if nbytes is not None:
+                op["bytes"] += nbytes
+
+    def call(self, name, fn, args, kwargs, measure):
+        profiler = None
+        if self.profile_next:
+            with self.lock:
+                claimed = self.profile_next and not self.profiling
+                if claimed:
+                    self.profile_next, self.profiling = False, True
+            if claimed:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(name, time.perf_counter() - start)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.store_profile(name, profiler)
+        elapsed = time.perf_counter() - start
+        rows = nbytes = None
+        if measure is not None:
+            try:
+                rows, nbytes = measure(result, *args)
+            except Exception as e:
+                print("Error measuring", name + ":", e)
+        self.record(name, elapsed, rows, nbytes)
+        return result
+
+    def store_profile(self, name, profiler):
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.PROFILE_LINES)
+        with self.lock:
+            self.profile = {"operation": name, "captured": datetime.now().isoformat(timespec="seconds"),
+                            "stats": out.getvalue()}
+            self.profiling = False
+
+    def percentile(self, op, fraction):
+        # Upper edge of the bucket holding that share of calls
+        needed = fraction * op["calls"]
+        seen = 0
+        for bound, count in zip(self.BUCKETS_MS, op["buckets"]):
+            seen += count
+            if seen >= needed:
+                return round(min(bound, op["max_ms"]), 3)
+        return round(op["max_ms"], 3)
+
+    def report(self):
+        with self.lock:
+            operations = {name: dict(op, buckets=list(op["buckets"])) for name, op in self.operations.items()}
+            profile = self.profile
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        result = {}
+        for name, op in sorted(operations.items()):
+            result[name] = {
+                "calls": op["calls"], "total_ms": round(op["total_ms"], 3),
+                "mean_ms": round(op["total_ms"] / op["calls"], 3), "min_ms": round(op["min_ms"], 3),
+                "max_ms": round(op["max_ms"], 3), "p50_ms": self.percentile(op, 0.5),
+                "p95_ms": self.percentile(op, 0.95), "p99_ms": self.percentile(op, 0.99),
+                "rows": op["rows"], "bytes": op["bytes"],
+                "histogram": {label: n for label, n in zip(labels, op["buckets"]) if n}
+            }
+        return {"created": datetime.now().isoformat(timespec="seconds"), "enabled": self.enabled,
+                "python": sys.version.split()[0], "platform": sys.platform,
+                "startup_ms": {name: round((at - STARTUP_STARTED) * 1000, 1) for name, at in STARTUP_MARKS[1:]},
+                "operations": result, "profile": profile}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+DIAGNOSTICS = Diagnostics()
+
+
+def instrumented(name, measure=None):
+    # Times every call into DIAGNOSTICS while it is enabled.
+    # measure(result, *args) returns (rows, bytes); either may be None.
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not DIAGNOSTICS.enabled:
+                return fn(*args, **kwargs)
+            return DIAGNOSTICS.call(name, fn, args, kwargs, measure)
+        return call
+    return wrap
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
 # ---------- Styling ----------
 def setup_styles():
     style = ttk.Style()
@@ -27,114 +222,3585 @@ def setup_styles():
               foreground=[('disabled', '#cccccc'), ('active', '#ffffff')])
 
 # ---------- Storage ----------
+class FileLock:
+    # Exclusive lock on a file in the user's folder, held while any process
+    # reads or writes that user's expense files. Re-entrant within a process,
+    # and shared by every SecureStorage for the same user (see for_path).
+    locks = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.mutex = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    @classmethod
+    def for_path(cls, path):
+        # OS locks belong to the open file, so two of them in one process would
+        # lock each other out; a forked worker gets its own
+        path = os.path.abspath(path)
+        lock = cls.locks.get(path)
+        if lock is None or lock.pid != os.getpid():
+            lock = cls.locks[path] = cls(path)
+        return lock
+
+    def acquire(self, blocking=True):
+        if not self.mutex.acquire(blocking):
+            return False
+        if self.depth == 0:
+            try:
+                if self.handle is None:
+                    self.handle = open(self.path, "a+b")
+                if os.name == "nt":
+                    self.handle.seek(0)
+                    # LK_LOCK retries for about ten seconds before giving up
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                self.mutex.release()
+                if blocking:
+                    raise
+                return False
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if os.name == "nt":
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+        self.mutex.release()
+
+    def close(self):
+        # Drops the file handle while nobody holds the lock; acquire reopens it
+        with self.mutex:
+            if self.depth == 0 and self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def sync_dir(path):
+    # Makes a rename inside path durable; Windows has no directory handles to sync
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path, mode="w", durable=True):
+    # Writes go to a temporary file that replaces path only once it is
+    # complete, so a crash leaves the old file or the new one, never half of
+    # one. durable also fsyncs it first; caches that are rebuilt when they
+    # look wrong can skip that.
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if durable:
+        sync_dir(os.path.dirname(path) or ".")
+
+
 class SecureStorage:
     BASE_DIR = os.path.join(os.path.expanduser("~"), ".expense_tracker_data")
+    DEFAULT_BACKEND = "journal"
+    NEW_USER_BACKEND = "partitioned"
+
+    # (BASE_DIR, its mtime, users); adding or removing a user directory changes the mtime
+    user_cache = None
+
+    @staticmethod
+    def list_users():
+        base_dir = SecureStorage.BASE_DIR
+        try:
+            mtime = os.stat(base_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        cache = SecureStorage.user_cache
+        if cache is None or cache[0] != base_dir or cache[1] != mtime:
+            users = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
+            cache = SecureStorage.user_cache = (base_dir, mtime, users)
+        return list(cache[2])
+
+    @staticmethod
+    def invalidate_users():
+        # For changes made within the mtime's resolution on coarse filesystems
+        SecureStorage.user_cache = None
+
+    @staticmethod
+    def delete_user(user_id):
+        shutil.rmtree(os.path.join(SecureStorage.BASE_DIR, user_id))
+        SecureStorage.invalidate_users()
+
+    def __init__(self, user_id, backend=None):
+        os.makedirs(self.BASE_DIR, exist_ok=True)
+        self.user_id = user_id
+        self.user_dir = os.path.join(self.BASE_DIR, user_id)
+        if not os.path.isdir(self.user_dir):
+            os.makedirs(self.user_dir)
+            self.invalidate_users()
+        self.pin_file = os.path.join(self.user_dir, "pin.hash")
+        self.data_file = os.path.join(self.user_dir, "expenses.json")
+        self.category_file = os.path.join(self.user_dir, "categories.json")
+        self.journal_file = os.path.join(self.user_dir, "expenses.journal")
+        self.db_file = os.path.join(self.user_dir, "expenses.db")
+        self.config_file = os.path.join(self.user_dir, "storage.json")
+        self.aggregate_file = os.path.join(self.user_dir, "aggregates.json")
+        self.partition_dir = os.path.join(self.user_dir, "partitions")
+        self.binary_file = os.path.join(self.user_dir, "expenses.bin")
+        self.budget_file = os.path.join(self.user_dir, "budgets.json")
+        self.id_file = os.path.join(self.user_dir, "next_id")
+        self.id_handle = None
+        # Every process with this user open takes it before touching the expense files
+        self.lock = FileLock.for_path(os.path.join(self.user_dir, ".lock"))
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend '{backend}'")
+        # The backend is recorded when the user is created, so files another
+        # backend leaves behind can't change where the expenses are read from
+        self.backend_name = self.load_config().get("backend")
+        if self.backend_name is None:
+            self.backend_name = self.default_backend(backend)
+            self.save_config()
+        if backend is not None and backend != self.backend_name:
+            raise ValueError(f"User '{user_id}' keeps expenses in the '{self.backend_name}' backend; "
+                             f"use convert_backend to move them to '{backend}'")
+        self.opened = None
+
+    @property
+    def backend(self):
+        # Opened on first use, so nothing reads or repairs the expense files before the PIN is checked
+        if self.opened is None:
+            self.opened = self.open_backend(self.backend_name)
+        return self.opened
+
+    def save_pin(self, pin):
+        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
+        with atomic_open(self.pin_file) as f:
+            f.write(hashed_pin)
+
+    def check_pin(self, pin):
+        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
+        if os.path.exists(self.pin_file):
+            with open(self.pin_file, 'r') as f:
+                return hashed_pin == f.read()
+        return False
+
+    def pin_exists(self):
+        return os.path.exists(self.pin_file)
+
+    def reset_pin(self):
+        if os.path.exists(self.pin_file):
+            os.remove(self.pin_file)
+
+    @instrumented("storage.load_categories", lambda categories, self: (len(categories), file_size(self.category_file)))
+    def load_categories(self):
+        try:
+            if os.path.exists(self.category_file):
+                with open(self.category_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print("Error loading categories:", e)
+        return ["Food", "Transport", "Utilities", "Entertainment", "Health", "Other"]
+
+    @instrumented("storage.save_categories", lambda _, self, categories: (len(categories), file_size(self.category_file)))
+    def save_categories(self, categories):
+        try:
+            with atomic_open(self.category_file) as f:
+                json.dump(categories, f, indent=2)
+        except Exception as e:
+            print("Error saving categories:", e)
+
+    def load_budgets(self):
+        # Monthly limit per category
+        try:
+            if os.path.exists(self.budget_file):
+                with open(self.budget_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print("Error loading budgets:", e)
+        return {}
+
+    def save_budgets(self, budgets):
+        try:
+            with atomic_open(self.budget_file) as f:
+                json.dump(budgets, f, indent=2)
+        except Exception as e:
+            print("Error saving budgets:", e)
+
+    def load_config(self):
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print("Error loading storage config:", e)
+        return {}
+
+    def save_config(self):
+        with atomic_open(self.config_file) as f:
+            json.dump({"backend": self.backend_name}, f, indent=2)
+
+    def default_backend(self, preferred=None):
+        # For users without storage.json (new, or from before it was written):
+        # data already in expenses.json stays there until convert_backend moves it
+        if os.path.exists(self.data_file) or os.path.exists(self.journal_file):
+            return self.DEFAULT_BACKEND
+        if os.path.isdir(self.partition_dir) and any(entry.endswith(".jsonl") for entry in os.listdir(self.partition_dir)):
+            return "partitioned"
+        if os.path.exists(self.db_file):
+            return "sqlite"
+        if os.path.exists(self.binary_file):
+            return "binary"
+        return preferred or self.NEW_USER_BACKEND
+
+    def open_backend(self, name):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown storage backend '{name}'")
+        # Opening may repair a write torn by a crash, which must not race another process's write
+        with self.lock:
+            return BACKENDS[name](self)
+
+    def convert_backend(self, name):
+        # One-shot copy of every expense into another backend, which then becomes the user's default
+        with self.lock:
+            expenses = self.backend.load() if self.backend.in_memory else self.backend.all()
+            target = self.open_backend(name)
+            target.load()
+            target.save(expenses)
+            self.backend.close()
+            self.opened = target
+            self.backend_name = name
+            self.save_config()
+
+    def reserve_ids(self, count, floor=1):
+        # First of count new expense IDs. The counter is shared by every process
+        # with this user open, so two of them never hand out the same ID; floor
+        # covers data written before the counter existed, or a counter lost in a
+        # crash, so it is simply overwritten in place.
+        with self.lock:
+            if self.id_handle is None:
+                self.id_handle = open(os.open(self.id_file, os.O_RDWR | os.O_CREAT), "r+")
+            f = self.id_handle
+            f.seek(0)
+            try:
+                next_id = int(f.read() or 1)
+            except ValueError:
+                next_id = 1
+            next_id = max(next_id, floor)
+            # Fixed width, so every write covers the previous one
+            f.seek(0)
+            f.write(f"{next_id + count:<20}")
+            f.flush()
+            return next_id
+
+    def close(self):
+        # Closes the backend, the ID counter and the lock file, so nothing
+        # holds the user's folder open (Windows won't delete it otherwise);
+        # using the storage again reopens them
+        with self.lock:
+            if self.opened is not None:
+                self.opened.close()
+                self.opened = None
+            if self.id_handle is not None:
+                self.id_handle.close()
+                self.id_handle = None
+        self.lock.close()
+
+# ---------- Expense Journal ----------
+def id_position(expenses, expense_id, lo=0):
+    # Rows are kept in ID order, so an ID is found by bisection; returns the
+    # insertion point, which holds the expense only if the ID exists
+    hi = len(expenses)
+    columnar = isinstance(expenses, ColumnarExpenses)
+    if lo < hi:
+        # IDs are distinct integers, so the row is at most its ID gap past lo
+        first = expenses.ids[lo] if columnar else expenses[lo]["id"]
+        hi = min(hi, lo + max(0, expense_id - first) + 1)
+    if columnar:
+        return bisect_left(expenses.ids, expense_id, lo, hi)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if expenses[mid]["id"] < expense_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def assign_ids(expenses):
+    # Rows saved before expenses had IDs are numbered in list order
+    next_id = 1
+    for exp in expenses:
+        if "id" not in exp:
+            exp["id"] = next_id
+        next_id = exp["id"] + 1
+    return expenses
+
+
+class ExpenseJournal:
+    # Adds and deletes are appended as one JSON line each; the snapshot in
+    # expenses.json is only rewritten when the journal grows past this size.
+    # Other processes may append to the same journal: every append first reads
+    # what they added (catch_up), so sequence numbers stay in file order.
+    COMPACT_BYTES = 1024 * 1024
+
+    def __init__(self, snapshot_file, journal_file, lock):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.seq = 0
+        self.snapshot_seq = 0
+        # The storage's FileLock; also guards the fields below between threads
+        self.lock = lock
+        self.compactor = None
+        # Bytes of the journal read or written so far, and the snapshot file as last seen
+        self.offset = 0
+        self.snapshot_state = None
+        # Records other processes appended that the tracker hasn't taken yet
+        # (see changes); None once they replaced the snapshot, which needs a full reload
+        self.foreign = []
+
+    @staticmethod
+    def read_snapshot(data):
+        # Older expenses.json files are a bare list; treat them as seq 0.
+        if isinstance(data, dict):
+            return data.get("expenses", []), data.get("seq", 0)
+        return data, 0
+
+    @staticmethod
+    def file_state(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def apply(expenses, record):
+        op = record["op"]
+        if op == "add":
+            expense = record["expense"]
+            if "id" not in expense:
+                expense["id"] = expenses[-1]["id"] + 1 if expenses else 1
+            # An undone delete (or another process's add) goes in at its ID's place
+            if expenses and expenses[-1]["id"] > expense["id"]:
+                expenses.insert(id_position(expenses, expense["id"]), expense)
+            else:
+                expenses.append(expense)
+        elif op == "pop" and expenses:
+            expenses.pop()
+        elif op in ("update", "delete"):
+            expense_id = record["expense"]["id"] if op == "update" else record["id"]
+            i = id_position(expenses, expense_id)
+            if i < len(expenses) and expenses[i]["id"] == expense_id:
+                if op == "update":
+                    expenses[i] = record["expense"]
+                else:
+                    del expenses[i]
+
+    @instrumented("journal.load", lambda expenses, self: (len(expenses), file_size(self.snapshot_file, self.journal_file)))
+    def load(self):
+        with self.lock:
+            expenses, base_seq = [], 0
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, "r") as f:
+                    try:
+                        expenses, base_seq = self.read_snapshot(json.load(f))
+                    except ValueError as e:
+                        # Left as it is, so whatever it still holds can be recovered
+                        raise ValueError(f"{self.snapshot_file} is damaged ({e})") from e
+                assign_ids(expenses)
+            self.seq = self.snapshot_seq = base_seq
+            self.snapshot_state = self.file_state(self.snapshot_file)
+            self.foreign = []
+            self.offset = 0
+            if not os.path.exists(self.journal_file):
+                return expenses
+            good_offset = 0
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    good_offset += len(line)
+                    if record["seq"] <= base_seq:
+                        continue
+                    self.apply(expenses, record)
+                    self.seq = record["seq"]
+            # Drop a torn record left behind by a crash so new appends stay parseable
+            if good_offset < os.path.getsize(self.journal_file):
+                with open(self.journal_file, "r+b") as f:
+                    f.truncate(good_offset)
+            self.offset = good_offset
+            return expenses
+
+    def catch_up(self):
+        # Reads whatever other processes appended since this one last read or
+        # wrote the journal into self.foreign; call with the lock held
+        if self.file_state(self.snapshot_file) != self.snapshot_state:
+            # Another process compacted (or the json backend saved): the tracker
+            # has to reload, and our next seq must follow every record on disk
+            self.snapshot_state = self.file_state(self.snapshot_file)
+            self.foreign = None
+            self.offset = 0
+        size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+        if size < self.offset:
+            self.foreign = None
+            self.offset = 0
+        if size == self.offset:
+            return
+        records = []
+        with open(self.journal_file, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                record = json.loads(line)
+                if record["op"] == "snapshot":
+                    self.snapshot_seq = max(self.snapshot_seq, record["seq"])
+                if record["seq"] > self.seq:
+                    self.seq = record["seq"]
+                    if record["op"] != "snapshot":
+                        records.append(record)
+        if self.foreign is not None:
+            self.foreign.extend(records)
+
+    def changes(self):
+        # Records other processes appended since the last call, or None if the
+        # snapshot changed underneath and everything has to be read again
+        with self.lock:
+            self.catch_up()
+            foreign, self.foreign = self.foreign, []
+            return foreign
+
+    @instrumented("journal.append", lambda written, self, records: (len(records), written))
+    def append(self, records):
+        # A whole batch goes out in one write and is synced before returning;
+        # returns the bytes written
+        with self.lock:
+            self.catch_up()
+            lines = []
+            for record in records:
+                self.seq += 1
+                record["seq"] = self.seq
+                lines.append(json.dumps(record) + "\n")
+            data = "".join(lines).encode()
+            with open(self.journal_file, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.offset += len(data)
+            return len(data)
+
+    def needs_compaction(self):
+        return (not self.compacting() and os.path.exists(self.journal_file)
+                and os.path.getsize(self.journal_file) > self.COMPACT_BYTES)
+
+    def start_compaction(self, expenses):
+        # expenses must already include every record appended so far
+        self.compactor = threading.Thread(target=self.compact, args=(expenses, self.seq), daemon=True)
+        self.compactor.start()
+
+    def compacting(self):
+        return self.compactor is not None and self.compactor.is_alive()
+
+    @instrumented("journal.compact", lambda _, self, expenses, seq: (len(expenses), file_size(self.snapshot_file)))
+    def compact(self, expenses, seq):
+        tmp = f"{self.snapshot_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": 1, "seq": seq, "expenses": list(expenses)}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            with self.lock:
+                if seq < self.snapshot_seq or self.file_state(self.snapshot_file) != self.snapshot_state:
+                    # A newer snapshot landed while this one was being written,
+                    # here or in another process
+                    os.remove(tmp)
+                    return
+                # Records appended since are kept in the tail below, and must reach the tracker too
+                self.catch_up()
+                # Snapshot first: records it already covers are skipped by seq on replay
+                os.replace(tmp, self.snapshot_file)
+                sync_dir(os.path.dirname(self.snapshot_file) or ".")
+                self.snapshot_seq = seq
+                self.snapshot_state = self.file_state(self.snapshot_file)
+                tail = []
+                if os.path.exists(self.journal_file):
+                    with open(self.journal_file, "rb") as f:
+                        tail = [line for line in f if line.endswith(b"\n") and json.loads(line)["seq"] > seq]
+                # The first line records the snapshot's seq, so other processes
+                # keep numbering after it even when the tail is empty
+                with atomic_open(self.journal_file, "wb") as f:
+                    f.write((json.dumps({"seq": seq, "op": "snapshot"}) + "\n").encode())
+                    f.writelines(tail)
+                self.offset = os.path.getsize(self.journal_file)
+        except Exception as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            print("Error compacting journal:", e)
+
+# ---------- Storage Backends ----------
+class JsonBackend:
+    # Whole list kept in memory and rewritten to expenses.json on every change
+    name = "json"
+    in_memory = True
+    incremental = False
+    appends_in_order = True
+
+    def __init__(self, storage):
+        self.data_file = storage.data_file
+        self.journal_file = storage.journal_file
+        self.journal = ExpenseJournal(storage.data_file, storage.journal_file, storage.lock)
+
+    def load(self):
+        # Also folds in a journal left by the journal backend
+        return self.journal.load()
+
+    @instrumented("json.save", lambda _, self, expenses: (len(expenses), file_size(self.data_file)))
+    def save(self, expenses):
+        with self.journal.lock:
+            with atomic_open(self.data_file) as f:
+                json.dump(list(expenses), f, indent=2)
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self.journal.snapshot_state = self.journal.file_state(self.data_file)
+            self.journal.offset = 0
+
+    def needs_snapshot(self):
+        return True
+
+    def change_token(self):
+        # Identifies the data as this process last read or wrote it, for the
+        # aggregate cache; None while other processes' changes are still to be
+        # taken (see changes), as the tracker's totals don't include them yet
+        if self.journal.foreign != []:
+            return None
+        return list(self.journal.snapshot_state or ())
+
+    def changes(self):
+        # Another process's save can only be picked up by reading the whole file again
+        return self.journal.changes()
+
+    def commit(self, ops, snapshot):
+        with self.journal.lock:
+            self.journal.catch_up()
+            if self.journal.foreign != []:
+                # Saved by another process since we last read it: writing our
+                # snapshot would drop their changes, so ours go on top of theirs
+                snapshot = self.journal.load()
+                for op in ops:
+                    ExpenseJournal.apply(snapshot, op)
+                self.journal.foreign = None
+            self.save(snapshot)
+
+    def close(self):
+        pass
+
+
+class JournalBackend(JsonBackend):
+    name = "journal"
+    incremental = True
+
+    def save(self, expenses):
+        self.journal.compact(expenses, self.journal.seq)
+
+    def needs_snapshot(self):
+        return self.journal.needs_compaction()
+
+    def change_token(self):
+        # Compaction rewrites the snapshot without changing the data, so the journal's seq is used
+        if self.journal.foreign != []:
+            return None
+        return self.journal.seq
+
+    def commit(self, ops, snapshot):
+        with self.journal.lock:
+            self.journal.append(ops)
+            # A snapshot taken before records from another process were read would lose them
+            if snapshot is not None and self.journal.foreign == []:
+                self.journal.start_compaction(snapshot)
+
+
+class SqliteBackend:
+    # Rows stay on disk in expenses.db; summaries run as GROUP BY queries.
+    # SQLite does its own locking between processes; every commit also logs
+    # its ops to the changes table so other connections can pick them up.
+    # Description words (tokenize) go in the tokens table, so text search is
+    # a prefix range over its key and matches what the other backends match.
+    name = "sqlite"
+    in_memory = False
+    incremental = True
+    appends_in_order = True
+    # Entries kept in the changes table; a reader further behind reloads instead
+    KEEP_CHANGES = 10000
+    # PRAGMA user_version once the tokens table is filled
+    TOKENS_VERSION = 1
+
+    def __init__(self, storage):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(storage.db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Tells this connection's own entries in the changes table from everyone else's
+        self.writer = os.urandom(8).hex()
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS expenses ("
+                "id INTEGER PRIMARY KEY, date TEXT NOT NULL, description TEXT NOT NULL, "
+                "amount REAL NOT NULL, category TEXT NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category, amount)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, writer TEXT NOT NULL, op TEXT NOT NULL, id INTEGER NOT NULL)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "token TEXT NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (token, id)) WITHOUT ROWID")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.TOKENS_VERSION:
+            self.build_tokens()
+        self.seen = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def build_tokens(self):
+        # Databases from before the tokens table; IMMEDIATE, so a second
+        # process opening it at the same time waits and then finds it done
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.TOKENS_VERSION:
+                self.conn.execute("DELETE FROM tokens")
+                self.add_tokens(self.conn.execute("SELECT id, description FROM expenses").fetchall())
+                self.conn.execute(f"PRAGMA user_version = {self.TOKENS_VERSION}")
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def add_tokens(self, rows):
+        # rows are (id, description) pairs; call inside a transaction
+        self.conn.executemany("INSERT OR IGNORE INTO tokens (token, id) VALUES (?, ?)",
+                              [(token, expense_id) for expense_id, description in rows for token in tokenize(description)])
+
+    def drop_tokens(self, expense_id):
+        # Before the row itself changes; call inside a transaction
+        row = self.conn.execute("SELECT description FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+        if row is not None:
+            self.conn.executemany("DELETE FROM tokens WHERE token = ? AND id = ?",
+                                  [(token, expense_id) for token in tokenize(row[0])])
+
+    def load(self):
+        return []
+
+    def all(self):
+        return list(self.iter_all())
+
+    def iter_all(self, start=None, end=None, categories=None, batch_size=5000):
+        # Keyset-paged so a long export never holds the lock for more than one batch
+        where, params = ["id > ?"], []
+        low, high = date_bounds(start, end)
+        if low is not None:
+            where.append("date >= ?")
+            params.append(low)
+        if high is not None:
+            where.append("date < ?")
+            params.append(high)
+        if categories:
+            where.append(f"category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        sql = (f"SELECT id, date, description, amount, category FROM expenses "
+               f"WHERE {' AND '.join(where)} ORDER BY id LIMIT ?")
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(sql, [last_id] + params + [batch_size]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]["id"]
+
+    def save(self, expenses):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM expenses")
+            self.conn.execute("DELETE FROM tokens")
+            self.conn.executemany(
+                "INSERT INTO expenses (id, date, description, amount, category) VALUES (?, ?, ?, ?, ?)",
+                [(e.get("id"), e["date"], e["description"], e["amount"], e["category"]) for e in expenses])
+            # Read back, since rows without an ID only get one on insert
+            self.add_tokens(self.conn.execute("SELECT id, description FROM expenses").fetchall())
+            self.log_changes([("reset", 0)])
+
+    def log_changes(self, entries):
+        # (op, id) pairs, written in the caller's transaction; old entries are dropped as new ones arrive
+        self.conn.executemany("INSERT INTO changes (writer, op, id) VALUES (?, ?, ?)",
+                              [(self.writer, op, expense_id) for op, expense_id in entries])
+        self.conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (self.KEEP_CHANGES,))
+
+    def changes(self):
+        # Ops other connections committed since the last call, with rows as they
+        # are now; None if they replaced everything or the log no longer reaches back
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version:
+                return []
+            self.data_version = version
+            first, last = self.conn.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+            if last is None or last <= self.seen:
+                return []
+            entries = self.conn.execute(
+                "SELECT op, id FROM changes WHERE seq > ? AND writer != ? ORDER BY seq", (self.seen, self.writer)).fetchall()
+            behind = first > self.seen + 1
+            self.seen = last
+            if behind or any(op == "reset" for op, _ in entries):
+                return None
+            ops = []
+            for op, expense_id in entries:
+                if op == "delete":
+                    ops.append({"op": "delete", "id": expense_id})
+                    continue
+                row = self.conn.execute(
+                    "SELECT id, date, description, amount, category FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+                # Gone already: a later entry deletes it
+                if row is not None:
+                    ops.append({"op": op, "expense": dict(row)})
+            return ops
+
+    def needs_snapshot(self):
+        return False
+
+    def change_token(self):
+        # One statement, so another connection's commit can't land between the two reads
+        with self.lock:
+            token, behind = self.conn.execute(
+                "SELECT (SELECT COALESCE(MAX(seq), 0) FROM changes), "
+                "EXISTS (SELECT 1 FROM changes WHERE seq > ? AND writer != ?)", (self.seen, self.writer)).fetchone()
+        return None if behind else token
+
+    @instrumented("sqlite.commit", lambda _, self, ops, snapshot=None: (len(ops), None))
+    def commit(self, ops, snapshot=None):
+        # Rows are keyed by the expense ID, so edits and deletes touch only their row
+        with self.lock, self.conn:
+            for op in ops:
+                if op["op"] == "add":
+                    expense = op["expense"]
+                    self.conn.execute(
+                        "INSERT INTO expenses (id, date, description, amount, category) VALUES (?, ?, ?, ?, ?)",
+                        (expense["id"], expense["date"], expense["description"], expense["amount"], expense["category"]))
+                    self.add_tokens([(expense["id"], expense["description"])])
+                elif op["op"] == "update":
+                    expense = op["expense"]
+                    self.drop_tokens(expense["id"])
+                    self.conn.execute(
+                        "UPDATE expenses SET date = ?, description = ?, amount = ?, category = ? WHERE id = ?",
+                        (expense["date"], expense["description"], expense["amount"], expense["category"], expense["id"]))
+                    self.add_tokens([(expense["id"], expense["description"])])
+                elif op["op"] == "delete":
+                    self.drop_tokens(op["id"])
+                    self.conn.execute("DELETE FROM expenses WHERE id = ?", (op["id"],))
+            self.log_changes([(op["op"], op["id"] if op["op"] == "delete" else op["expense"]["id"])
+                              for op in ops if op["op"] in ("add", "update", "delete")])
+
+    def get(self, expense_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, date, description, amount, category FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    def last(self, skip=()):
+        # The row with the highest ID, passing over the IDs in skip
+        skip = list(skip)
+        where = f" WHERE id NOT IN ({', '.join('?' * len(skip))})" if skip else ""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT id, date, description, amount, category FROM expenses{where} ORDER BY id DESC LIMIT 1",
+                skip).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def list_key(expense):
+        # rows() lists expenses in ID order
+        return expense["id"]
+
+    @staticmethod
+    def merge_ids(ids, rows):
+        # Query IDs plus rows that aren't among them, in list order
+        return list(heapq.merge(ids, sorted(row["id"] for row in rows)))
+
+    def category_groups(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT category, COUNT(*), SUM(amount) FROM expenses GROUP BY category ORDER BY MIN(id)").fetchall()
+        return {cat: [n, amt] for cat, n, amt in rows}
+
+    def month_groups(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT substr(date, 1, 7) AS month, COUNT(*), SUM(amount) FROM expenses "
+                "GROUP BY month ORDER BY month").fetchall()
+        return {month: [n, amt] for month, n, amt in rows}
+
+    def day_groups(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT category, substr(date, 1, 10) AS day, SUM(amount) FROM expenses GROUP BY category, day").fetchall()
+        return {(cat, ExpenseAnalytics.day(day)): amt for cat, day, amt in rows}
+
+    @instrumented("sqlite.query", lambda ids, *args, **kwargs: (len(ids), None))
+    def query(self, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+        # Matching row ids; the date and category filters use the table's
+        # indexes and each word is a prefix range over the tokens table
+        where, params = [], []
+        low, high = date_bounds(start, end)
+        if low is not None:
+            where.append("date >= ?")
+            params.append(low)
+        if high is not None:
+            where.append("date < ?")
+            params.append(high)
+        if categories:
+            where.append(f"category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        if min_amount is not None:
+            where.append("amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            where.append("amount <= ?")
+            params.append(max_amount)
+        for word in tokenize(text or ""):
+            # No token has U+10FFFF in it, so this covers every token starting with word
+            where.append("id IN (SELECT id FROM tokens WHERE token BETWEEN ? AND ?)")
+            params.extend((word, word + "\U0010ffff"))
+        sql = "SELECT id FROM expenses" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY id"
+        with self.lock:
+            return [row[0] for row in self.conn.execute(sql, params)]
+
+    def rows_by_id(self, ids):
+        rows = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            with self.lock:
+                rows.extend(dict(row) for row in self.conn.execute(
+                    f"SELECT id, date, description, amount, category FROM expenses "
+                    f"WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id", chunk))
+        return rows
+
+    @instrumented("sqlite.rows", lambda rows, *args: (len(rows), None))
+    def rows(self, start, stop):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, date, description, amount, category FROM expenses ORDER BY id LIMIT ? OFFSET ?",
+                (max(0, stop - start), start)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+
+class PartitionedBackend:
+    # One JSON-lines file per month under partitions/, each with a small
+    # manifest (row count, totals, ID ranges, last row). Opening reads only the
+    # manifests; partitions are read when a view asks for their rows, and a
+    # write only touches the partition of the expense's month. Edits and
+    # deletes are appended as patch and tombstone lines, and a partition is
+    # rewritten once those outnumber its rows. Other processes may append to
+    # the same partitions: every commit first reads what they wrote (catch_up).
+    # Each data file gets a random epoch in its manifest when it is created or
+    # rewritten, so a replaced file is never mistaken for the one it replaced,
+    # even when the filesystem hands it the same inode. Manifests also hold
+    # per-day totals for the analytics, and queries go through an ExpenseIndex
+    # built on the first one and kept up to date by every write.
+    name = "partitioned"
+    in_memory = False
+    incremental = True
+    # Rows are listed month by month, so the newest add is not always the last row
+    appends_in_order = False
+    # Partitions stay cached (least recently used dropped first) up to this many rows
+    CACHE_ROWS = 200000
+    MANIFEST_VERSION = 4
+
+    def __init__(self, storage):
+        self.dir = storage.partition_dir
+        os.makedirs(self.dir, exist_ok=True)
+        self.file_lock = storage.lock
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()
+        self.manifests = {}
+        # Every write by any process bumps the counter in this file first, so
+        # catch_up only reads the manifests when someone else wrote
+        self.counter_path = os.path.join(self.dir, "changes")
+        self.seen = self.read_counter()
+        # Ops other processes wrote that the tracker hasn't taken yet (see changes)
+        self.foreign = []
+        self.index = None
+        # (counter, run starts, runs) for group_ids, rebuilt when the counter moves
+        self.id_runs = None
+        for month in self.disk_months():
+            self.refresh_manifest(month)
+
+    def read_counter(self):
+        try:
+            with open(self.counter_path, "r") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_counter(self):
+        # Call with the file lock held, before writing; fixed width, so it is overwritten in place
+        with open(os.open(self.counter_path, os.O_RDWR | os.O_CREAT), "r+") as f:
+            try:
+                counter = int(f.read() or 0) + 1
+            except ValueError:
+                counter = 1
+            f.seek(0)
+            f.write(f"{counter:<20}")
+        self.seen = counter
+
+    def disk_months(self):
+        return [entry[:-len(".jsonl")] for entry in os.listdir(self.dir) if entry.endswith(".jsonl")]
+
+    def refresh_manifest(self, month):
+        manifest = self.read_manifest(month)
+        if manifest is None:
+            manifest = self.rebuild_manifest(month)
+        if manifest is None:
+            self.manifests.pop(month, None)
+            self.cache.pop(month, None)
+        else:
+            self.manifests[month] = manifest
+
+    def data_path(self, month):
+        return os.path.join(self.dir, month + ".jsonl")
+
+    def manifest_path(self, month):
+        return os.path.join(self.dir, month + ".manifest.json")
+
+    def read_manifest(self, month):
+        # A manifest is trusted only if it describes the data file byte for byte
+        try:
+            with open(self.manifest_path(month), "r") as f:
+                manifest = json.load(f)
+            size = os.path.getsize(self.data_path(month))
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != self.MANIFEST_VERSION or manifest.get("bytes") != size:
+            return None
+        return manifest
+
+    @staticmethod
+    def new_manifest(month):
+        return {"version": PartitionedBackend.MANIFEST_VERSION, "month": month, "epoch": os.urandom(8).hex(),
+                "count": 0, "total": 0.0, "min": None, "max": None, "categories": {}, "days": {}, "ids": [], "seq": 0, "last": None,
+                "lines": 0, "bytes": 0}
+
+    # ID sets are stored as sorted [first, last] runs, which stay short because
+    # IDs are handed out in order
+    @staticmethod
+    def run_find(runs, n):
+        i = bisect_right(runs, [n, math.inf]) - 1
+        return i if i >= 0 and runs[i][1] >= n else None
+
+    @staticmethod
+    def run_add(runs, n):
+        if runs and runs[-1][1] == n - 1:
+            runs[-1][1] = n
+            return
+        i = bisect_left(runs, [n, n])
+        if i > 0 and runs[i - 1][1] >= n:
+            return
+        left = i > 0 and runs[i - 1][1] == n - 1
+        right = i < len(runs) and runs[i][0] == n + 1
+        if left and right:
+            runs[i - 1][1] = runs[i][1]
+            del runs[i]
+        elif left:
+            runs[i - 1][1] = n
+        elif right:
+            runs[i][0] = n
+        else:
+            runs.insert(i, [n, n])
+
+    @classmethod
+    def run_remove(cls, runs, n):
+        i = cls.run_find(runs, n)
+        if i is None:
+            return
+        first, last = runs[i]
+        if first == last:
+            del runs[i]
+        elif n == first:
+            runs[i][0] = n + 1
+        elif n == last:
+            runs[i][1] = n - 1
+        else:
+            runs[i:i + 1] = [[first, n - 1], [n + 1, last]]
+
+    @staticmethod
+    def bump_day(manifest, expense, rows):
+        # Day totals per category, keyed "YYYY-MM-DD"
+        days = manifest["days"].setdefault(expense["category"], {})
+        ExpenseAggregates.bump(days, expense["date"][:10], expense["amount"] * rows, rows)
+        if not days:
+            del manifest["days"][expense["category"]]
+
+    @classmethod
+    def manifest_add(cls, manifest, expense):
+        amount = expense["amount"]
+        manifest["count"] += 1
+        manifest["total"] += amount
+        manifest["min"] = amount if manifest["min"] is None else min(manifest["min"], amount)
+        manifest["max"] = amount if manifest["max"] is None else max(manifest["max"], amount)
+        ExpenseAggregates.bump(manifest["categories"], expense["category"], amount, 1)
+        cls.bump_day(manifest, expense, 1)
+        cls.run_add(manifest["ids"], expense["id"])
+        if expense["id"] >= manifest["seq"]:
+            manifest["seq"] = expense["id"]
+            manifest["last"] = expense
+
+    @classmethod
+    def manifest_remove(cls, manifest, expense, rows):
+        # rows are the partition's rows after the removal; min/max stay as loose bounds
+        manifest["count"] -= 1
+        manifest["total"] -= expense["amount"]
+        ExpenseAggregates.bump(manifest["categories"], expense["category"], -expense["amount"], -1)
+        cls.bump_day(manifest, expense, -1)
+        cls.run_remove(manifest["ids"], expense["id"])
+        if expense["id"] == manifest["seq"]:
+            manifest["last"] = max(rows, key=lambda row: row["id"]) if rows else None
+            manifest["seq"] = manifest["last"]["id"] if rows else 0
+
+    @staticmethod
+    def line(expense, op=None):
+        record = {"seq": expense["id"], "date": expense["date"], "description": expense["description"],
+                  "amount": expense["amount"], "category": expense["category"]}
+        if op is not None:
+            record["op"] = op
+        return json.dumps(record) + "\n"
+
+    def write_manifest(self, manifest):
+        # Rebuilt from the data file whenever it doesn't match, so it needn't be synced
+        with atomic_open(self.manifest_path(manifest["month"]), durable=False) as f:
+            json.dump(manifest, f)
+
+    @instrumented("partitioned.read", lambda result, self, month: (len(result[0]), result[2]))
+    def read_partition(self, month):
+        # (rows in ID order, lines, bytes of complete lines); patches and
+        # tombstones are applied as they are read, and a torn final line ends the file
+        live, lines, good = {}, 0, 0
+        with open(self.data_path(month), "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                lines += 1
+                expense_id = record.pop("seq")
+                op = record.pop("op", None)
+                if op == "delete":
+                    live.pop(expense_id, None)
+                else:
+                    record["id"] = expense_id
+                    live[expense_id] = record
+        # Rows are appended in ID order except for late adds, restores and moves from another month
+        return sorted(live.values(), key=lambda row: row["id"]), lines, good
+
+    def rebuild_manifest(self, month):
+        # Crash between a data append and its manifest write, or a missing/old manifest
+        try:
+            rows, lines, good = self.read_partition(month)
+            path = self.data_path(month)
+            if good < os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(good)
+            if not rows:
+                self.remove_partition(month)
+                return None
+            manifest = self.new_manifest(month)
+            for expense in rows:
+                self.manifest_add(manifest, expense)
+            manifest["lines"] = lines
+            manifest["bytes"] = good
+            self.write_manifest(manifest)
+            return manifest
+        except Exception as e:
+            print("Error rebuilding partition manifest:", e)
+            return None
+
+    def remove_partition(self, month):
+        for path in (self.data_path(month), self.manifest_path(month)):
+            if os.path.exists(path):
+                os.remove(path)
+        self.manifests.pop(month, None)
+        self.cache.pop(month, None)
+
+    def rewrite_partition(self, month, rows):
+        # Folds patches and tombstones back into plain rows
+        path = self.data_path(month)
+        with atomic_open(path) as f:
+            f.writelines(self.line(expense) for expense in rows)
+        manifest = self.manifests[month]
+        manifest["epoch"] = os.urandom(8).hex()
+        manifest["lines"] = len(rows)
+        manifest["bytes"] = os.path.getsize(path)
+
+    def read_ops(self, month, start):
+        # Complete lines of a partition from byte offset start on, as ops
+        ops = []
+        with open(self.data_path(month), "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                expense_id = record.pop("seq")
+                op = record.pop("op", None)
+                if op == "delete":
+                    ops.append({"op": "delete", "id": expense_id})
+                else:
+                    record["id"] = expense_id
+                    ops.append({"op": op or "add", "expense": record})
+        return ops
+
+    def catch_up(self):
+        # Reads what other processes wrote since this one last read or wrote:
+        # lines appended to a partition are applied to its cached rows and kept
+        # in self.foreign, and its manifest is taken from disk. A partition
+        # they rewrote or removed, or one whose manifest is out of step after
+        # a crash, can't be itemised, which sets self.foreign to None.
+        # Call with the file lock held.
+        with self.lock:
+            counter = self.read_counter()
+            if counter == self.seen:
+                return
+            self.seen = counter
+            for month in sorted(set(self.disk_months()) | set(self.manifests)):
+                manifest = self.manifests.get(month)
+                disk = self.read_manifest(month)
+                if disk is not None and manifest is not None and disk["epoch"] == manifest["epoch"]:
+                    if disk["bytes"] == manifest["bytes"]:
+                        continue
+                    ops = self.read_ops(month, manifest["bytes"])
+                elif disk is not None and manifest is None:
+                    # New since we last looked, so every line in it is news
+                    ops = self.read_ops(month, 0)
+                else:
+                    ops = None
+                if ops is None:
+                    self.cache.pop(month, None)
+                    self.foreign = None
+                    self.index = None
+                else:
+                    rows = self.cache.get(month)
+                    if rows is not None:
+                        for op in ops:
+                            self.apply(rows, op)
+                    if self.foreign is not None:
+                        self.foreign.extend(ops)
+                    # Only adds can go into the index without the rows they replace
+                    if self.index is not None and all(op["op"] == "add" for op in ops):
+                        for op in ops:
+                            self.index.add(op["expense"])
+                    else:
+                        self.index = None
+                if disk is not None:
+                    self.manifests[month] = disk
+                elif os.path.exists(self.data_path(month)):
+                    self.refresh_manifest(month)
+                else:
+                    self.manifests.pop(month, None)
+
+    @staticmethod
+    def apply(rows, op):
+        if op["op"] == "add":
+            rows.insert(id_position(rows, op["expense"]["id"]), op["expense"])
+            return
+        expense_id = op["id"] if op["op"] == "delete" else op["expense"]["id"]
+        for i, row in enumerate(rows):
+            if row["id"] == expense_id:
+                if op["op"] == "delete":
+                    del rows[i]
+                else:
+                    rows[i] = op["expense"]
+                return
+
+    def changes(self):
+        # Ops other processes wrote since the last call, or None if a partition
+        # changed in a way that needs everything derived from it rebuilt
+        with self.file_lock:
+            self.catch_up()
+            with self.lock:
+                foreign, self.foreign = self.foreign, []
+                return foreign
+
+    def partition(self, month):
+        # Rows of one month, kept in a small LRU cache
+        with self.lock:
+            if month in self.cache:
+                self.cache.move_to_end(month)
+                return self.cache[month]
+            rows, lines, good = self.read_partition(month)
+            self.cache[month] = rows
+            while len(self.cache) > 1 and sum(map(len, self.cache.values())) > self.CACHE_ROWS:
+                self.cache.popitem(last=False)
+            return rows
+
+    def months(self, low=None, high=None, categories=None, min_amount=None, max_amount=None):
+        # Months in order, skipping partitions whose manifest rules them out
+        with self.lock:
+            selected = []
+            for month in sorted(self.manifests):
+                manifest = self.manifests[month]
+                if low is not None and month < low[:7]:
+                    continue
+                if high is not None and month > high[:7]:
+                    continue
+                if categories and not any(c in manifest["categories"] for c in categories):
+                    continue
+                if min_amount is not None and manifest["max"] < min_amount:
+                    continue
+                if max_amount is not None and manifest["min"] > max_amount:
+                    continue
+                selected.append(month)
+            return selected
+
+    def month_of(self, expense_id):
+        for month, manifest in self.manifests.items():
+            if self.run_find(manifest["ids"], expense_id) is not None:
+                return month
+        return None
+
+    def locate(self, expense_id):
+        # (month, rows, index) of an expense, or None
+        month = self.month_of(expense_id)
+        if month is None:
+            return None
+        rows = self.partition(month)
+        for i, expense in enumerate(rows):
+            if expense["id"] == expense_id:
+                return month, rows, i
+        return None
+
+    def load(self):
+        return []
+
+    def all(self):
+        return list(self.iter_all())
+
+    def iter_all(self, start=None, end=None, categories=None):
+        low, high = date_bounds(start, end)
+        for month in self.months(low, high, categories):
+            yield from filter_expenses(list(self.partition(month)), start, end, categories)
+
+    def save(self, expenses):
+        # Rewrites every partition; expenses may be any iterable, so huge sets stream
+        with self.file_lock, self.lock:
+            self.bump_counter()
+            for month in list(self.manifests):
+                self.remove_partition(month)
+            self.cache.clear()
+            self.index = None
+            files = {}
+            next_id = 1
+            try:
+                for expense in expenses:
+                    expense = dict(expense, id=expense.get("id") or next_id)
+                    next_id = expense["id"] + 1
+                    month = expense["date"][:7]
+                    if month not in files:
+                        files[month] = open(self.data_path(month), "a")
+                        self.manifests[month] = self.new_manifest(month)
+                    files[month].write(self.line(expense))
+                    self.manifests[month]["lines"] += 1
+                    self.manifest_add(self.manifests[month], expense)
+            finally:
+                for f in files.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+            for month, manifest in self.manifests.items():
+                manifest["bytes"] = os.path.getsize(self.data_path(month))
+                self.write_manifest(manifest)
+
+    def needs_snapshot(self):
+        return False
+
+    def change_token(self):
+        # The shared counter as of this process's last read or write
+        with self.lock:
+            if self.foreign != []:
+                return None
+            return self.seen
+
+    def commit(self, ops, snapshot=None):
+        # Consecutive adds are grouped per month: one append and one manifest write each
+        with self.file_lock, self.lock:
+            self.catch_up()
+            self.bump_counter()
+            batch = {}
+            for op in ops:
+                if op["op"] == "add":
+                    batch.setdefault(op["expense"]["date"][:7], []).append(op["expense"])
+                    continue
+                self.append(batch)
+                batch = {}
+                if op["op"] == "delete":
+                    self.delete(op["id"])
+                elif op["op"] == "update":
+                    self.update(op["expense"])
+            self.append(batch)
+
+    @instrumented("partitioned.write", lambda written, self, month, lines: (len(lines), written))
+    def write_lines(self, month, lines):
+        manifest = self.manifests[month]
+        data = "".join(lines).encode()
+        with open(self.data_path(month), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            manifest["bytes"] = f.tell()
+        manifest["lines"] += len(lines)
+        return len(data)
+
+    def append(self, batch):
+        for month, expenses in batch.items():
+            if month not in self.manifests:
+                self.manifests[month] = self.new_manifest(month)
+            self.write_lines(month, [self.line(expense) for expense in expenses])
+            manifest = self.manifests[month]
+            for expense in expenses:
+                self.manifest_add(manifest, expense)
+                if self.index is not None:
+                    self.index.add(expense)
+            self.write_manifest(manifest)
+            if month in self.cache:
+                rows = self.cache[month]
+                for expense in expenses:
+                    rows.insert(id_position(rows, expense["id"]), expense)
+
+    def delete(self, expense_id):
+        # Appends a tombstone to the expense's partition; returns the removed expense
+        with self.lock:
+            found = self.locate(expense_id)
+            if found is None:
+                return None
+            month, rows, i = found
+            removed = rows.pop(i)
+            if self.index is not None:
+                self.index.remove(removed)
+            if not rows:
+                self.remove_partition(month)
+                return removed
+            manifest = self.manifests[month]
+            self.manifest_remove(manifest, removed, rows)
+            self.write_lines(month, [self.line(removed, "delete")])
+            if manifest["lines"] > 2 * manifest["count"] + 100:
+                self.rewrite_partition(month, rows)
+            self.write_manifest(manifest)
+            return removed
+
+    def update(self, expense):
+        # Same month: a patch line in place. New month: tombstone here, row there.
+        with self.lock:
+            found = self.locate(expense["id"])
+            if found is None:
+                return None
+            month, rows, i = found
+            old = rows[i]
+            if expense["date"][:7] != month:
+                self.delete(expense["id"])
+                self.append({expense["date"][:7]: [expense]})
+                return old
+            rows[i] = expense
+            if self.index is not None:
+                self.index.remove(old)
+                self.index.add(expense)
+            manifest = self.manifests[month]
+            manifest["total"] += expense["amount"] - old["amount"]
+            ExpenseAggregates.bump(manifest["categories"], old["category"], -old["amount"], -1)
+            ExpenseAggregates.bump(manifest["categories"], expense["category"], expense["amount"], 1)
+            self.bump_day(manifest, old, -1)
+            self.bump_day(manifest, expense, 1)
+            manifest["min"] = min(manifest["min"], expense["amount"])
+            manifest["max"] = max(manifest["max"], expense["amount"])
+            if expense["id"] == manifest["seq"]:
+                manifest["last"] = expense
+            self.write_lines(month, [self.line(expense, "update")])
+            if manifest["lines"] > 2 * manifest["count"] + 100:
+                self.rewrite_partition(month, rows)
+            self.write_manifest(manifest)
+            return old
+
+    def get(self, expense_id):
+        with self.lock:
+            found = self.locate(expense_id)
+            return found[1][found[2]] if found else None
+
+    def count(self):
+        with self.lock:
+            return sum(m["count"] for m in self.manifests.values())
+
+    def last(self, skip=()):
+        skip = set(skip)
+        with self.lock:
+            best = None
+            for manifest in sorted(self.manifests.values(), key=lambda m: m["seq"], reverse=True):
+                if best is not None and manifest["seq"] < best["id"]:
+                    break
+                if manifest["last"] is None or manifest["last"]["id"] not in skip:
+                    row = manifest["last"]
+                else:
+                    rows = [row for row in self.partition(manifest["month"]) if row["id"] not in skip]
+                    row = rows[-1] if rows else None
+                if row is not None and (best is None or row["id"] > best["id"]):
+                    best = row
+            return best
+
+    @staticmethod
+    def list_key(expense):
+        # Month by month, in ID order within a month
+        return expense["date"][:7], expense["id"]
+
+    def merge_ids(self, ids, rows):
+        groups = self.group_ids(ids)
+        for row in rows:
+            groups.setdefault(row["date"][:7], set()).add(row["id"])
+        return [expense_id for month in sorted(groups) for expense_id in sorted(groups[month])]
+
+    def category_groups(self):
+        with self.lock:
+            groups = {}
+            for month in sorted(self.manifests):
+                for category, (n, total) in self.manifests[month]["categories"].items():
+                    ExpenseAggregates.bump(groups, category, total, n)
+            return groups
+
+    def month_groups(self):
+        with self.lock:
+            return {month: [self.manifests[month]["count"], self.manifests[month]["total"]]
+                    for month in sorted(self.manifests)}
+
+    def day_groups(self):
+        with self.lock:
+            groups = {}
+            for manifest in self.manifests.values():
+                for category, days in manifest["days"].items():
+                    for date, (n, total) in days.items():
+                        key = (category, ExpenseAnalytics.day(date))
+                        groups[key] = groups.get(key, 0.0) + total
+            return groups
+
+    @instrumented("partitioned.query", lambda ids, *args, **kwargs: (len(ids), None))
+    def query(self, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+        # Matching IDs in list order (month by month); the first query reads
+        # every partition to build the index
+        with self.lock:
+            if self.index is None:
+                self.index = ExpenseIndex.build(self.iter_all())
+            ids = self.index.search(self.rows_by_id, start, end, categories, min_amount, max_amount, text, intersect=True)
+            return self.merge_ids(ids, ())
+
+    def group_ids(self, ids):
+        # {month: set of IDs}, from the manifests' ID runs
+        with self.lock:
+            if self.id_runs is None or self.id_runs[0] != self.seen:
+                runs = sorted((first, last, month) for month, manifest in self.manifests.items()
+                              for first, last in manifest["ids"])
+                self.id_runs = (self.seen, [run[0] for run in runs], runs)
+            seen, firsts, runs = self.id_runs
+        groups = {}
+        for expense_id in ids:
+            i = bisect_right(firsts, expense_id) - 1
+            if i >= 0 and runs[i][1] >= expense_id:
+                groups.setdefault(runs[i][2], set()).add(expense_id)
+        return groups
+
+    def rows_by_id(self, ids):
+        # Rows in the order of ids; each partition involved is read once
+        with self.lock:
+            found = {}
+            for month, wanted in self.group_ids(ids).items():
+                for row in self.partition(month):
+                    if row["id"] in wanted:
+                        found[row["id"]] = row
+            return [found[expense_id] for expense_id in ids if expense_id in found]
+
+    def rows(self, start, stop):
+        # Finds the partitions covering [start, stop) from the manifest counts alone
+        with self.lock:
+            rows, offset = [], 0
+            for month in sorted(self.manifests):
+                n = self.manifests[month]["count"]
+                if offset + n > start and offset < stop:
+                    rows.extend(self.partition(month)[max(0, start - offset):stop - offset])
+                offset += n
+                if offset >= stop:
+                    break
+            return rows
+
+    def close(self):
+        self.cache.clear()
+        self.index = None
+
+class BinaryBackend:
+    # The record file is a versioned header followed by one fixed-width record
+    # per expense: ID, epoch seconds, amount, description offset and length in
+    # the string heap, category code and flags. Descriptions live in the heap
+    # file and category names in a small JSON table. All three are named after
+    # their generation, and expenses.bin only names the current one: a rewrite
+    # writes a new generation and then replaces expenses.bin, which nobody keeps
+    # open, so it works on Windows while other instances have the old files
+    # mapped. Those are removed once nothing holds them. Opening reads only the header; rows, queries and summaries
+    # read the files through mmap, and with NumPy the summaries run over the
+    # mapped columns without building a row per expense. Records stay in ID
+    # order: an edit overwrites its record in place, a delete sets a tombstone
+    # flag, and the files are rewritten once dead records or dead description
+    # bytes outnumber the live ones. The header also counts changes, so other
+    # processes can tell plain appends (which they read as new rows) from edits.
+    name = "binary"
+    in_memory = False
+    incremental = True
+    appends_in_order = True
+    MAGIC = b"BBEX"
+    VERSION = 1
+    # magic, version, record size, generation, records (tombstones included), live records, dead heap bytes,
+    # changes (records written plus edits, deletes and restores; zero padding in files from before it existed)
+    HEADER = struct.Struct("<4sHHIQQQQ")
+    HEADER_SIZE = 64
+    RECORD = struct.Struct("<qqdQIHH")
+    RECORD_ID = struct.Struct("<q")
+    DELETED = 1
+    DATE_ONLY = 2
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, storage):
+        self.path = storage.binary_file
+        self.dir = os.path.dirname(self.path)
+        self.file_lock = storage.lock
+        self.lock = threading.RLock()
+        self.change_count = 0
+        # Ops other processes wrote that the tracker hasn't taken yet (see changes)
+        self.foreign = []
+        self.file = self.heap = None
+        self.map = self.heap_map = None
+        # Positions of live records, for paging; rebuilt after any change
+        self.live_positions = None
+        self.days = {}
+        if not os.path.exists(self.path):
+            self.write_generation(1, [])
+        self.open()
+
+    @classmethod
+    def dtype(cls):
+        np = load_numpy()
+        return np.dtype([("id", "<i8"), ("seconds", "<i8"), ("amount", "<f8"), ("offset", "<u8"),
+                         ("length", "<u4"), ("category", "<u2"), ("flags", "<u2")])
+
+    def heap_path(self, generation):
+        return os.path.join(self.dir, f"expenses.{generation}.heap")
+
+    def categories_path(self, generation):
+        return os.path.join(self.dir, f"expenses.{generation}.categories.json")
+
+    def data_path(self, generation):
+        return os.path.join(self.dir, f"expenses.{generation}.bin")
+
+    def current_generation(self):
+        # Read with the file lock held, so a rewrite never replaces it while it is open
+        with open(self.path, "rb") as f:
+            data = f.read(self.HEADER_SIZE)
+        if data[:4] == self.MAGIC:
+            return self.adopt(self.HEADER.unpack_from(data)[3])
+        try:
+            return json.loads(data)["generation"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"{self.path} is damaged ({e})") from e
+
+    def adopt(self, generation):
+        # expenses.bin from before generations had their own record file held
+        # the records itself: copied to its generation's name, then replaced
+        # by the pointer, so a crash part way leaves it as it was
+        path = self.data_path(generation)
+        shutil.copyfile(self.path, path)
+        with open(path, "r+b") as f:
+            os.fsync(f.fileno())
+        self.write_pointer(generation)
+        return generation
+
+    def next_generation(self):
+        # Numbered from expenses.bin rather than self.generation, which may be
+        # behind another process's rewrite
+        return self.current_generation() + 1 if os.path.exists(self.path) else 1
+
+    def write_pointer(self, generation):
+        with atomic_open(self.path) as f:
+            json.dump({"generation": generation}, f)
+
+    def remove_old_generations(self):
+        # Files of every other generation; one still mapped by another process
+        # can't be removed on Windows and goes on a later rewrite
+        for name in os.listdir(self.dir):
+            parts = name.split(".")
+            if (len(parts) >= 3 and parts[0] == "expenses" and parts[1].isdigit()
+                    and int(parts[1]) != self.generation and name.endswith((".bin", ".heap", ".categories.json"))):
+                try:
+                    os.remove(os.path.join(self.dir, name))
+                except OSError:
+                    pass
+
+    @instrumented("binary.open", lambda _, self: (self.live, file_size(self.data_path(self.generation),
+                                                                       self.heap_path(self.generation))))
+    def open(self):
+        generation = self.current_generation()
+        path = self.data_path(generation)
+        self.file = open(path, "r+b")
+        header = self.file.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, version, record_size, self.generation, self.records, self.live, self.dead, self.change_count = \
+            self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a binary expense file")
+        if version > self.VERSION or record_size != self.RECORD.size:
+            raise ValueError(f"{path} has unsupported format version {version}")
+        self.read_categories()
+        self.heap = open(self.heap_path(self.generation), "r+b")
+        self.heap_size = self.heap.seek(0, os.SEEK_END)
+        # Records past the header's count are a commit torn by a crash
+        end = self.HEADER_SIZE + self.records * self.RECORD.size
+        if os.path.getsize(path) > end:
+            self.file.truncate(end)
+        self.max_id = self.record(self.records - 1)[0] if self.records else 0
+
+    def read_categories(self):
+        with open(self.categories_path(self.generation), "r") as f:
+            self.categories = json.load(f)
+        self.category_codes = {name: code for code, name in enumerate(self.categories)}
+
+    def write_header(self):
+        # Records and descriptions reach the disk before the header that counts them
+        os.fsync(self.heap.fileno())
+        os.fsync(self.file.fileno())
+        self.file.seek(0)
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size, self.generation, self.records,
+                                         self.live, self.dead, self.change_count).ljust(self.HEADER_SIZE, b"\0"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def catch_up(self):
+        # Reads what other processes wrote since this one last read or wrote:
+        # records they appended become "add" ops in self.foreign, while edits,
+        # deletes and rewrites set it to None. Call with the file lock held.
+        with self.lock:
+            if self.current_generation() != self.generation:
+                # Rewritten into a new generation
+                self.release()
+                self.open()
+                self.foreign = None
+                return
+            self.ensure_maps()
+            records, live, dead, change_count = self.HEADER.unpack_from(self.map)[4:]
+            if change_count == self.change_count:
+                return
+            # Plain appends move the change count by exactly the records they add
+            appends_only = change_count - self.change_count == records - self.records
+            first = self.records
+            self.records, self.live, self.dead, self.change_count = records, live, dead, change_count
+            self.heap_size = self.heap.seek(0, os.SEEK_END)
+            self.read_categories()
+            self.max_id = self.record(self.records - 1)[0] if self.records else 0
+            self.live_positions = None
+            if not appends_only:
+                self.foreign = None
+            elif self.foreign is not None:
+                self.ensure_maps()
+                self.foreign.extend({"op": "add", "expense": self.row(self.record(position))}
+                                    for position in range(first, records))
+
+    def changes(self):
+        # Rows other processes appended since the last call, or None if they
+        # also edited, deleted or rewrote, which needs everything derived rebuilt
+        with self.file_lock:
+            self.catch_up()
+            with self.lock:
+                foreign, self.foreign = self.foreign, []
+                return foreign
+
+    def release(self):
+        # Views handed out earlier keep their own mapping alive until they are dropped
+        self.map = self.heap_map = None
+        self.live_positions = None
+        for f in (self.file, self.heap):
+            if f is not None:
+                f.close()
+        self.file = self.heap = None
+
+    def ensure_maps(self):
+        if self.map is None or len(self.map) < self.HEADER_SIZE + self.records * self.RECORD.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.heap_size and (self.heap_map is None or len(self.heap_map) < self.heap_size):
+            self.heap_map = mmap.mmap(self.heap.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def columns(self):
+        # Structured NumPy view straight over the mapped records, or None without NumPy
+        np = load_numpy()
+        if np is None:
+            return None
+        self.ensure_maps()
+        return np.frombuffer(self.map, dtype=self.dtype(), count=self.records, offset=self.HEADER_SIZE)
+
+    def record(self, position):
+        self.ensure_maps()
+        return self.RECORD.unpack_from(self.map, self.HEADER_SIZE + position * self.RECORD.size)
+
+    def iter_records(self):
+        self.ensure_maps()
+        end = self.HEADER_SIZE + self.records * self.RECORD.size
+        return self.RECORD.iter_unpack(memoryview(self.map)[self.HEADER_SIZE:end])
+
+    def description(self, offset, length):
+        return self.heap_map[offset:offset + length].decode("utf-8") if length else ""
+
+    def date(self, seconds, flags):
+        # Day strings are cached; strftime per row would dominate exports
+        day, seconds = divmod(seconds, 86400)
+        prefix = self.days.get(day)
+        if prefix is None:
+            prefix = self.days[day] = (self.EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+        if flags & self.DATE_ONLY:
+            return prefix
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{prefix} {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def row(self, record):
+        expense_id, seconds, amount, offset, length, category, flags = record
+        return {"id": expense_id, "date": self.date(seconds, flags), "description": self.description(offset, length),
+                "amount": amount, "category": self.categories[category]}
+
+    def seconds(self, date):
+        # Dates are stored to the second; plain "YYYY-MM-DD" dates come back as they went in
+        if len(date) == 10:
+            return (datetime.strptime(date, "%Y-%m-%d") - self.EPOCH) // timedelta(seconds=1), self.DATE_ONLY
+        return (datetime.fromisoformat(date) - self.EPOCH) // timedelta(seconds=1), 0
+
+    def position(self, expense_id):
+        # Records are in ID order, so this is a bisection over the mapped ID field
+        self.ensure_maps()
+        lo, hi = 0, self.records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.RECORD_ID.unpack_from(self.map, self.HEADER_SIZE + mid * self.RECORD.size)[0] < expense_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.records and self.record(lo)[0] == expense_id:
+            return lo
+        return None
+
+    @staticmethod
+    def category_code(name, categories, codes):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(categories)
+            categories.append(name)
+        return code
+
+    def pack(self, expense, offset, categories, codes):
+        seconds, flags = self.seconds(expense["date"])
+        description = expense["description"].encode("utf-8")
+        record = self.RECORD.pack(expense["id"], seconds, float(expense["amount"]), offset, len(description),
+                                  self.category_code(expense["category"], categories, codes), flags)
+        return record, description
+
+    def write_categories(self, generation, categories):
+        with atomic_open(self.categories_path(generation)) as f:
+            json.dump(categories, f)
+
+    @instrumented("binary.rewrite", lambda _, self, generation, expenses: (self.live, file_size(self.data_path(generation))))
+    def write_generation(self, generation, expenses):
+        # Writes a complete new set of files; pointing expenses.bin at them is
+        # the switch-over, so a crash part way leaves the previous generation intact.
+        # Returns False if expenses turned out not to be in ID order.
+        categories, codes = [], {}
+        records = dead = offset = 0
+        in_order, last_id, next_id = True, 0, 1
+        with open(self.heap_path(generation), "wb") as heap, open(self.data_path(generation), "wb") as f:
+            f.write(b"\0" * self.HEADER_SIZE)
+            for expense in expenses:
+                if not expense.get("id"):
+                    expense = dict(expense, id=next_id)
+                in_order = in_order and expense["id"] > last_id
+                last_id = expense["id"]
+                next_id = max(next_id, last_id + 1)
+                record, description = self.pack(expense, offset, categories, codes)
+                f.write(record)
+                heap.write(description)
+                offset += len(description)
+                records += 1
+            self.write_categories(generation, categories)
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size, generation,
+                                     records, records, dead, self.change_count).ljust(self.HEADER_SIZE, b"\0"))
+            for done in (heap, f):
+                done.flush()
+                os.fsync(done.fileno())
+        self.release()
+        self.write_pointer(generation)
+        self.generation = generation
+        self.remove_old_generations()
+        self.live = records
+        return in_order
+
+    def load(self):
+        return []
+
+    def all(self):
+        return list(self.iter_all())
+
+    def live_rows(self):
+        # Every live row in ID order, read from the current files
+        with self.lock:
+            for record in list(self.iter_records()):
+                if not record[6] & self.DELETED:
+                    yield self.row(record)
+
+    def iter_all(self, start=None, end=None, categories=None, batch_size=5000):
+        # Matching IDs first, then rows a batch at a time so the lock is never held for long
+        ids = self.query(start, end, categories)
+        for i in range(0, len(ids), batch_size):
+            yield from self.rows_by_id(ids[i:i + batch_size])
+
+    def save(self, expenses):
+        # expenses may be any iterable, so huge sets stream; rows out of ID order are sorted in a second pass
+        with self.file_lock, self.lock:
+            generation = self.next_generation()
+            in_order = self.write_generation(generation, expenses)
+            self.open()
+            if not in_order:
+                rows = sorted(self.live_rows(), key=lambda row: row["id"])
+                self.write_generation(generation + 1, rows)
+                self.open()
+
+    def compact(self, extra=()):
+        # Drops tombstones and dead description bytes; extra are rows to merge in by ID
+        with self.file_lock, self.lock:
+            rows = self.live_rows()
+            if extra:
+                rows = heapq.merge(rows, sorted(extra, key=lambda row: row["id"]), key=lambda row: row["id"])
+            rows = list(rows)
+            self.write_generation(self.next_generation(), rows)
+            self.open()
+
+    def needs_snapshot(self):
+        return False
+
+    def change_token(self):
+        # Rewrites start a new generation; everything else moves the change count
+        with self.lock:
+            if self.foreign != []:
+                return None
+            return [self.generation, self.change_count]
+
+    @instrumented("binary.commit", lambda _, self, ops, snapshot=None: (len(ops), None))
+    def commit(self, ops, snapshot=None):
+        # Runs of adds with new IDs become one heap write and one record write;
+        # adds below IDs already on disk (undone deletes, or rows another
+        # process wrote first) go in together with one rewrite at the end
+        with self.file_lock, self.lock:
+            self.catch_up()
+            batch, late = [], {}
+            for op in ops:
+                if op["op"] == "add" and op["expense"]["id"] > max(self.max_id, batch[-1]["id"] if batch else 0):
+                    batch.append(op["expense"])
+                    continue
+                self.append(batch)
+                batch = []
+                if op["op"] == "add":
+                    if not self.restore(op["expense"]):
+                        late[op["expense"]["id"]] = op["expense"]
+                elif op["op"] == "update":
+                    if op["expense"]["id"] in late:
+                        late[op["expense"]["id"]] = op["expense"]
+                    else:
+                        self.update(op["expense"])
+                elif op["op"] == "delete":
+                    if late.pop(op["id"], None) is None:
+                        self.delete(op["id"])
+            self.append(batch)
+            self.write_header()
+            if late or self.records - self.live > self.live + 100 or self.dead > self.heap_size // 2 + 65536:
+                self.compact(list(late.values()))
+
+    def append(self, expenses):
+        if not expenses:
+            return
+        categories = len(self.categories)
+        records, descriptions = [], []
+        offset = self.heap_size
+        for expense in expenses:
+            record, description = self.pack(expense, offset, self.categories, self.category_codes)
+            records.append(record)
+            descriptions.append(description)
+            offset += len(description)
+        # Heap and category names first: a record must never point past either
+        self.heap.seek(self.heap_size)
+        self.heap.write(b"".join(descriptions))
+        self.heap.flush()
+        self.heap_size = offset
+        if len(self.categories) > categories:
+            self.write_categories(self.generation, self.categories)
+        self.file.seek(self.HEADER_SIZE + self.records * self.RECORD.size)
+        self.file.write(b"".join(records))
+        self.file.flush()
+        self.records += len(records)
+        self.live += len(records)
+        self.change_count += len(records)
+        self.max_id = expenses[-1]["id"]
+        self.live_positions = None
+
+    def overwrite(self, position, expense, old):
+        # Reuses the old description bytes when the text is unchanged
+        offset, length = old[3], old[4]
+        if self.description(offset, length) != expense["description"]:
+            self.dead += length
+            offset = self.heap_size
+        categories = len(self.categories)
+        record, description = self.pack(expense, offset, self.categories, self.category_codes)
+        if offset == self.heap_size and description:
+            self.heap.seek(offset)
+            self.heap.write(description)
+            self.heap.flush()
+            self.heap_size += len(description)
+        if len(self.categories) > categories:
+            self.write_categories(self.generation, self.categories)
+        self.file.seek(self.HEADER_SIZE + position * self.RECORD.size)
+        self.file.write(record)
+        self.file.flush()
+        self.change_count += 1
+
+    def update(self, expense):
+        position = self.position(expense["id"])
+        if position is None:
+            return
+        old = self.record(position)
+        if old[6] & self.DELETED:
+            return
+        self.overwrite(position, expense, old)
+
+    def delete(self, expense_id):
+        position = self.position(expense_id)
+        if position is None:
+            return
+        old = self.record(position)
+        if old[6] & self.DELETED:
+            return
+        self.file.seek(self.HEADER_SIZE + position * self.RECORD.size)
+        self.file.write(self.RECORD.pack(*old[:6], old[6] | self.DELETED))
+        self.file.flush()
+        self.change_count += 1
+        self.live -= 1
+        self.dead += old[4]
+        self.live_positions = None
+
+    def restore(self, expense):
+        # An undone delete: clears the tombstone if it is still there. Returns
+        # False when the row has no record, for commit to merge in by rewrite.
+        position = self.position(expense["id"])
+        if position is None:
+            return False
+        old = self.record(position)
+        if not old[6] & self.DELETED:
+            return True
+        self.dead -= old[4]
+        self.overwrite(position, expense, old)
+        self.live += 1
+        self.live_positions = None
+        return True
+
+    def get(self, expense_id):
+        with self.lock:
+            position = self.position(expense_id)
+            if position is None:
+                return None
+            record = self.record(position)
+            return None if record[6] & self.DELETED else self.row(record)
+
+    def count(self):
+        return self.live
+
+    def last(self, skip=()):
+        skip = set(skip)
+        with self.lock:
+            for position in range(self.records - 1, -1, -1):
+                record = self.record(position)
+                if not record[6] & self.DELETED and record[0] not in skip:
+                    return self.row(record)
+            return None
+
+    @staticmethod
+    def list_key(expense):
+        return expense["id"]
+
+    @staticmethod
+    def merge_ids(ids, rows):
+        return list(heapq.merge(ids, sorted(row["id"] for row in rows)))
+
+    def category_groups(self):
+        with self.lock:
+            if not self.live:
+                return {}
+            cols = self.columns()
+            if cols is not None:
+                np = load_numpy()
+                live = (cols["flags"] & self.DELETED) == 0
+                codes = cols["category"][live]
+                counts = np.bincount(codes, minlength=len(self.categories))
+                totals = np.bincount(codes, weights=cols["amount"][live], minlength=len(self.categories))
+                return {self.categories[c]: [int(counts[c]), float(totals[c])] for c in np.flatnonzero(counts)}
+            groups = {}
+            for record in self.iter_records():
+                if not record[6] & self.DELETED:
+                    ExpenseAggregates.bump(groups, self.categories[record[5]], record[2], 1)
+            return groups
+
+    def month_groups(self):
+        with self.lock:
+            if not self.live:
+                return {}
+            cols = self.columns()
+            if cols is not None:
+                np = load_numpy()
+                live = (cols["flags"] & self.DELETED) == 0
+                months = cols["seconds"][live].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+                keys, inverse = np.unique(months, return_inverse=True)
+                counts = np.bincount(inverse)
+                totals = np.bincount(inverse, weights=cols["amount"][live])
+                pairs = zip(keys.tolist(), counts.tolist(), totals.tolist())
+                return {f"{1970 + m // 12:04d}-{m % 12 + 1:02d}": [n, total] for m, n, total in pairs}
+            groups = {}
+            for record in self.iter_records():
+                if not record[6] & self.DELETED:
+                    ExpenseAggregates.bump(groups, self.date(record[1], 0)[:7], record[2], 1)
+            return groups
+
+    def day_groups(self):
+        epoch = self.EPOCH.toordinal()
+        with self.lock:
+            if not self.live:
+                return {}
+            cols = self.columns()
+            if cols is not None:
+                live = cols[(cols["flags"] & self.DELETED) == 0]
+                return ExpenseAnalytics.group_columns(live["seconds"] // 86400 + epoch, live["category"],
+                                                      live["amount"], self.categories)
+            groups = {}
+            for record in self.iter_records():
+                if not record[6] & self.DELETED:
+                    key = (self.categories[record[5]], record[1] // 86400 + epoch)
+                    groups[key] = groups.get(key, 0.0) + record[2]
+            return groups
+
+    @instrumented("binary.query", lambda ids, *args, **kwargs: (len(ids), None))
+    def query(self, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+        # Matching IDs; every filter but the description words runs over the mapped columns
+        low, high = date_bounds(start, end)
+        low = self.seconds(low)[0] if low else None
+        high = self.seconds(high)[0] if high else None
+        words = sorted(tokenize(text or ""))
+        with self.lock:
+            codes = {self.category_codes[c] for c in categories or () if c in self.category_codes}
+            if categories and not codes:
+                return []
+            cols = self.columns()
+            if cols is not None:
+                np = load_numpy()
+                mask = (cols["flags"] & self.DELETED) == 0
+                if low is not None:
+                    mask &= cols["seconds"] >= low
+                if high is not None:
+                    mask &= cols["seconds"] < high
+                if codes:
+                    mask &= np.isin(cols["category"], list(codes))
+                if min_amount is not None:
+                    mask &= cols["amount"] >= min_amount
+                if max_amount is not None:
+                    mask &= cols["amount"] <= max_amount
+                matches = cols[mask]
+                if not words:
+                    return matches["id"].tolist()
+                candidates = zip(matches["id"].tolist(), matches["offset"].tolist(), matches["length"].tolist())
+            else:
+                candidates = []
+                for record in self.iter_records():
+                    expense_id, seconds, amount, offset, length, category, flags = record
+                    if flags & self.DELETED:
+                        continue
+                    if low is not None and seconds < low:
+                        continue
+                    if high is not None and seconds >= high:
+                        continue
+                    if codes and category not in codes:
+                        continue
+                    if min_amount is not None and amount < min_amount:
+                        continue
+                    if max_amount is not None and amount > max_amount:
+                        continue
+                    candidates.append((expense_id, offset, length))
+            # Descriptions repeat a lot, so each distinct one is matched once
+            ids, matched = [], {}
+            for expense_id, offset, length in candidates:
+                description = self.description(offset, length)
+                found = matched.get(description)
+                if found is None:
+                    tokens = tokenize(description)
+                    found = matched[description] = all(any(t.startswith(word) for t in tokens) for word in words)
+                if found:
+                    ids.append(expense_id)
+            return ids
+
+    def rows_by_id(self, ids):
+        # ids are sorted, so with NumPy every position comes from one searchsorted
+        with self.lock:
+            cols = self.columns()
+            if cols is not None:
+                positions = load_numpy().searchsorted(cols["id"], ids).tolist()
+            else:
+                positions = [self.position(expense_id) for expense_id in ids]
+            rows = []
+            for expense_id, position in zip(ids, positions):
+                if position is not None and position < self.records:
+                    record = self.record(position)
+                    if record[0] == expense_id and not record[6] & self.DELETED:
+                        rows.append(self.row(record))
+            return rows
+
+    @instrumented("binary.rows", lambda rows, *args: (len(rows), None))
+    def rows(self, start, stop):
+        with self.lock:
+            if self.records == self.live:
+                positions = range(start, min(stop, self.records))
+            else:
+                if self.live_positions is None:
+                    cols = self.columns()
+                    if cols is not None:
+                        self.live_positions = load_numpy().flatnonzero((cols["flags"] & self.DELETED) == 0)
+                    else:
+                        self.live_positions = [i for i, record in enumerate(self.iter_records())
+                                               if not record[6] & self.DELETED]
+                positions = self.live_positions[start:stop]
+            return [self.row(self.record(int(position))) for position in positions]
+
+    def close(self):
+        with self.lock:
+            self.release()
+
+BACKENDS = {backend.name: backend for backend in (JsonBackend, JournalBackend, SqliteBackend, PartitionedBackend,
+                                                BinaryBackend)}
+
+# ---------- Columnar Store ----------
+class ColumnarExpenses:
+    # Parallel typed arrays instead of one dict per row: dates as epoch seconds,
+    # categories and descriptions dictionary-encoded. Iterating still yields dict rows.
+    # Dates come back as they went in: plain "YYYY-MM-DD" dates are flagged (as in
+    # BinaryBackend), and any other date the seconds don't reproduce is kept by ID.
+    EPOCH = datetime(1970, 1, 1)
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, expenses=()):
+        self.ids = array("q")
+        self.timestamps = array("q")
+        self.amounts = array("d")
+        self.category_codes = array("I")
+        self.description_codes = array("I")
+        self.date_only = array("B")
+        self.odd_dates = {}
+        self.categories = []
+        self.category_index = {}
+        self.descriptions = []
+        self.description_index = {}
+        for exp in expenses:
+            self.append(exp)
+
+    @staticmethod
+    def encode(value, table, index):
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(table)
+            table.append(value)
+        return code
+
+    def append(self, expense):
+        self.insert(len(self), expense)
+
+    def insert(self, i, expense):
+        date = expense["date"]
+        dt = datetime.fromisoformat(date)
+        date_only = len(date) == 10
+        if not date_only and dt.strftime(self.DATE_FORMAT) != date:
+            self.odd_dates[expense["id"]] = date
+        self.ids.insert(i, expense["id"])
+        self.timestamps.insert(i, int((dt - self.EPOCH).total_seconds()))
+        self.date_only.insert(i, date_only)
+        self.amounts.insert(i, float(expense["amount"]))
+        self.category_codes.insert(i, self.encode(expense["category"], self.categories, self.category_index))
+        self.description_codes.insert(i, self.encode(expense["description"], self.descriptions, self.description_index))
+
+    def __delitem__(self, i):
+        self.odd_dates.pop(self.ids[i], None)
+        for column in (self.ids, self.timestamps, self.amounts, self.category_codes, self.description_codes,
+                       self.date_only):
+            del column[i]
+
+    def __setitem__(self, i, expense):
+        del self[i]
+        self.insert(i, expense)
+
+    def pop(self):
+        expense = self.row(len(self) - 1)
+        del self[len(self) - 1]
+        return expense
+
+    def date(self, i):
+        date = self.odd_dates.get(self.ids[i]) if self.odd_dates else None
+        if date is None:
+            date = (self.EPOCH + timedelta(seconds=self.timestamps[i])).strftime(
+                "%Y-%m-%d" if self.date_only[i] else self.DATE_FORMAT)
+        return date
+
+    def row(self, i):
+        return {
+            "id": self.ids[i],
+            "date": self.date(i),
+            "description": self.descriptions[self.description_codes[i]],
+            "amount": self.amounts[i],
+            "category": self.categories[self.category_codes[i]]
+        }
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("expense index out of range")
+        return self.row(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def copy(self):
+        clone = ColumnarExpenses()
+        clone.ids = self.ids[:]
+        clone.timestamps = self.timestamps[:]
+        clone.amounts = self.amounts[:]
+        clone.category_codes = self.category_codes[:]
+        clone.description_codes = self.description_codes[:]
+        clone.date_only = self.date_only[:]
+        clone.odd_dates = dict(self.odd_dates)
+        clone.categories = list(self.categories)
+        clone.category_index = dict(self.category_index)
+        clone.descriptions = list(self.descriptions)
+        clone.description_index = dict(self.description_index)
+        return clone
+
+    def count(self):
+        return len(self)
+
+    def last(self):
+        return self.row(len(self) - 1) if len(self) else None
+
+    def month_numbers(self):
+        # Months since 1970-01 for every row
+        np = load_numpy()
+        if np is not None:
+            seconds = np.frombuffer(self.timestamps, dtype=np.int64)
+            return seconds.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        months = []
+        for ts in self.timestamps:
+            dt = self.EPOCH + timedelta(seconds=ts)
+            months.append((dt.year - 1970) * 12 + dt.month - 1)
+        return months
+
+    def category_groups(self):
+        if not len(self):
+            return {}
+        np = load_numpy()
+        if np is not None:
+            codes = np.frombuffer(self.category_codes, dtype=np.uint32)
+            amounts = np.frombuffer(self.amounts, dtype=np.float64)
+            counts = np.bincount(codes, minlength=len(self.categories))
+            totals = np.bincount(codes, weights=amounts, minlength=len(self.categories))
+            return {self.categories[c]: [int(counts[c]), float(totals[c])] for c in np.flatnonzero(counts)}
+        groups = {}
+        for code, amount in zip(self.category_codes, self.amounts):
+            ExpenseAggregates.bump(groups, self.categories[code], amount, 1)
+        return groups
+
+    def month_groups(self):
+        if not len(self):
+            return {}
+        months = self.month_numbers()
+        np = load_numpy()
+        if np is not None:
+            keys, inverse = np.unique(months, return_inverse=True)
+            counts = np.bincount(inverse)
+            totals = np.bincount(inverse, weights=np.frombuffer(self.amounts, dtype=np.float64))
+            pairs = zip(keys.tolist(), counts.tolist(), totals.tolist())
+            return {f"{1970 + m // 12:04d}-{m % 12 + 1:02d}": [n, total] for m, n, total in pairs}
+        groups = {}
+        for m, amount in zip(months, self.amounts):
+            ExpenseAggregates.bump(groups, f"{1970 + m // 12:04d}-{m % 12 + 1:02d}", amount, 1)
+        return groups
+
+    def day_groups(self):
+        if not len(self):
+            return {}
+        epoch = self.EPOCH.toordinal()
+        np = load_numpy()
+        if np is not None:
+            days = np.frombuffer(self.timestamps, dtype=np.int64) // 86400 + epoch
+            return ExpenseAnalytics.group_columns(days, np.frombuffer(self.category_codes, dtype=np.uint32),
+                                                  np.frombuffer(self.amounts, dtype=np.float64), self.categories)
+        groups = {}
+        for ts, code, amount in zip(self.timestamps, self.category_codes, self.amounts):
+            key = (self.categories[code], ts // 86400 + epoch)
+            groups[key] = groups.get(key, 0.0) + amount
+        return groups
+
+# ---------- Aggregates ----------
+class ExpenseAggregates:
+    # Per-category and per-month [row count, total], kept in step with every add
+    # and delete, plus each month's total per category for the budget checks
+    def __init__(self):
+        self.count = 0
+        # Signature of the last row, filled in by the tracker when the cache is written
+        self.last = None
+        # The backend's change_token() for the data these totals describe
+        self.token = None
+        self.categories = {}
+        self.months = {}
+        self.category_months = {}
+
+    @staticmethod
+    def signature(expense):
+        if expense is None:
+            return None
+        return [expense["date"], expense["description"], expense["amount"], expense["category"]]
+
+    @staticmethod
+    def bump(groups, key, amount, rows):
+        group = groups.setdefault(key, [0, 0.0])
+        group[0] += rows
+        group[1] += amount
+        if group[0] <= 0:
+            del groups[key]
+
+    def bump_category_month(self, expense, amount):
+        totals = self.category_months.setdefault(expense["date"][:7], {})
+        totals[expense["category"]] = totals.get(expense["category"], 0.0) + amount
+
+    def add(self, expense):
+        self.count += 1
+        self.bump(self.categories, expense["category"], expense["amount"], 1)
+        self.bump(self.months, expense["date"][:7], expense["amount"], 1)
+        self.bump_category_month(expense, expense["amount"])
+
+    def replace(self, old, new):
+        self.bump(self.categories, old["category"], -old["amount"], -1)
+        self.bump(self.months, old["date"][:7], -old["amount"], -1)
+        self.bump_category_month(old, -old["amount"])
+        self.bump(self.categories, new["category"], new["amount"], 1)
+        self.bump(self.months, new["date"][:7], new["amount"], 1)
+        self.bump_category_month(new, new["amount"])
+
+    def remove(self, expense):
+        self.count -= 1
+        self.bump(self.categories, expense["category"], -expense["amount"], -1)
+        self.bump(self.months, expense["date"][:7], -expense["amount"], -1)
+        self.bump_category_month(expense, -expense["amount"])
+
+    def category_month(self, category, month):
+        # Total spent in category during month ("YYYY-MM")
+        return self.category_months.get(month, {}).get(category, 0.0)
+
+    def matches(self, count, last, token):
+        # The token changes with every write, so an edit to an older row is caught too
+        return self.token is not None and self.token == token and self.count == count and self.last == self.signature(last)
+
+    def summary_by_category(self):
+        return {cat: total for cat, (n, total) in self.categories.items()}
+
+    def monthly_summary(self):
+        return {month: total for month, (n, total) in self.months.items()}
+
+    @classmethod
+    def from_expenses(cls, expenses):
+        if isinstance(expenses, ColumnarExpenses):
+            return cls.from_groups(expenses)
+        aggregates, last = cls(), None
+        for exp in expenses:
+            aggregates.add(exp)
+            last = exp
+        aggregates.last = cls.signature(last)
+        return aggregates
+
+    @classmethod
+    def from_groups(cls, source):
+        # source is a backend or store that can group rows itself (SQL or NumPy)
+        aggregates = cls()
+        aggregates.count = source.count()
+        aggregates.last = cls.signature(source.last())
+        aggregates.categories = source.category_groups()
+        aggregates.months = source.month_groups()
+        for (category, day), total in source.day_groups().items():
+            month = datetime.fromordinal(day).strftime("%Y-%m")
+            totals = aggregates.category_months.setdefault(month, {})
+            totals[category] = totals.get(category, 0.0) + total
+        return aggregates
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        # Written before the per-category month totals were kept
+        if "category_months" not in data:
+            return None
+        aggregates = cls()
+        aggregates.count = data["count"]
+        aggregates.last = data["last"]
+        aggregates.token = data.get("token")
+        aggregates.categories = data["categories"]
+        aggregates.months = data["months"]
+        aggregates.category_months = data["category_months"]
+        return aggregates
+
+    def copy(self):
+        clone = ExpenseAggregates()
+        clone.count = self.count
+        clone.last = self.last
+        clone.token = self.token
+        clone.categories = {k: list(v) for k, v in self.categories.items()}
+        clone.months = {k: list(v) for k, v in self.months.items()}
+        clone.category_months = {k: dict(v) for k, v in self.category_months.items()}
+        return clone
+
+    def save(self, path):
+        # A cache, checked against the data on load, so it isn't synced
+        with atomic_open(path, durable=False) as f:
+            json.dump({"count": self.count, "last": self.last, "token": self.token, "categories": self.categories,
+                       "months": self.months, "category_months": self.category_months}, f)
+
+# ---------- Analytics ----------
+class DayTotals:
+    # Spend per day (date ordinal) in a Fenwick tree: a prefix-sum array that
+    # also takes point updates, so adding or removing an expense and summing
+    # any range of days are both O(log n). The tree covers a range of days with
+    # room to spare and is rebuilt from the day totals when a day falls outside.
+    def __init__(self, days=None):
+        self.days = days or {}
+        self.first = 0
+        self.tree = [0.0]
+        if self.days:
+            self.rebuild()
+
+    def rebuild(self):
+        # Spare room mostly after the last day: new expenses are usually today's
+        low, high = min(self.days), max(self.days)
+        self.first = low - 31
+        size = 2 * (high - self.first + 1) + 366
+        tree = [0.0] * (size + 1)
+        for day, total in self.days.items():
+            tree[day - self.first + 1] += total
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, day, amount):
+        total = self.days.get(day, 0.0) + amount
+        if abs(total) < 1e-9:
+            self.days.pop(day, None)
+        else:
+            self.days[day] = total
+        i = day - self.first + 1
+        if not 0 < i < len(self.tree):
+            if self.days:
+                self.rebuild()
+            return
+        while i < len(self.tree):
+            self.tree[i] += amount
+            i += i & -i
+
+    def prefix(self, day):
+        # Total of every day up to and including day
+        i = min(day - self.first + 1, len(self.tree) - 1)
+        total = 0.0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self, first, last):
+        return self.prefix(last) - self.prefix(first - 1)
+
+
+class ExpenseAnalytics:
+    # Day totals overall and per category, kept in step with every change.
+    # Window totals, rolling series and month-end projections all read them.
+    def __init__(self):
+        self.overall = DayTotals()
+        self.categories = {}
+
+    @staticmethod
+    def day(date):
+        return datetime.fromisoformat(date[:10]).toordinal()
+
+    @staticmethod
+    def month_bounds(day):
+        # First and last day of the month holding day
+        first = datetime.fromordinal(day).replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        return first.toordinal(), following.toordinal() - 1
+
+    @classmethod
+    def from_groups(cls, groups):
+        # groups maps (category, day) to that day's total
+        analytics = cls()
+        overall, categories = {}, {}
+        for (category, day), total in groups.items():
+            overall[day] = overall.get(day, 0.0) + total
+            days = categories.setdefault(category, {})
+            days[day] = days.get(day, 0.0) + total
+        analytics.overall = DayTotals(overall)
+        analytics.categories = {category: DayTotals(days) for category, days in categories.items()}
+        return analytics
+
+    @classmethod
+    def from_expenses(cls, expenses):
+        if isinstance(expenses, ColumnarExpenses):
+            return cls.from_groups(expenses.day_groups())
+        groups = {}
+        for exp in expenses:
+            key = (exp["category"], cls.day(exp["date"]))
+            groups[key] = groups.get(key, 0.0) + exp["amount"]
+        return cls.from_groups(groups)
+
+    @staticmethod
+    def group_columns(days, codes, amounts, categories):
+        # NumPy group-by on (category code, day) for the columnar stores
+        np = load_numpy()
+        keys, inverse = np.unique(codes.astype(np.int64) * (1 << 32) + days, return_inverse=True)
+        totals = np.bincount(inverse, weights=amounts)
+        return {(categories[key >> 32], key & 0xFFFFFFFF): total
+                for key, total in zip(keys.tolist(), totals.tolist())}
+
+    def add(self, expense, sign=1):
+        day = self.day(expense["date"])
+        amount = sign * expense["amount"]
+        self.overall.add(day, amount)
+        self.categories.setdefault(expense["category"], DayTotals()).add(day, amount)
+
+    def remove(self, expense):
+        self.add(expense, -1)
+
+    def totals(self, category=None):
+        if category is None:
+            return self.overall
+        return self.categories.get(category) or DayTotals()
+
+    def window(self, first, last, category=None):
+        # Spend over the inclusive range of day ordinals
+        return self.totals(category).total(first, last)
+
+    def spending(self, today, category=None):
+        first, last = self.month_bounds(today)
+        return {"today": self.window(today, today, category),
+                "last_7_days": self.window(today - 6, today, category),
+                "last_30_days": self.window(today - 29, today, category),
+                "month_to_date": self.window(first, today, category),
+                "projected_month": self.projection(today, category)}
+
+    def projection(self, today, category=None):
+        # Month-to-date spend plus the rest of the month at the last 30 days' daily rate
+        first, last = self.month_bounds(today)
+        rate = self.window(today - 29, today, category) / 30
+        return self.window(first, today, category) + rate * (last - today)
+
+    def rolling(self, first, last, window=30, category=None):
+        # (day, total of the window days ending that day) for each day in [first, last]
+        totals = self.totals(category)
+        return [(day, totals.total(day - window + 1, day)) for day in range(first, last + 1)]
+
+    def cumulative(self, first, last, category=None):
+        # Running total from first, one point per day
+        totals = self.totals(category)
+        base = totals.prefix(first - 1)
+        return [(day, totals.prefix(day) - base) for day in range(first, last + 1)]
+
+# ---------- Query Index ----------
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+class QueryResult:
+    # Matching row keys in display order; rows are only fetched for the slice asked for
+    def __init__(self, keys, fetch):
+        self.keys = keys
+        self.fetch = fetch
+
+    def count(self):
+        return len(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_expense_rows(self, start, stop):
+        return self.fetch(self.keys[start:stop])
+
+    def __iter__(self):
+        for i in range(0, len(self.keys), 1000):
+            yield from self.get_expense_rows(i, i + 1000)
+
+
+class ExpenseIndex:
+    # Secondary indexes over expense IDs, which survive edits and deletes:
+    # dates kept sorted for bisection, a posting list per category and per
+    # description token, plus a sorted token vocabulary for prefix search.
+    def __init__(self):
+        self.ids = []
+        self.dates = []
+        self.date_ids = []
+        self.categories = {}
+        self.tokens = {}
+        self.vocabulary = []
+
+    @classmethod
+    def build(cls, expenses):
+        # Each list is sorted once here rather than kept sorted row by row,
+        # so rows may come in any order (partitions list them month by month)
+        index = cls()
+        rows = sorted(expenses, key=lambda expense: expense["id"])
+        for expense in rows:
+            key = expense["id"]
+            index.ids.append(key)
+            index.categories.setdefault(expense["category"], []).append(key)
+            for token in tokenize(expense["description"]):
+                index.tokens.setdefault(token, []).append(key)
+        rows.sort(key=lambda expense: expense["date"])
+        index.dates = [expense["date"] for expense in rows]
+        index.date_ids = [expense["id"] for expense in rows]
+        index.vocabulary = sorted(index.tokens)
+        return index
+
+    @staticmethod
+    def insert(postings, key):
+        # New expenses have the highest ID; a restored one goes back in order
+        if not postings or key > postings[-1]:
+            postings.append(key)
+        else:
+            insort(postings, key)
 
     @staticmethod
-    def list_users():
-        if not os.path.exists(SecureStorage.BASE_DIR):
-            return []
-        return [d for d in os.listdir(SecureStorage.BASE_DIR) if os.path.isdir(os.path.join(SecureStorage.BASE_DIR, d))]
+    def discard(postings, key):
+        i = bisect_left(postings, key)
+        if i < len(postings) and postings[i] == key:
+            del postings[i]
 
-    def __init__(self, user_id):
-        os.makedirs(self.BASE_DIR, exist_ok=True)
-        self.user_dir = os.path.join(self.BASE_DIR, user_id)
-        os.makedirs(self.user_dir, exist_ok=True)
-        self.pin_file = os.path.join(self.user_dir, "pin.hash")
-        self.data_file = os.path.join(self.user_dir, "expenses.json")
-        self.category_file = os.path.join(self.user_dir, "categories.json")
+    def add(self, expense):
+        key = expense["id"]
+        self.insert(self.ids, key)
+        date = expense["date"]
+        if not self.dates or date >= self.dates[-1]:
+            self.dates.append(date)
+            self.date_ids.append(key)
+        else:
+            i = bisect_right(self.dates, date)
+            self.dates.insert(i, date)
+            self.date_ids.insert(i, key)
+        self.insert(self.categories.setdefault(expense["category"], []), key)
+        for token in tokenize(expense["description"]):
+            postings = self.tokens.get(token)
+            if postings is None:
+                postings = self.tokens[token] = []
+                insort(self.vocabulary, token)
+            self.insert(postings, key)
 
-    def save_pin(self, pin):
-        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
-        with open(self.pin_file, 'w') as f:
-            f.write(hashed_pin)
+    def remove(self, expense):
+        key = expense["id"]
+        self.discard(self.ids, key)
+        i = bisect_left(self.dates, expense["date"])
+        while i < len(self.dates) and self.date_ids[i] != key:
+            i += 1
+        if i < len(self.dates):
+            del self.dates[i]
+            del self.date_ids[i]
+        postings = self.categories.get(expense["category"])
+        if postings is not None:
+            self.discard(postings, key)
+            if not postings:
+                del self.categories[expense["category"]]
+        for token in tokenize(expense["description"]):
+            postings = self.tokens.get(token)
+            if postings is None:
+                continue
+            self.discard(postings, key)
+            if not postings:
+                del self.tokens[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
 
-    def check_pin(self, pin):
-        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
-        if os.path.exists(self.pin_file):
-            with open(self.pin_file, 'r') as f:
-                return hashed_pin == f.read()
-        return False
+    def prefix_postings(self, prefix):
+        # Every token starting with prefix, so "groc" finds "groceries"
+        matched = []
+        i = bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            matched.append(self.tokens[self.vocabulary[i]])
+            i += 1
+        return matched
 
-    def pin_exists(self):
-        return os.path.exists(self.pin_file)
+    def search(self, fetch, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None,
+               intersect=False):
+        # Start from whichever index gives the fewest candidates, then check
+        # the remaining filters against just those rows; fetch(ids) returns
+        # the rows for a sorted list of IDs. With intersect, the other indexes
+        # narrow the candidates instead, for when fetching rows is the slow part.
+        low, high = date_bounds(start, end)
+        categories = set(categories) if categories else None
+        words = sorted(tokenize(text or ""))
+        plans = []
+        if low is not None or high is not None:
+            i = bisect_left(self.dates, low) if low is not None else 0
+            j = bisect_left(self.dates, high) if high is not None else len(self.dates)
+            plans.append((j - i, "date", lambda: sorted(self.date_ids[i:j])))
+        if categories:
+            lists = [self.categories.get(c, []) for c in categories]
+            plans.append((sum(map(len, lists)), "category", lambda: list(heapq.merge(*lists))))
+        if words:
+            word_postings = [self.prefix_postings(word) for word in words]
+            def text_candidates():
+                sets = sorted((set().union(*lists) for lists in word_postings), key=len)
+                return sorted(set.intersection(*sets))
+            plans.append((min(sum(map(len, lists)) for lists in word_postings), "text", text_candidates))
+        if not plans:
+            candidates, covered = self.ids, set()
+        else:
+            size, name, candidates = min(plans, key=lambda plan: plan[0])
+            candidates, covered = candidates(), {name}
+            if intersect:
+                for size, name, other in plans:
+                    if name not in covered:
+                        keep = set(other())
+                        candidates = [key for key in candidates if key in keep]
+                        covered.add(name)
+        # Filters the chosen indexes already guarantee are not checked again
+        check_dates = (low is not None or high is not None) and "date" not in covered
+        check_categories = categories is not None and "category" not in covered
+        check_words = bool(words) and "text" not in covered
+        if not (check_dates or check_categories or check_words or min_amount is not None or max_amount is not None):
+            return list(candidates)
+        matches = []
+        for key, exp in zip(candidates, fetch(candidates)):
+            if check_dates and ((low is not None and exp["date"] < low) or (high is not None and exp["date"] >= high)):
+                continue
+            if check_categories and exp["category"] not in categories:
+                continue
+            if min_amount is not None and exp["amount"] < min_amount:
+                continue
+            if max_amount is not None and exp["amount"] > max_amount:
+                continue
+            if check_words:
+                tokens = tokenize(exp["description"])
+                if not all(any(t.startswith(word) for t in tokens) for word in words):
+                    continue
+            matches.append(key)
+        return matches
 
-    def reset_pin(self):
-        if os.path.exists(self.pin_file):
-            os.remove(self.pin_file)
+# ---------- CSV Import / Export ----------
+CSV_FIELDS = ["date", "description", "amount", "category"]
+CSV_DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%m/%d/%Y", "%m/%d/%Y %H:%M:%S", "%d.%m.%Y"]
 
-    def load_categories(self):
-        try:
-            if os.path.exists(self.category_file):
-                with open(self.category_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            print("Error loading categories:", e)
-        return ["Food", "Transport", "Utilities", "Entertainment", "Health", "Other"]
 
-    def save_categories(self, categories):
+def date_bounds(start, end):
+    # Inclusive "YYYY-MM-DD" range -> [low, high) on stored date strings
+    high = None
+    if end:
+        high = (datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return start or None, high
+
+
+def filter_expenses(rows, start=None, end=None, categories=None):
+    low, high = date_bounds(start, end)
+    categories = set(categories) if categories else None
+    for exp in rows:
+        if low is not None and exp["date"] < low:
+            continue
+        if high is not None and exp["date"] >= high:
+            continue
+        if categories is not None and exp["category"] not in categories:
+            continue
+        yield exp
+
+
+def parse_csv_date(value):
+    value = value.strip()
+    for fmt in CSV_DATE_FORMATS:
         try:
-            with open(self.category_file, 'w') as f:
-                json.dump(categories, f, indent=2)
-        except Exception as e:
-            print("Error saving categories:", e)
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date '{value}'")
+
+
+def parse_csv_amount(value):
+    amount = float(value.strip().replace("$", "").replace(",", ""))
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount '{value}'")
+    # Expenses are always positive; a refund is recorded by editing or deleting
+    if amount <= 0:
+        raise ValueError(f"amount must be positive, not '{value.strip()}'")
+    return amount
+
+
+def read_expenses_csv(path, chunk_size=5000, progress=None):
+    # Yields (valid expenses, [(line, error)]) per chunk so huge files stream
+    total = os.path.getsize(path) or 1
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None:
+            return
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        missing = {"date", "amount"} - set(reader.fieldnames)
+        if missing:
+            raise ValueError(f"CSV is missing column(s): {', '.join(sorted(missing))}")
+        chunk, errors = [], []
+        for row in reader:
+            try:
+                chunk.append({
+                    "date": parse_csv_date(row.get("date") or ""),
+                    "description": (row.get("description") or "").strip(),
+                    "amount": parse_csv_amount(row.get("amount") or ""),
+                    "category": (row.get("category") or "").strip() or "Other"
+                })
+            except ValueError as e:
+                errors.append((reader.line_num, str(e)))
+            if len(chunk) + len(errors) >= chunk_size:
+                yield chunk, errors
+                chunk, errors = [], []
+                if progress is not None:
+                    progress(min(1.0, f.buffer.tell() / total))
+        if chunk or errors:
+            yield chunk, errors
+
+
+@instrumented("export_csv", lambda written, path, *args, **kwargs: (written, file_size(path)))
+def export_expenses_csv(path, rows, progress=None, total=None, chunk_size=10000):
+    # Writes a chunk of rows at a time; rows can be any iterable, including a generator
+    written = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        chunk = []
+        for exp in rows:
+            chunk.append(exp)
+            if len(chunk) >= chunk_size:
+                writer.writerows(chunk)
+                written += len(chunk)
+                chunk = []
+                if progress is not None and total:
+                    progress(min(1.0, written / total))
+        writer.writerows(chunk)
+        written += len(chunk)
+    return written
 
 # ---------- Expense Tracker ----------
 class ExpenseTracker:
-    def __init__(self, storage):
+    def __init__(self, storage, columnar=False):
         self.storage = storage
+        self.columnar = columnar
         self.expenses = []
+        self.aggregates = ExpenseAggregates()
+        # Bumped on every change so views can tell when cached output is stale
+        self.version = 0
+        # Changes not yet written, on every backend; with autoflush off the
+        # caller decides when to run prepare_commit(), so a burst of changes
+        # becomes one write. On-disk reads lay them over the committed rows
+        # instead of writing first: changes holds each changed ID's row after
+        # the pending ops (None if deleted), committed its row before them.
+        self.autoflush = True
+        self.pending = []
+        self.changes = {}
+        self.committed = {}
+        self.dirty = False
+        # Commits handed out by prepare_commit that haven't finished; changes
+        # from other processes aren't taken while one is in flight
+        self.unwritten = set()
+        # Built on the first query, then kept up to date by every change
+        self.index = None
+        # Day totals for windows and budgets; built on first use like the index
+        self.analytics = None
+        self.budgets = storage.load_budgets()
+        # Called with an alert dict when a change takes a category over its monthly budget
+        self.on_budget_alert = None
         self.load_expenses()
 
+    @instrumented("tracker.load_expenses", lambda _, self: (self.count(), None))
     def load_expenses(self):
+        # A file that can't be read is an error, not an empty list: the next save would overwrite it
         try:
-            if os.path.exists(self.storage.data_file):
-                with open(self.storage.data_file, "r") as f:
-                    self.expenses = json.load(f)
+            with self.storage.lock:
+                self.expenses = self.storage.backend.load()
         except Exception as e:
             print("Error loading expenses:", e)
-            self.expenses = []
+            raise
+        if self.columnar and self.storage.backend.in_memory:
+            self.expenses = ColumnarExpenses(self.expenses)
+        self.index = None
+        self.analytics = None
+        self.version += 1
+        self.load_aggregates()
+        last = self.last()
+        self.next_id = last["id"] + 1 if last else 1
 
+    @instrumented("tracker.save_expenses", lambda _, self: (self.count(), None))
     def save_expenses(self):
+        self.pending, self.changes, self.committed, self.dirty = [], {}, {}, False
         try:
-            with open(self.storage.data_file, "w") as f:
-                json.dump(self.expenses, f, indent=2)
+            self.storage.backend.save(self.expenses)
         except Exception as e:
             print("Error saving expenses:", e)
+        self.aggregates.token = self.storage.backend.change_token()
+        self.save_aggregates()
+
+    def prepare_commit(self):
+        # Runs on the thread that owns the tracker: detaches the pending changes
+        # and copies whatever the write needs, so the returned callable can run
+        # on a worker thread while the tracker keeps changing.
+        if not self.dirty:
+            return None
+        ops, self.pending, self.dirty = self.pending, [], False
+        changes, committed, self.changes, self.committed = self.changes, self.committed, {}, {}
+        backend = self.storage.backend
+        if not backend.in_memory:
+            # The overlay goes with the ops, so the rows are written here and
+            # only the aggregate cache is left for the callable
+            try:
+                if ops:
+                    backend.commit(ops)
+            except Exception:
+                self.pending, self.dirty = ops + self.pending, True
+                self.changes, self.committed = changes, committed
+                raise
+        self.aggregates.last = ExpenseAggregates.signature(self.last())
+        snapshot = self.expenses.copy() if backend.in_memory and backend.needs_snapshot() else None
+        aggregates = self.aggregates.copy()
+        if not backend.in_memory:
+            aggregates.token = backend.change_token()
+        aggregate_file = self.storage.aggregate_file
+        token = object()
+        self.unwritten.add(token)
+        @instrumented("tracker.commit", lambda _: (len(ops) if snapshot is None else len(snapshot), None))
+        def commit():
+            try:
+                if backend.in_memory:
+                    if ops or snapshot is not None:
+                        backend.commit(ops, snapshot)
+                    # The commit may have read changes from other processes that
+                    # these totals don't include yet; they aren't saved until it has
+                    aggregates.token = backend.change_token()
+                if aggregates.token is not None:
+                    aggregates.save(aggregate_file)
+            finally:
+                self.unwritten.discard(token)
+        return commit
+
+    def flush(self):
+        try:
+            commit = self.prepare_commit()
+            if commit is not None:
+                commit()
+        except Exception as e:
+            print("Error saving expenses:", e)
+
+    def sync(self):
+        # For the reads that don't take the overlay (exports, recounts, the
+        # analytics build): writes whatever is pending to an on-disk backend first
+        if self.pending and not self.storage.backend.in_memory:
+            self.flush()
+
+    def overlay_rows(self, start, stop):
+        # Rows [start, stop) of an on-disk backend with the pending changes laid
+        # over them. Changed rows leave the backend's list and their new versions
+        # go back in by list_key, so the window read is widened by both counts.
+        backend = self.storage.backend
+        if not self.changes:
+            return backend.rows(start, stop)
+        key = backend.list_key
+        hidden = sorted(key(row) for row in self.committed.values() if row is not None)
+        extra = sorted((row for row in self.changes.values() if row is not None), key=key)
+        extra_keys = [key(row) for row in extra]
+        first = max(0, start - len(extra))
+        window = backend.rows(first, stop + len(hidden))
+        if not window and first:
+            return []
+        # Where the first row of the window (or whatever replaces it) lands
+        low = high = None
+        if window:
+            high = key(window[-1]) if len(window) == stop + len(hidden) - first else None
+            if first:
+                low = key(window[0])
+        anchor = first - bisect_left(hidden, low) + bisect_left(extra_keys, low) if low is not None else 0
+        lo = bisect_left(extra_keys, low) if low is not None else 0
+        hi = bisect_right(extra_keys, high) if high is not None else len(extra)
+        merged = list(heapq.merge((row for row in window if row["id"] not in self.changes), extra[lo:hi], key=key))
+        return merged[max(0, start - anchor):max(0, stop - anchor)]
+
+    def overlay_ids(self, ids, changes, options):
+        # Query IDs from an on-disk backend with the pending changes laid over
+        # them: changed rows are taken out and matched again as they are now
+        if not changes:
+            return ids
+        rows = {key: row for key, row in changes.items() if row is not None}
+        index = ExpenseIndex.build(rows.values())
+        matched = index.search(lambda keys: [rows[key] for key in keys], **options)
+        return self.storage.backend.merge_ids([key for key in ids if key not in changes], [rows[key] for key in matched])
+
+    def rows_by_id(self, ids):
+        backend = self.storage.backend
+        if not self.changes:
+            return backend.rows_by_id(ids)
+        found = {row["id"]: row for row in backend.rows_by_id([key for key in ids if key not in self.changes])}
+        found.update((key, self.changes[key]) for key in ids if self.changes.get(key) is not None)
+        return [found[key] for key in ids if key in found]
+
+    def snapshot(self, start=None, end=None, categories=None):
+        # Rows that are safe to iterate on another thread, optionally filtered
+        # by an inclusive "YYYY-MM-DD" date range and a set of categories
+        if self.storage.backend.in_memory:
+            return filter_expenses(self.expenses.copy(), start, end, categories)
+        self.sync()
+        return self.storage.backend.iter_all(start, end, categories)
+
+    def export_csv(self, path, start=None, end=None, categories=None, progress=None):
+        return export_expenses_csv(path, self.snapshot(start, end, categories), progress, self.count())
+
+    @instrumented("tracker.import_csv", lambda result, self, path, progress=None: (result["imported"], file_size(path)))
+    def import_csv(self, path, progress=None):
+        # Rows are validated and applied a chunk at a time; backends that append
+        # (journal, sqlite) write each chunk in one go, json gets one save at the end
+        self.flush()
+        backend = self.storage.backend
+        categories = self.storage.load_categories()
+        known = set(categories)
+        imported = 0
+        errors = []
+        # Last imported expense per budgeted (category, month), checked once at the end
+        budgeted = {}
+        for chunk, chunk_errors in read_expenses_csv(path, progress=progress):
+            errors.extend(chunk_errors)
+            ops = []
+            # IDs are reserved and written under one lock, so on-disk backends
+            # receive them in order even with another process adding
+            with self.storage.lock:
+                self.next_id = self.storage.reserve_ids(len(chunk), self.next_id)
+                for expense in chunk:
+                    if expense["category"] not in known:
+                        known.add(expense["category"])
+                        categories.append(expense["category"])
+                    expense["id"] = self.next_id
+                    self.next_id += 1
+                    if backend.in_memory:
+                        self.expenses.append(expense)
+                        if self.index is not None:
+                            self.index.add(expense)
+                    ops.append({"op": "add", "expense": expense})
+                    self.aggregates.add(expense)
+                    if self.analytics is not None:
+                        self.analytics.add(expense)
+                    if expense["category"] in self.budgets:
+                        budgeted[(expense["category"], expense["date"][:7])] = expense
+                imported += len(chunk)
+                if backend.incremental:
+                    backend.commit(ops, None)
+                else:
+                    self.pending.extend(ops)
+            self.version += 1
+            self.dirty = True
+        self.storage.save_categories(categories)
+        self.flush()
+        for expense in budgeted.values():
+            self.check_budget(expense)
+        return {"imported": imported, "skipped": len(errors), "errors": errors[:100]}
 
-    def add_expense(self, description, amount, category):
+    # ---------- Aggregate Cache ----------
+    def load_aggregates(self):
+        try:
+            cached = ExpenseAggregates.load(self.storage.aggregate_file)
+        except Exception as e:
+            print("Error loading aggregates:", e)
+            cached = None
+        if cached is not None and cached.matches(self.count(), self.last(), self.storage.backend.change_token()):
+            self.aggregates = cached
+        else:
+            self.rebuild_aggregates()
+
+    def save_aggregates(self):
+        if self.aggregates.token is None:
+            return
+        self.aggregates.last = ExpenseAggregates.signature(self.last())
+        try:
+            self.aggregates.save(self.storage.aggregate_file)
+        except Exception as e:
+            print("Error saving aggregates:", e)
+
+    def rebuild_aggregates(self):
+        # The token is taken first: a write landing during the recount then
+        # makes the saved cache look stale rather than current
+        self.sync()
+        token = self.storage.backend.change_token()
+        if self.storage.backend.in_memory:
+            self.aggregates = ExpenseAggregates.from_expenses(self.expenses)
+        else:
+            self.aggregates = ExpenseAggregates.from_groups(self.storage.backend)
+        self.aggregates.token = token
+        self.save_aggregates()
+
+    def count(self):
+        if self.storage.backend.in_memory:
+            return len(self.expenses)
+        return (self.storage.backend.count() + sum(row is not None for row in self.changes.values())
+                - sum(row is not None for row in self.committed.values()))
+
+    def last(self):
+        if self.storage.backend.in_memory:
+            return self.expenses[-1] if self.expenses else None
+        rows = [row for row in self.changes.values() if row is not None]
+        rows.append(self.storage.backend.last([key for key, row in self.committed.items() if row is not None]))
+        return max((row for row in rows if row is not None), key=lambda row: row["id"], default=None)
+
+    # ---------- Mutations ----------
+    # Every expense has an "id", handed out in increasing order, and in-memory
+    # rows stay sorted by it, so an ID is found by bisection (id_position)
+    def record(self, op, old=None):
+        # The op waits for the next commit; in-memory rows are already changed.
+        # old is the row the op replaces or deletes, as get_expense returned it.
+        self.pending.append(op)
+        if not self.storage.backend.in_memory:
+            key = op["id"] if op["op"] == "delete" else op["expense"]["id"]
+            self.committed.setdefault(key, old)
+            self.changes[key] = None if op["op"] == "delete" else op["expense"]
+
+    def find(self, expense_id):
+        # Position of an in-memory expense, or None
+        i = id_position(self.expenses, expense_id)
+        if i < len(self.expenses) and self.expenses[i]["id"] == expense_id:
+            return i
+        return None
+
+    def get_expense(self, expense_id):
+        if not self.storage.backend.in_memory:
+            if expense_id in self.changes:
+                return self.changes[expense_id]
+            return self.storage.backend.get(expense_id)
+        i = self.find(expense_id)
+        return self.expenses[i] if i is not None else None
+
+    def rows_for_ids(self, ids):
+        # ids are sorted, so each lookup starts where the previous one ended
+        rows, lo, expenses = [], 0, self.expenses
+        for expense_id in ids:
+            lo = id_position(expenses, expense_id, lo)
+            if lo < len(expenses):
+                row = expenses[lo]
+                if row["id"] == expense_id:
+                    rows.append(row)
+        return rows
+
+    def add_expense(self, description, amount, category, date=None):
         expense = {
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "id": None,
+            "date": date or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "description": description,
             "amount": float(amount),
             "category": category
         }
-        self.expenses.append(expense)
-        self.save_expenses()
+        # Reserved and recorded under one lock, as in import_csv
+        with self.storage.lock:
+            expense["id"] = self.storage.reserve_ids(1, self.next_id)
+            self.next_id = expense["id"] + 1
+            if self.storage.backend.in_memory:
+                self.expenses.append(expense)
+                if self.index is not None:
+                    self.index.add(expense)
+            self.record({"op": "add", "expense": expense})
+        self.aggregates.add(expense)
+        if self.analytics is not None:
+            self.analytics.add(expense)
+        self.changed()
+        self.check_budget(expense)
+        return expense["id"]
+
+    def update_expense(self, expense_id, description=None, amount=None, category=None, date=None):
+        # Fields left as None keep their value; returns the previous version, or None if there is no such expense
+        old = self.get_expense(expense_id)
+        if old is None:
+            return None
+        new = dict(old)
+        for key, value in (("description", description), ("amount", amount), ("category", category), ("date", date)):
+            if value is not None:
+                new[key] = value
+        new["amount"] = float(new["amount"])
+        if self.storage.backend.in_memory:
+            self.expenses[self.find(expense_id)] = new
+            if self.index is not None:
+                self.index.remove(old)
+                self.index.add(new)
+        self.record({"op": "update", "expense": new}, old)
+        self.aggregates.replace(old, new)
+        if self.analytics is not None:
+            self.analytics.remove(old)
+            self.analytics.add(new)
+        self.changed()
+        self.check_budget(new)
+        return old
+
+    def delete_expense(self, expense_id):
+        # Returns the removed expense, or None if there is no such expense
+        removed = self.get_expense(expense_id)
+        if removed is None:
+            return None
+        if self.storage.backend.in_memory:
+            del self.expenses[self.find(expense_id)]
+            if self.index is not None:
+                self.index.remove(removed)
+        self.record({"op": "delete", "id": expense_id}, removed)
+        self.aggregates.remove(removed)
+        if self.analytics is not None:
+            self.analytics.remove(removed)
+        self.changed()
+        return removed
+
+    def restore_expense(self, expense):
+        # Puts a deleted expense back under its old ID (undo)
+        if self.get_expense(expense["id"]) is not None:
+            return False
+        if self.storage.backend.in_memory:
+            self.expenses.insert(id_position(self.expenses, expense["id"]), expense)
+            if self.index is not None:
+                self.index.add(expense)
+        self.record({"op": "add", "expense": expense})
+        self.aggregates.add(expense)
+        if self.analytics is not None:
+            self.analytics.add(expense)
+        self.next_id = max(self.next_id, expense["id"] + 1)
+        self.changed()
+        return True
 
     def delete_last_expense(self):
-        if self.expenses:
-            self.expenses.pop()
-            self.save_expenses()
-            return True
-        return False
+        last = self.last()
+        return last is not None and self.delete_expense(last["id"]) is not None
+
+    def changed(self):
+        self.version += 1
+        self.dirty = True
+        if self.autoflush:
+            self.flush()
 
     def get_expenses(self):
+        if not self.storage.backend.in_memory:
+            return self.overlay_rows(0, self.count())
         return self.expenses
 
+    def get_expense_rows(self, start, stop):
+        if not self.storage.backend.in_memory:
+            return self.overlay_rows(start, stop)
+        return self.expenses[start:stop]
+
+    @instrumented("tracker.query", lambda result, *args, **kwargs: (len(result), None))
+    def query(self, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+        # Dates are inclusive "YYYY-MM-DD"; text matches words in the description by prefix
+        backend = self.storage.backend
+        if not backend.in_memory:
+            options = {"start": start, "end": end, "categories": categories, "min_amount": min_amount,
+                       "max_amount": max_amount, "text": text}
+            return QueryResult(self.overlay_ids(backend.query(**options), self.changes, options), self.rows_by_id)
+        if self.index is None:
+            self.index = ExpenseIndex.build(self.expenses)
+        ids = self.index.search(self.rows_for_ids, start, end, categories, min_amount, max_amount, text)
+        return QueryResult(ids, self.rows_for_ids)
+
+    def prepare_query(self, **options):
+        # Like prepare_commit: runs on the thread that owns the tracker and
+        # returns a callable for a worker thread. On-disk backends search
+        # there; in-memory rows only change on this thread, so they are
+        # searched here and the callable just hands the result over.
+        backend = self.storage.backend
+        if backend.in_memory:
+            result = self.query(**options)
+            return lambda: result
+        # A commit landing during the search leaves the result the same: the
+        # overlay replaces the changed rows whether the backend has them yet or not
+        changes = dict(self.changes)
+        return lambda: QueryResult(self.overlay_ids(backend.query(**options), changes, options), self.rows_by_id)
+
+    @instrumented("tracker.summary_by_category", lambda summary, self: (len(summary), None))
     def get_summary_by_category(self):
-        summary = {}
-        for exp in self.expenses:
-            summary[exp['category']] = summary.get(exp['category'], 0) + exp['amount']
-        return summary
+        return self.aggregates.summary_by_category()
 
+    @instrumented("tracker.monthly_summary", lambda summary, self: (len(summary), None))
     def get_monthly_summary(self):
-        summary = {}
-        for exp in self.expenses:
-            dt = datetime.strptime(exp['date'], "%Y-%m-%d %H:%M:%S")
-            key = dt.strftime("%Y-%m")
-            summary[key] = summary.get(key, 0) + exp['amount']
-        return summary
+        return self.aggregates.monthly_summary()
+
+    # ---------- Analytics and Budgets ----------
+    @instrumented("tracker.build_analytics")
+    def get_analytics(self):
+        if self.analytics is None:
+            backend = self.storage.backend
+            if backend.in_memory:
+                self.analytics = ExpenseAnalytics.from_expenses(self.expenses)
+            else:
+                self.sync()
+                self.analytics = ExpenseAnalytics.from_groups(backend.day_groups())
+        return self.analytics
+
+    def prepare_analytics(self):
+        # Like prepare_query: returns a callable that builds the analytics on
+        # a worker thread, or None if they are built already. What it returns
+        # goes to install_analytics, which drops it if anything changed meanwhile.
+        if self.analytics is not None:
+            return None
+        backend, version = self.storage.backend, self.version
+        if backend.in_memory:
+            expenses = self.expenses.copy()
+            return lambda: (version, ExpenseAnalytics.from_expenses(expenses))
+        self.sync()
+        return lambda: (version, ExpenseAnalytics.from_groups(backend.day_groups()))
+
+    def install_analytics(self, built):
+        # True once the analytics are in place
+        version, analytics = built
+        if self.analytics is None and version == self.version:
+            self.analytics = analytics
+        return self.analytics is not None
+
+    def set_budgets(self, budgets):
+        self.budgets = {category: float(limit) for category, limit in budgets.items()}
+        self.storage.save_budgets(self.budgets)
+
+    def check_budget(self, expense):
+        # Returns the alert (and passes it to on_budget_alert) if the expense's
+        # category is now over budget for the expense's month
+        limit = self.budgets.get(expense["category"])
+        if limit is None:
+            return None
+        # From the aggregates, so a check never waits for the analytics to be built
+        spent = self.aggregates.category_month(expense["category"], expense["date"][:7])
+        if spent <= limit:
+            return None
+        alert = {"category": expense["category"], "month": expense["date"][:7], "budget": limit, "spent": spent}
+        if self.on_budget_alert is not None:
+            self.on_budget_alert(alert)
+        return alert
+
+    def budget_status(self, today=None):
+        # This month's spend and month-end projection for every budgeted category
+        analytics = self.get_analytics()
+        day = (today or datetime.now()).toordinal()
+        first, last = analytics.month_bounds(day)
+        status = []
+        for category, limit in self.budgets.items():
+            spent = analytics.window(first, last, category)
+            projected = max(spent, analytics.projection(day, category))
+            status.append({"category": category, "budget": limit, "spent": spent, "projected": projected,
+                           "over": spent > limit, "projected_over": projected > limit})
+        return status
+
+    # ---------- Other Instances ----------
+    # Another window or a cli.py job may have the same user open. Writes never
+    # overwrite theirs (see the backends' catch_up); reload_changes brings this
+    # tracker up to date with what they wrote.
+    def reload_changes(self, wait=True):
+        # Returns the ops applied ([] when nothing changed, or when the lock is
+        # busy and wait is False), or None after a full reload. Unsaved changes
+        # are written first; nothing is taken while a commit is still in flight.
+        if self.unwritten or not self.storage.lock.acquire(wait):
+            return []
+        try:
+            self.flush()
+            ops = self.storage.backend.changes()
+        finally:
+            self.storage.lock.release()
+        backend = self.storage.backend
+        if ops is None and backend.in_memory:
+            self.load_expenses()
+            return None
+        if ops is None or (not backend.in_memory and any(op["op"] != "add" for op in ops)):
+            # On-disk rows are already current; only what is derived from them is stale
+            self.rebuild_aggregates()
+            self.analytics = None
+        else:
+            for op in ops:
+                self.apply_change(op)
+        if ops != []:
+            last = self.last()
+            self.next_id = max(self.next_id, last["id"] + 1 if last else 1)
+            self.version += 1
+        return ops
+
+    def apply_change(self, op):
+        # One op from another process, applied to the in-memory rows (if any),
+        # index, aggregates and analytics like the matching local change
+        in_memory = self.storage.backend.in_memory
+        if op["op"] == "delete":
+            i = self.find(op["id"])
+            if i is None:
+                return
+            removed = self.expenses[i]
+            del self.expenses[i]
+            if self.index is not None:
+                self.index.remove(removed)
+            self.aggregates.remove(removed)
+            if self.analytics is not None:
+                self.analytics.remove(removed)
+            return
+        expense = op["expense"]
+        i = self.find(expense["id"]) if in_memory else None
+        if i is None:
+            if in_memory:
+                self.expenses.insert(id_position(self.expenses, expense["id"]), expense)
+                if self.index is not None:
+                    self.index.add(expense)
+            self.aggregates.add(expense)
+            if self.analytics is not None:
+                self.analytics.add(expense)
+            return
+        old = self.expenses[i]
+        self.expenses[i] = expense
+        if self.index is not None:
+            self.index.remove(old)
+            self.index.add(expense)
+        self.aggregates.replace(old, expense)
+        if self.analytics is not None:
+            self.analytics.remove(old)
+            self.analytics.add(expense)
+
+# ---------- Household Report ----------
+def user_summary(base_dir, user_id, pin):
+    # Runs in a worker process: one user's row count and grouped totals, if pin is theirs
+    SecureStorage.BASE_DIR = base_dir
+    try:
+        storage = SecureStorage(user_id)
+        if not storage.pin_exists() or not storage.check_pin(pin):
+            return {"user": user_id, "error": "Invalid PIN"}
+        try:
+            aggregates = ExpenseTracker(storage).aggregates
+        finally:
+            storage.close()
+        return {"user": user_id, "count": aggregates.count,
+                "categories": aggregates.categories, "months": aggregates.months}
+    except Exception as e:
+        return {"user": user_id, "error": str(e)}
+
+
+def merge_summaries(summaries):
+    report = {"count": 0, "total": 0.0, "users": {}, "categories": {}, "months": {}}
+    for summary in sorted(summaries, key=lambda s: s["user"]):
+        if "error" in summary:
+            report["users"][summary["user"]] = {"error": summary["error"]}
+            continue
+        total = sum(amount for n, amount in summary["categories"].values())
+        report["users"][summary["user"]] = {"count": summary["count"], "total": total}
+        report["count"] += summary["count"]
+        report["total"] += total
+        for category, (n, amount) in summary["categories"].items():
+            ExpenseAggregates.bump(report["categories"], category, amount, n)
+        for month, (n, amount) in summary["months"].items():
+            ExpenseAggregates.bump(report["months"], month, amount, n)
+    report["months"] = dict(sorted(report["months"].items()))
+    return report
+
+
+def household_report(pins, processes=None, progress=None):
+    # The summaries of every user in pins (user -> PIN) merged into one; a
+    # user whose PIN doesn't match is listed with an error and no totals.
+    # Users are loaded in parallel worker processes, so the report takes
+    # about as long as the largest user.
+    users = [user for user in SecureStorage.list_users() if user in pins]
+    base_dir = SecureStorage.BASE_DIR
+    summaries = []
+    if processes == 1 or len(users) < 2:
+        for user in users:
+            summaries.append(user_summary(base_dir, user, pins[user]))
+            if progress is not None:
+                progress(len(summaries) / len(users))
+        return merge_summaries(summaries)
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    workers = processes or min(len(users), os.cpu_count() or 1)
+    # spawn, not fork: the caller may be the GUI with Tk and worker threads running
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for future in as_completed([pool.submit(user_summary, base_dir, user, pins[user]) for user in users]):
+            summaries.append(future.result())
+            if progress is not None:
+                progress(len(summaries) / len(users))
+    return merge_summaries(summaries)
+
+
+def read_household_pins(users):
+    # For --household-report: BUDGETBASE_PINS holds a JSON object of user to
+    # PIN, or each PIN is asked for on the terminal (empty leaves the user out).
+    # None when neither is available.
+    if os.environ.get("BUDGETBASE_PINS"):
+        return json.loads(os.environ["BUDGETBASE_PINS"])
+    if not sys.stdin.isatty():
+        return None
+    import getpass
+    pins = {}
+    for user in users:
+        pin = getpass.getpass(f"PIN for {user} (empty to leave out): ")
+        if pin:
+            pins[user] = pin
+    return pins
 
 # ---------- GUI Screens ----------
 class UserSelectScreen(ttk.Frame):
@@ -142,6 +3808,7 @@ class UserSelectScreen(ttk.Frame):
         super().__init__(parent, padding=20)
         self.parent = parent
         self.on_user_selected = on_user_selected
+        self.runner = None
         self.pack(fill="both", expand=True)
         self.setup_gui()
 
@@ -152,13 +3819,16 @@ class UserSelectScreen(ttk.Frame):
         ttk.Label(self, text="Choose a User", style="Header.TLabel").grid(row=0, column=0, columnspan=3, pady=(0,12))
 
         # User combobox
-        self.user_combo = ttk.Combobox(self, values=SecureStorage.list_users(), state="readonly", font=("Segoe UI", 12))
-        if SecureStorage.list_users():
-            self.user_combo.set(SecureStorage.list_users()[0])
+        users = SecureStorage.list_users()
+        self.user_combo = ttk.Combobox(self, values=users, state="readonly", font=("Segoe UI", 12))
+        if users:
+            self.user_combo.set(users[0])
         self.user_combo.grid(row=1, column=0, columnspan=2, sticky="ew", padx=12)
         
         ttk.Button(self, text="Login", command=self.select_user).grid(row=1, column=2, padx=5)
         ttk.Button(self, text="Delete User", command=self.delete_user).grid(row=2, column=2, padx=5, pady=5)
+        self.report_button = ttk.Button(self, text="Household Report", command=self.household_report)
+        self.report_button.grid(row=2, column=0, sticky="w", padx=12, pady=5)
 
         # New user creation
         ttk.Label(self, text="Or create a New User:").grid(row=3, column=0, columnspan=3, pady=(18,4))
@@ -169,6 +3839,11 @@ class UserSelectScreen(ttk.Frame):
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=1)
 
+    def destroy(self):
+        if self.runner is not None:
+            self.runner.close()
+        super().destroy()
+
     def select_user(self):
         user = self.user_combo.get().strip()
         if user:
@@ -195,10 +3870,8 @@ class UserSelectScreen(ttk.Frame):
             return
         confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to permanently delete user '{user}'?")
         if confirm:
-            user_dir = os.path.join(SecureStorage.BASE_DIR, user)
             try:
-                import shutil
-                shutil.rmtree(user_dir)
+                SecureStorage.delete_user(user)
                 messagebox.showinfo("Deleted", f"User '{user}' deleted successfully")
                 # Refresh combobox
                 users = SecureStorage.list_users()
@@ -211,6 +3884,50 @@ class UserSelectScreen(ttk.Frame):
                 messagebox.showerror("Error", f"Failed to delete user: {e}")
 
 
+    def household_report(self):
+        users = SecureStorage.list_users()
+        if not users:
+            messagebox.showwarning("Household Report", "There are no users yet")
+            return
+        # A user's totals are only included with their PIN
+        pins = {}
+        for user in users:
+            pin = simpledialog.askstring("Household Report", f"PIN for '{user}' (Cancel leaves them out):",
+                                         show="*", parent=self)
+            if pin:
+                pins[user] = pin
+        if not pins:
+            return
+        if self.runner is None:
+            self.runner = TaskRunner(self)
+        self.report_button.state(["disabled"])
+        def done(report):
+            self.report_button.state(["!disabled"])
+            self.show_household(report)
+        def failed(error):
+            self.report_button.state(["!disabled"])
+            messagebox.showerror("Error", str(error))
+        self.runner.submit("household", lambda progress: household_report(pins, progress=progress), done, failed)
+
+    def show_household(self, report):
+        window = tk.Toplevel(self)
+        window.title("Household Report")
+        text = tk.Text(window, width=60, height=30, bg='#f0f6fb', font=('Consolas', 11))
+        text.pack(fill="both", expand=True)
+        lines = [f"Household: {len(report['users'])} users, {report['count']} expenses, ${report['total']:.2f}\n\n", "Users:\n"]
+        for user, summary in report["users"].items():
+            if "error" in summary:
+                lines.append(f"{user:12} | error: {summary['error']}\n")
+            else:
+                lines.append(f"{user:12} | {summary['count']:8} | ${summary['total']:.2f}\n")
+        lines.append("\nCategory Summary:\n")
+        lines.extend(f"{cat:12} | ${total:.2f}\n" for cat, (n, total) in report["categories"].items())
+        lines.append("\nMonthly Summary:\n")
+        lines.extend(f"{month} | ${total:.2f}\n" for month, (n, total) in report["months"].items())
+        text.insert(tk.END, "".join(lines))
+        text.config(state="disabled")
+
+
 class LoginScreen(ttk.Frame):
     def __init__(self, parent, user_id, on_login_success):
         super().__init__(parent, padding=20)
@@ -272,18 +3989,466 @@ class LoginScreen(ttk.Frame):
             messagebox.showinfo("Reset", "PIN reset. Please set a new PIN.")
             self.setup_gui()
 
+# ---------- Background Tasks ----------
+class TaskRunner:
+    # Runs slow work on worker threads and hands results back to the Tk thread.
+    # Tasks share a key when a newer request makes an older one pointless
+    # (e.g. repeated chart clicks): the older one is cancelled if it has not
+    # started yet and its result is dropped if it has.
+    POLL_MS = 50
+
+    def __init__(self, widget, on_busy=None):
+        from concurrent.futures import ThreadPoolExecutor
+        self.widget = widget
+        self.on_busy = on_busy
+        self.pool = ThreadPoolExecutor(max_workers=4)
+        # Writes go through one thread so they land in the order they were made
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.generations = {}
+        self.futures = {}
+        self.timers = {}
+        self.active = 0
+        self.poll_id = None
+
+    def submit(self, key, fn, on_done=None, on_error=None, writer=False):
+        # fn(progress) runs on a worker; progress(fraction) may be called from it
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        old = self.futures.get(key)
+        if old is not None and not writer and old.cancel():
+            self.active -= 1
+        def run():
+            try:
+                result = fn(lambda fraction: self.results.put(("progress", key, generation, fraction, None)))
+            except Exception as e:
+                self.results.put(("error", key, generation, e, on_error))
+            else:
+                self.results.put(("done", key, generation, result, on_done))
+        self.futures[key] = (self.writer if writer else self.pool).submit(run)
+        self.active += 1
+        self.busy(None)
+        if self.poll_id is None:
+            self.poll_id = self.widget.after(self.POLL_MS, self.poll)
+
+    def debounce(self, key, delay_ms, prepare, on_error=None):
+        # Restart the timer on every call; when it fires, prepare() runs here and
+        # whatever callable it returns is written on the writer thread.
+        if key in self.timers:
+            self.widget.after_cancel(self.timers[key])
+        self.timers[key] = self.widget.after(delay_ms, lambda: self.write(key, prepare, on_error))
+
+    def write(self, key, prepare, on_error=None):
+        # prepare() may write itself (on-disk backends), so its errors go to on_error too
+        self.timers.pop(key, None)
+        try:
+            work = prepare()
+        except Exception as e:
+            if on_error is None:
+                print(f"Error in background task '{key}':", e)
+            else:
+                on_error(e)
+            return
+        if work is not None:
+            self.submit(key, lambda progress: work(), None, on_error, writer=True)
+
+    def poll(self):
+        self.poll_id = None
+        while True:
+            try:
+                kind, key, generation, value, callback = self.results.get_nowait()
+            except queue.Empty:
+                break
+            stale = generation != self.generations.get(key)
+            if kind == "progress":
+                if not stale:
+                    self.busy(value)
+                continue
+            self.active -= 1
+            if kind == "error" and callback is None:
+                print(f"Error in background task '{key}':", value)
+            elif callback is not None and not (stale and kind == "done"):
+                callback(value)
+        if self.active > 0:
+            self.poll_id = self.widget.after(self.POLL_MS, self.poll)
+        else:
+            self.busy(None)
+
+    def busy(self, fraction):
+        if self.on_busy is not None:
+            self.on_busy(self.active > 0, fraction)
+
+    def close(self, flush=()):
+        # flush: (key, prepare) pairs whose debounced writes must not be lost
+        for key, timer in list(self.timers.items()):
+            self.widget.after_cancel(timer)
+        self.timers.clear()
+        for key, prepare in flush:
+            try:
+                work = prepare()
+            except Exception as e:
+                print(f"Error in background task '{key}':", e)
+                continue
+            if work is not None:
+                self.writer.submit(work)
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.writer.shutdown(wait=True)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+# ---------- Expense List View ----------
+class ExpenseListView(ttk.Frame):
+    # Only the rows that fit in the widget are formatted and inserted; the
+    # scrollbar and mouse wheel move a window over source.get_expense_rows().
+    # The source is the tracker itself or a QueryResult.
+    def __init__(self, parent, **text_options):
+        super().__init__(parent)
+        self.text = tk.Text(self, wrap="none", state="disabled", **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical")
+        self.scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+        self.line_height = tkfont.Font(font=self.text["font"]).metrics("linespace")
+        self.source = None
+        self.top = 0
+        # Clicked row (a dict with its "id"); on_activate(row) runs on double-click
+        self.selected = None
+        self.on_activate = None
+        self.text.tag_configure("selected", background="#cfe2f7")
+        self.text.bind("<Configure>", lambda e: self.render())
+        self.text.bind("<Button-1>", self.on_click)
+        self.text.bind("<Double-Button-1>", self.on_double_click)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.text.bind(sequence, self.on_wheel)
+
+    @staticmethod
+    def format_row(exp):
+        return f"{exp['date']} | {exp['description']:20} | {exp['category']:12} | ${exp['amount']:.2f}\n"
+
+    def page_size(self):
+        height = self.text.winfo_height()
+        if height <= 1:
+            return int(self.text["height"])
+        return max(1, height // self.line_height)
+
+    def show_lines(self, lines):
+        # Short static text (summaries): let the Text widget scroll itself
+        self.source = None
+        self.selected = None
+        self.scrollbar.config(command=self.text.yview)
+        self.text.config(yscrollcommand=self.scrollbar.set, state="normal")
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "".join(lines))
+        self.text.config(state="disabled")
+
+    def show_rows(self, source):
+        if source is not self.source:
+            self.selected = None
+        self.source = source
+        self.top = 0
+        self.scrollbar.config(command=self.on_scrollbar)
+        self.text.config(yscrollcommand="")
+        self.render()
+
+    @instrumented("gui.render_rows")
+    def render(self):
+        if self.source is None:
+            return
+        total = self.source.count()
+        page = self.page_size()
+        self.top = max(0, min(self.top, total - page))
+        rows = self.source.get_expense_rows(self.top, self.top + page)
+        self.text.config(state="normal")
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "".join(self.format_row(exp) for exp in rows))
+        if self.selected is not None:
+            for line, exp in enumerate(rows, 1):
+                if exp["id"] == self.selected["id"]:
+                    self.text.tag_add("selected", f"{line}.0", f"{line + 1}.0")
+        self.text.config(state="disabled")
+        self.update_scrollbar(total, len(rows))
+
+    def row_at(self, event):
+        if self.source is None:
+            return None
+        index = self.top + int(self.text.index(f"@{event.x},{event.y}").split(".")[0]) - 1
+        rows = self.source.get_expense_rows(index, index + 1)
+        return rows[0] if rows else None
+
+    def on_click(self, event):
+        row = self.row_at(event)
+        if row is None:
+            return None
+        self.selected = row
+        self.text.tag_remove("selected", "1.0", tk.END)
+        line = self.text.index(f"@{event.x},{event.y}").split(".")[0]
+        self.text.tag_add("selected", f"{line}.0", f"{int(line) + 1}.0")
+        return "break"
+
+    def on_double_click(self, event):
+        row = self.row_at(event)
+        if row is not None and self.on_activate is not None:
+            self.selected = row
+            self.on_activate(row)
+        return "break"
+
+    def update_scrollbar(self, total, shown):
+        if total:
+            self.scrollbar.set(self.top / total, (self.top + shown) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, top):
+        total = self.source.count()
+        top = max(0, min(top, total - self.page_size()))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * self.source.count()))
+        elif action == "scroll":
+            step = self.page_size() if unit == "pages" else 1
+            self.scroll_to(self.top + int(value) * step)
+
+    def on_wheel(self, event):
+        if self.source is None:
+            return None
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.top - 3)
+        else:
+            self.scroll_to(self.top + 3)
+        return "break"
+
+    def row_added(self, count=1):
+        # The new rows are the last ones; touch the widget only if they land in the window
+        total = self.source.count()
+        page = self.page_size()
+        index = total - count
+        if index < self.top + page:
+            rows = self.source.get_expense_rows(index, min(total, self.top + page))
+            self.edit(lambda: self.text.insert(tk.END, "".join(self.format_row(exp) for exp in rows)))
+        elif index == self.top + page and count > 1:
+            # Window was showing the tail: follow it down
+            self.top = total - page
+            self.render()
+            return
+        elif index == self.top + page:
+            # Window was showing the tail: follow it down by one row
+            self.top += 1
+            self.edit(lambda: (self.text.delete("1.0", "2.0"),
+                               self.text.insert(tk.END, self.format_row(self.source.get_expense_rows(index, total)[0]))))
+        self.update_scrollbar(total, min(page, total - self.top))
+
+    def row_removed(self):
+        # The removed row was the last one (index == new total)
+        total = self.source.count()
+        if self.top <= total < self.top + self.page_size():
+            line = total - self.top + 1
+            self.edit(lambda: self.text.delete(f"{line}.0", f"{line + 1}.0"))
+            if self.top > 0:
+                self.top -= 1
+                self.edit(lambda: self.text.insert("1.0", self.format_row(self.source.get_expense_rows(self.top, self.top + 1)[0])))
+        self.update_scrollbar(total, min(self.page_size(), total - self.top))
+
+    def edit(self, change):
+        self.text.config(state="normal")
+        change()
+        self.text.config(state="disabled")
+
+class EditExpenseDialog(simpledialog.Dialog):
+    # result is the edited fields, or None when cancelled
+    def __init__(self, parent, expense, categories):
+        self.expense = expense
+        self.categories = categories
+        super().__init__(parent, "Edit Expense")
+
+    def body(self, master):
+        self.entries = {}
+        for row, (key, label) in enumerate([("description", "Description:"), ("amount", "Amount:"),
+                                            ("category", "Category:"), ("date", "Date:")]):
+            ttk.Label(master, text=label).grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            if key == "category":
+                entry = ttk.Combobox(master, values=self.categories, state="readonly")
+                entry.set(self.expense["category"])
+            else:
+                entry = ttk.Entry(master, width=30)
+                entry.insert(0, str(self.expense[key]))
+            entry.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            self.entries[key] = entry
+        return self.entries["description"]
+
+    def validate(self):
+        try:
+            self.values = {
+                "description": self.entries["description"].get().strip(),
+                "amount": parse_csv_amount(self.entries["amount"].get()),
+                "category": self.entries["category"].get(),
+                "date": parse_csv_date(self.entries["date"].get())
+            }
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=self)
+            return False
+        if not self.values["description"]:
+            messagebox.showerror("Error", "All fields required", parent=self)
+            return False
+        return True
+
+    def apply(self):
+        self.result = self.values
+
+class BudgetDialog(simpledialog.Dialog):
+    # result is {category: monthly limit}; categories left blank have no budget
+    def __init__(self, parent, categories, budgets):
+        self.categories = list(categories) + [c for c in budgets if c not in categories]
+        self.budgets = budgets
+        super().__init__(parent, "Monthly Budgets")
+
+    def body(self, master):
+        self.entries = {}
+        for row, category in enumerate(self.categories):
+            ttk.Label(master, text=f"{category}:").grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            entry = ttk.Entry(master, width=12)
+            if category in self.budgets:
+                entry.insert(0, f"{self.budgets[category]:.2f}")
+            entry.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            self.entries[category] = entry
+        return next(iter(self.entries.values()), None)
+
+    def validate(self):
+        self.values = {}
+        for category, entry in self.entries.items():
+            text = entry.get().strip()
+            if not text:
+                continue
+            try:
+                limit = parse_csv_amount(text)
+            except ValueError:
+                limit = 0
+            if limit <= 0:
+                messagebox.showerror("Error", f"Invalid budget for {category}", parent=self)
+                return False
+            self.values[category] = limit
+        return True
+
+    def apply(self):
+        self.result = self.values
+
+class DiagnosticsWindow(tk.Toplevel):
+    # Live view of DIAGNOSTICS; the report can be saved as JSON next to the user's data
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, report_dir):
+        super().__init__(parent)
+        self.title("Diagnostics")
+        self.report_dir = report_dir
+        self.enabled = tk.BooleanVar(value=DIAGNOSTICS.enabled)
+        toolbar = ttk.Frame(self)
+        toolbar.pack(fill="x", padx=5, pady=5)
+        ttk.Checkbutton(toolbar, text="Enabled", variable=self.enabled, command=self.toggle).pack(side="left", padx=2)
+        ttk.Button(toolbar, text="Reset", command=self.reset).pack(side="left", padx=2)
+        ttk.Button(toolbar, text="Profile Next Action", command=self.arm_profile).pack(side="left", padx=2)
+        ttk.Button(toolbar, text="Save Report", command=self.save_report).pack(side="left", padx=2)
+        self.text = tk.Text(self, width=110, height=30, bg='#f0f6fb', font=('Consolas', 10), wrap="none")
+        self.text.pack(fill="both", expand=True)
+        self.refresh_job = None
+        self.refresh()
+
+    def toggle(self):
+        DIAGNOSTICS.enabled = self.enabled.get()
+        self.refresh()
+
+    def reset(self):
+        DIAGNOSTICS.reset()
+        self.refresh()
+
+    def arm_profile(self):
+        # Profiling only happens while diagnostics are on
+        self.enabled.set(True)
+        DIAGNOSTICS.enabled = True
+        DIAGNOSTICS.profile_next = True
+        self.refresh()
+
+    def save_report(self):
+        path = os.path.join(self.report_dir, f"diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            DIAGNOSTICS.dump(path)
+        except Exception as e:
+            messagebox.showerror("Error", str(e), parent=self)
+            return
+        messagebox.showinfo("Diagnostics", f"Saved report to {path}", parent=self)
+
+    def refresh(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+        report = DIAGNOSTICS.report()
+        state = "on" if report["enabled"] else "off"
+        if DIAGNOSTICS.profile_next:
+            state += ", profiling the next action"
+        lines = [f"Diagnostics {state}\n\n",
+                 f"{'Operation':28} {'Calls':>7} {'Mean ms':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'Max ms':>9} {'Rows':>10} {'Bytes':>12}\n"]
+        for name, op in report["operations"].items():
+            lines.append(f"{name:28} {op['calls']:7} {op['mean_ms']:9.2f} {op['p50_ms']:8} {op['p95_ms']:8} "
+                         f"{op['p99_ms']:8} {op['max_ms']:9.2f} {op['rows']:10} {op['bytes']:12}\n")
+        if report["profile"]:
+            lines.append(f"\nProfile of {report['profile']['operation']} at {report['profile']['captured']}:\n")
+            lines.append(report["profile"]["stats"])
+        top = self.text.yview()[0]
+        self.text.config(state="normal")
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "".join(lines))
+        self.text.config(state="disabled")
+        self.text.yview_moveto(top)
+        self.refresh_job = self.after(self.REFRESH_MS, self.refresh)
+
+    def destroy(self):
+        self.after_cancel(self.refresh_job)
+        super().destroy()
+
 # ---------- Expense Tracker GUI ----------
 class ExpenseTrackerGUI(ttk.Frame):
+    # Rapid adds/deletes within this window are written together
+    SAVE_DELAY_MS = 500
+    # Undo keeps this many of the latest changes
+    UNDO_LIMIT = 50
+    # How often to look for changes another window or a cli.py job made
+    CHANGES_MS = 2000
+
     def __init__(self, parent, storage, user_id):
         super().__init__(parent)
         self.parent = parent
         self.storage = storage
-        self.tracker = ExpenseTracker(storage)
+        self.tracker = None
         self.user_id = user_id
         self.pack(fill="both", expand=True)
         self.categories = self.storage.load_categories()
         self.chart_img = None
+        self.chart_cache = {}
+        self.figure = None
+        self.figure_lock = threading.Lock()
+        self.runner = TaskRunner(self, self.show_busy)
+        # Filled by the tracker (possibly on a worker thread) and shown by show_budget_alerts
+        self.budget_alerts = []
+        # (undo, redo) pairs of callables
+        self.undo_stack = deque(maxlen=self.UNDO_LIMIT)
+        self.redo_stack = []
+        self.changes_id = None
+        # Redraws the summary on display (see show_changes), if one is
+        self.lines_view = None
         self.setup_gui()
+        self.parent.protocol("WM_DELETE_WINDOW", self.close)
+        self.parent.bind("<Control-z>", lambda e: self.undo())
+        self.parent.bind("<Control-y>", lambda e: self.redo())
+        self.set_actions_enabled(False)
+        self.runner.submit("load", lambda progress: ExpenseTracker(storage), self.on_tracker_loaded, self.show_task_error)
+
+    def on_tracker_loaded(self, tracker):
+        self.tracker = tracker
+        self.tracker.autoflush = False
+        self.tracker.on_budget_alert = self.budget_alerts.append
+        self.set_actions_enabled(True)
+        self.changes_id = self.after(self.CHANGES_MS, self.poll_changes)
 
     # ---------- GUI Components ----------
     def setup_gui(self):
@@ -298,6 +4463,11 @@ class ExpenseTrackerGUI(ttk.Frame):
         ttk.Label(header_frame, text=f"User: {self.user_id} | Developed by Isaiah Toomey", style="SubHeader.TLabel").pack(side="left", padx=10)
         ttk.Button(header_frame, text="Logout", command=self.logout).pack(side="right", padx=5)
         ttk.Button(header_frame, text="Change PIN", command=self.change_pin).pack(side="right", padx=5)
+        ttk.Button(header_frame, text="Diagnostics", command=self.show_diagnostics).pack(side="right", padx=5)
+        self.action_buttons = []
+        self.add_action(ttk.Button(header_frame, text="Redo", command=self.redo)).pack(side="right", padx=5)
+        self.add_action(ttk.Button(header_frame, text="Undo", command=self.undo)).pack(side="right", padx=5)
+        self.progress = ttk.Progressbar(header_frame, length=120, mode="indeterminate")
 
         # Main Frames
         main_frame = ttk.Frame(self)
@@ -323,30 +4493,116 @@ class ExpenseTrackerGUI(ttk.Frame):
         self.new_cat_entry = ttk.Entry(add_frame)
         self.new_cat_entry.grid(row=3, column=1, sticky="ew")
         ttk.Button(add_frame, text="Add Category", command=self.add_category).grid(row=4, column=0, columnspan=2, pady=5)
-        ttk.Button(add_frame, text="Add Expense", command=self.add_expense).grid(row=5, column=0, columnspan=2, pady=5)
+        self.add_action(ttk.Button(add_frame, text="Add Expense", command=self.add_expense)).grid(row=5, column=0, columnspan=2, pady=5)
 
         # Actions
         action_frame = ttk.LabelFrame(main_frame, text="📊 Actions", padding=10)
         action_frame.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
         action_frame.columnconfigure(0, weight=1)
-        ttk.Button(action_frame, text="View All Expenses", command=self.view_expenses).grid(row=0, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Summary by Category", command=self.view_summary).grid(row=1, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Monthly Summary", command=self.view_monthly_summary).grid(row=2, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Delete Last Expense", command=self.delete_last_expense).grid(row=3, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Export CSV", command=self.export_csv).grid(row=4, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Category Pie Chart", command=self.chart_category_pie).grid(row=5, column=0, sticky="ew", pady=2)
-        ttk.Button(action_frame, text="Monthly Bar Chart", command=self.chart_monthly_bar).grid(row=6, column=0, sticky="ew", pady=2)
-
-        # Display Text
-        self.display_text = tk.Text(self, height=18, bg='#f0f6fb', font=('Consolas', 12))
-        self.display_text.pack(fill="both", expand=True, padx=10, pady=5)
+        self.add_action(ttk.Button(action_frame, text="View All Expenses", command=self.view_expenses)).grid(row=0, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Summary by Category", command=self.view_summary)).grid(row=1, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Monthly Summary", command=self.view_monthly_summary)).grid(row=2, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Delete Last Expense", command=self.delete_last_expense)).grid(row=3, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Export CSV", command=self.export_csv)).grid(row=4, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Import CSV", command=self.import_csv)).grid(row=5, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Category Pie Chart", command=self.chart_category_pie)).grid(row=6, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Monthly Bar Chart", command=self.chart_monthly_bar)).grid(row=7, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Edit Selected", command=self.edit_expense)).grid(row=8, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Delete Selected", command=self.delete_expense)).grid(row=9, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Budgets", command=self.edit_budgets)).grid(row=10, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Spending Trends", command=self.view_trends)).grid(row=11, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Rolling 30-Day Chart", command=self.chart_rolling)).grid(row=12, column=0, sticky="ew", pady=2)
+        self.add_action(ttk.Button(action_frame, text="Month Forecast Chart", command=self.chart_forecast)).grid(row=13, column=0, sticky="ew", pady=2)
+
+        # Filter
+        filter_frame = ttk.LabelFrame(self, text="🔍 Filter", padding=5)
+        filter_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(filter_frame, text="From:").pack(side="left")
+        self.filter_start = ttk.Entry(filter_frame, width=11)
+        self.filter_start.pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="To:").pack(side="left")
+        self.filter_end = ttk.Entry(filter_frame, width=11)
+        self.filter_end.pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="Category:").pack(side="left")
+        self.filter_category = ttk.Combobox(filter_frame, values=[""] + self.categories, state="readonly", width=12)
+        self.filter_category.pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="Min:").pack(side="left")
+        self.filter_min = ttk.Entry(filter_frame, width=8)
+        self.filter_min.pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="Max:").pack(side="left")
+        self.filter_max = ttk.Entry(filter_frame, width=8)
+        self.filter_max.pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="Text:").pack(side="left")
+        self.filter_text = ttk.Entry(filter_frame, width=16)
+        self.filter_text.pack(side="left", padx=(0, 5))
+        self.filter_text.bind("<Return>", lambda e: self.search_expenses())
+        self.add_action(ttk.Button(filter_frame, text="Search", command=self.search_expenses)).pack(side="left", padx=2)
+        self.add_action(ttk.Button(filter_frame, text="Clear", command=self.clear_filter)).pack(side="left", padx=2)
+        self.filter_status = ttk.Label(filter_frame, text="")
+        self.filter_status.pack(side="left", padx=5)
+        self.active_query = None
+
+        # Display
+        self.display = ExpenseListView(self, height=18, bg='#f0f6fb', font=('Consolas', 12))
+        self.display.pack(fill="both", expand=True, padx=10, pady=5)
+        self.display.on_activate = lambda row: self.edit_expense()
 
         # Chart
         self.chart_label = ttk.Label(self)
         self.chart_label.pack(pady=5)
 
+    def add_action(self, button):
+        # Buttons that need the tracker; disabled until it has loaded
+        self.action_buttons.append(button)
+        return button
+
+    def set_actions_enabled(self, enabled):
+        self.actions_enabled = enabled
+        for button in self.action_buttons:
+            button.state(["!disabled"] if enabled else ["disabled"])
+
+    def show_busy(self, busy, fraction):
+        if not busy:
+            self.progress.stop()
+            self.progress.pack_forget()
+            return
+        if not self.progress.winfo_ismapped():
+            self.progress.pack(side="right", padx=5)
+        if fraction is None:
+            if str(self.progress["mode"]) != "indeterminate":
+                self.progress.config(mode="indeterminate", value=0)
+            self.progress.start(15)
+        else:
+            self.progress.stop()
+            self.progress.config(mode="determinate", value=fraction * 100)
+
+    def show_task_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def schedule_save(self):
+        self.runner.debounce("save", self.SAVE_DELAY_MS, self.tracker.prepare_commit, self.show_task_error)
+
+    def close(self):
+        self.shutdown()
+        self.parent.destroy()
+
+    def shutdown(self):
+        # Write anything still waiting on the save timer before the tracker goes away
+        if self.changes_id is not None:
+            self.after_cancel(self.changes_id)
+            self.changes_id = None
+        self.runner.close([("save", self.tracker.prepare_commit)] if self.tracker else [])
+        self.storage.close()
+        self.parent.protocol("WM_DELETE_WINDOW", self.parent.destroy)
+        self.parent.unbind("<Control-z>")
+        self.parent.unbind("<Control-y>")
+
     # ---------- Functional Methods ----------
+    def show_diagnostics(self):
+        DiagnosticsWindow(self, self.storage.user_dir)
+
     def logout(self):
+        self.shutdown()
         self.destroy()
         main(self.parent)
 
@@ -368,10 +4624,13 @@ class ExpenseTrackerGUI(ttk.Frame):
 
     def add_category(self):
         cat = self.new_cat_entry.get().strip()
+        # Read again first, so the save keeps categories another instance added
+        self.categories = self.storage.load_categories()
         if cat and cat not in self.categories:
             self.categories.append(cat)
             self.category_entry['values'] = self.categories
             self.category_entry.set(cat)
+            self.filter_category['values'] = [""] + self.categories
             self.storage.save_categories(self.categories)
             messagebox.showinfo("Category", f"Added '{cat}'")
         else:
@@ -386,91 +4645,434 @@ class ExpenseTrackerGUI(ttk.Frame):
             messagebox.showerror("Error", "All fields required")
             return
         try:
-            amt = float(amt)
-        except:
-            messagebox.showerror("Error", "Invalid amount")
+            amt = parse_csv_amount(amt)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
-        self.tracker.add_expense(desc, amt, cat)
-        messagebox.showinfo("Success", "Expense added")
+        expense = self.tracker.get_expense(self.tracker.add_expense(desc, amt, cat))
+        self.push_undo(lambda: self.tracker.delete_expense(expense["id"]), lambda: self.tracker.restore_expense(expense))
+        self.schedule_save()
+        if not self.show_budget_alerts("Expense added"):
+            messagebox.showinfo("Success", "Expense added")
         self.desc_entry.delete(0, tk.END)
         self.amount_entry.delete(0, tk.END)
         self.category_entry.set(self.categories[0])
-        self.view_expenses()
+        if self.display.source is self.tracker:
+            if self.storage.backend.appends_in_order:
+                self.display.row_added()
+            else:
+                self.display.render()
+        elif self.active_query is not None and self.display.source is not None:
+            self.run_query(self.active_query, keep_position=True)
+        else:
+            self.view_expenses()
 
+    @instrumented("gui.view_expenses", lambda _, self: (self.tracker.count(), None))
     def view_expenses(self):
-        self.display_text.delete(1.0, tk.END)
-        for exp in self.tracker.get_expenses():
-            self.display_text.insert(tk.END, f"{exp['date']} | {exp['description']:20} | {exp['category']:12} | ${exp['amount']:.2f}\n")
+        self.display.show_rows(self.tracker)
+
+    def read_filter(self):
+        # Returns the query options, or None after telling the user what is wrong
+        options = {"start": self.filter_start.get().strip() or None, "end": self.filter_end.get().strip() or None,
+                   "categories": [self.filter_category.get()] if self.filter_category.get() else None,
+                   "text": self.filter_text.get().strip() or None}
+        for key in ("start", "end"):
+            if options[key]:
+                try:
+                    datetime.strptime(options[key], "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Error", "Dates must be YYYY-MM-DD")
+                    return None
+        for key, entry in (("min_amount", self.filter_min), ("max_amount", self.filter_max)):
+            value = entry.get().strip()
+            try:
+                options[key] = float(value) if value else None
+            except ValueError:
+                messagebox.showerror("Error", "Invalid amount")
+                return None
+        return options
+
+    def search_expenses(self):
+        # Also reachable with Enter in the text box, so check the buttons aren't disabled
+        if not self.actions_enabled:
+            return
+        options = self.read_filter()
+        if options is None:
+            return
+        self.active_query = options
+        self.run_query(options)
+
+    def run_query(self, options, keep_position=False):
+        # Searches on a worker; a newer search replaces one still running
+        started = time.perf_counter()
+        work = self.tracker.prepare_query(**options)
+        def done(result):
+            # Dropped if the filter was cleared or the list replaced meanwhile
+            if options is not self.active_query or (keep_position and self.display.source is None):
+                return
+            elapsed = (time.perf_counter() - started) * 1000
+            top = self.display.top
+            self.display.show_rows(result)
+            if keep_position:
+                self.display.scroll_to(top)
+            self.filter_status.config(text=f"{result.count()} matches in {elapsed:.1f} ms")
+        self.runner.submit("query", lambda progress: work(), done, self.show_task_error)
+
+    def clear_filter(self):
+        for entry in (self.filter_start, self.filter_end, self.filter_min, self.filter_max, self.filter_text):
+            entry.delete(0, tk.END)
+        self.filter_category.set("")
+        self.filter_status.config(text="")
+        self.active_query = None
+        self.view_expenses()
 
     def view_summary(self):
+        self.lines_view = self.view_summary
         summary = self.tracker.get_summary_by_category()
-        self.display_text.delete(1.0, tk.END)
-        self.display_text.insert(tk.END, "Category Summary:\n")
-        for cat, amt in summary.items():
-            self.display_text.insert(tk.END, f"{cat:12} | ${amt:.2f}\n")
+        self.display.show_lines(["Category Summary:\n"] + [f"{cat:12} | ${amt:.2f}\n" for cat, amt in summary.items()])
 
     def view_monthly_summary(self):
+        self.lines_view = self.view_monthly_summary
         summary = self.tracker.get_monthly_summary()
-        self.display_text.delete(1.0, tk.END)
-        self.display_text.insert(tk.END, "Monthly Summary:\n")
-        for month, amt in summary.items():
-            self.display_text.insert(tk.END, f"{month} | ${amt:.2f}\n")
+        self.display.show_lines(["Monthly Summary:\n"] + [f"{month} | ${amt:.2f}\n" for month, amt in summary.items()])
 
     def delete_last_expense(self):
+        last = self.tracker.last()
         if self.tracker.delete_last_expense():
+            self.push_undo(lambda: self.tracker.restore_expense(last), lambda: self.tracker.delete_expense(last["id"]))
+            self.schedule_save()
             messagebox.showinfo("Deleted", "Last expense removed")
-            self.view_expenses()
+            if self.display.source is self.tracker:
+                if self.storage.backend.appends_in_order:
+                    self.display.row_removed()
+                else:
+                    self.display.render()
+            elif self.active_query is not None and self.display.source is not None:
+                self.run_query(self.active_query, keep_position=True)
+            else:
+                self.view_expenses()
         else:
             messagebox.showwarning("None", "No expense to delete")
 
+    def edit_expense(self):
+        # Also reachable by double-clicking a row
+        if not self.actions_enabled:
+            return
+        row = self.display.selected
+        if row is None:
+            messagebox.showwarning("None", "Select an expense in the list first")
+            return
+        dialog = EditExpenseDialog(self, row, self.categories)
+        if dialog.result is None:
+            return
+        old = self.tracker.update_expense(row["id"], **dialog.result)
+        if old is None:
+            messagebox.showwarning("None", "That expense no longer exists")
+            return
+        new = self.tracker.get_expense(row["id"])
+        self.display.selected = new
+        self.push_undo(lambda: self.tracker.update_expense(old["id"], **self.expense_fields(old)),
+                       lambda: self.tracker.update_expense(new["id"], **self.expense_fields(new)))
+        self.schedule_save()
+        self.refresh_rows()
+        self.show_budget_alerts()
+
+    def delete_expense(self):
+        row = self.display.selected
+        if row is None:
+            messagebox.showwarning("None", "Select an expense in the list first")
+            return
+        if not messagebox.askyesno("Delete", f"Delete '{row['description']}' (${row['amount']:.2f})?"):
+            return
+        removed = self.tracker.delete_expense(row["id"])
+        if removed is None:
+            messagebox.showwarning("None", "That expense no longer exists")
+            return
+        self.display.selected = None
+        self.push_undo(lambda: self.tracker.restore_expense(removed), lambda: self.tracker.delete_expense(removed["id"]))
+        self.schedule_save()
+        self.refresh_rows()
+
+    @staticmethod
+    def expense_fields(expense):
+        return {key: expense[key] for key in ("description", "amount", "category", "date")}
+
+    def push_undo(self, undo, redo):
+        self.undo_stack.append((undo, redo))
+        self.redo_stack.clear()
+
+    def undo(self):
+        # Also reachable from the keyboard, so check the buttons aren't disabled
+        if not self.actions_enabled or not self.undo_stack:
+            return
+        undo, redo = self.undo_stack.pop()
+        undo()
+        self.redo_stack.append((undo, redo))
+        self.schedule_save()
+        self.refresh_rows()
+        self.show_budget_alerts()
+
+    def redo(self):
+        if not self.actions_enabled or not self.redo_stack:
+            return
+        undo, redo = self.redo_stack.pop()
+        redo()
+        self.undo_stack.append((undo, redo))
+        self.schedule_save()
+        self.refresh_rows()
+        self.show_budget_alerts()
+
+    def show_budget_alerts(self, message=None):
+        # One warning for every category a change took over budget; False if there were none
+        alerts = list(self.budget_alerts)
+        self.budget_alerts.clear()
+        if not alerts:
+            return False
+        latest = {(alert["category"], alert["month"]): alert for alert in alerts}
+        lines = [f"{a['category']} is over its {a['month']} budget: ${a['spent']:.2f} of ${a['budget']:.2f}"
+                 for a in latest.values()]
+        messagebox.showwarning("Budget Exceeded", "\n\n".join(([message] if message else []) + ["\n".join(lines)]))
+        return True
+
+    def edit_budgets(self):
+        dialog = BudgetDialog(self, self.categories, self.tracker.budgets)
+        if dialog.result is None:
+            return
+        self.tracker.set_budgets(dialog.result)
+        self.view_trends()
+
+    def with_analytics(self, show):
+        # The first view that needs the analytics builds them on a worker, then
+        # show() runs here; a change made during the build starts it again
+        work = self.tracker.prepare_analytics()
+        if work is None:
+            show()
+            return
+        def done(built):
+            if self.tracker.install_analytics(built):
+                show()
+            else:
+                self.with_analytics(show)
+        self.runner.submit("analytics", lambda progress: work(), done, self.show_task_error)
+
+    def view_trends(self):
+        self.lines_view = self.view_trends
+        self.with_analytics(self.show_trends)
+
+    def show_trends(self):
+        if self.lines_view != self.view_trends:
+            return
+        today = datetime.now().toordinal()
+        spending = self.tracker.get_analytics().spending(today)
+        lines = ["Spending Trends:\n",
+                 f"Today               | ${spending['today']:.2f}\n",
+                 f"Last 7 days         | ${spending['last_7_days']:.2f}\n",
+                 f"Last 30 days        | ${spending['last_30_days']:.2f}\n",
+                 f"This month so far   | ${spending['month_to_date']:.2f}\n",
+                 f"Projected month end | ${spending['projected_month']:.2f}\n"]
+        status = self.tracker.budget_status()
+        if not status:
+            lines.append("\nNo budgets set. Use Budgets to add monthly limits.\n")
+        else:
+            lines.append("\nBudgets This Month:\n")
+            for s in status:
+                note = "  OVER" if s["over"] else "  on track to exceed" if s["projected_over"] else ""
+                lines.append(f"{s['category']:12} | ${s['spent']:.2f} of ${s['budget']:.2f} | "
+                             f"projected ${s['projected']:.2f}{note}\n")
+        self.display.show_lines(lines)
+
+    def poll_changes(self):
+        # Another window or a cli.py job may be writing to this user's data.
+        # Skipped while this one has changes of its own waiting to be written
+        # (their save picks up the others' anyway) or an import is running,
+        # and never waits for the lock.
+        self.changes_id = self.after(self.CHANGES_MS, self.poll_changes)
+        if not self.actions_enabled or self.tracker.dirty:
+            return
+        last = self.tracker.last()
+        try:
+            ops = self.tracker.reload_changes(wait=False)
+        except Exception as e:
+            print("Error reading changes:", e)
+            return
+        if ops == []:
+            return
+        categories = self.storage.load_categories()
+        if categories != self.categories:
+            self.categories = categories
+            self.category_entry['values'] = self.categories
+            self.filter_category['values'] = [""] + self.categories
+        self.show_changes(ops, last)
+
+    def show_changes(self, ops, last):
+        # Rows added after the last one only need appending to the list;
+        # anything else redraws whatever is showing
+        if self.display.source is self.tracker:
+            appended = (ops is not None and self.storage.backend.appends_in_order
+                        and all(op["op"] == "add" and (last is None or op["expense"]["id"] > last["id"]) for op in ops))
+            if appended:
+                self.display.row_added(len(ops))
+            else:
+                self.display.render()
+        elif self.active_query is not None and self.display.source is not None:
+            self.run_query(self.active_query, keep_position=True)
+        elif self.display.source is None and self.lines_view is not None:
+            self.lines_view()
+
+    def refresh_rows(self):
+        # Redraws whichever row list is showing after an edit, delete or undo
+        if self.display.source is self.tracker:
+            self.display.render()
+        elif self.active_query is not None and self.display.source is not None:
+            self.run_query(self.active_query, keep_position=True)
+        else:
+            self.view_expenses()
+
     def export_csv(self):
         filename = os.path.join(self.storage.user_dir, f"expenses_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-        with open(filename, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=["date", "description", "amount", "category"])
-            writer.writeheader()
-            writer.writerows(self.tracker.get_expenses())
-        messagebox.showinfo("CSV Exported", f"Saved to {filename}")
+        rows = self.tracker.snapshot()
+        total = self.tracker.count()
+        self.runner.submit("export", lambda progress: export_expenses_csv(filename, rows, progress, total),
+                           lambda count: messagebox.showinfo("CSV Exported", f"Saved {count} expenses to {filename}"),
+                           self.show_task_error)
+
+    def import_csv(self):
+        path = filedialog.askopenfilename(title="Import CSV", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        # Runs on the writer thread, behind any save still queued there
+        self.runner.write("save", self.tracker.prepare_commit, self.show_task_error)
+        self.set_actions_enabled(False)
+        def done(result):
+            self.set_actions_enabled(True)
+            self.categories = self.storage.load_categories()
+            self.category_entry['values'] = self.categories
+            self.filter_category['values'] = [""] + self.categories
+            self.view_expenses()
+            message = f"Imported {result['imported']} expenses"
+            if result["skipped"]:
+                first = "\n".join(f"Line {line}: {error}" for line, error in result["errors"][:5])
+                message += f"\nSkipped {result['skipped']} invalid rows:\n{first}"
+            if not self.show_budget_alerts(message):
+                messagebox.showinfo("CSV Import", message)
+        def failed(error):
+            self.set_actions_enabled(True)
+            self.view_expenses()
+            self.show_task_error(error)
+        self.runner.submit("import", lambda progress: self.tracker.import_csv(path, progress), done, failed, writer=True)
 
     def chart_category_pie(self):
         summary = self.tracker.get_summary_by_category()
         if not summary:
             messagebox.showwarning("No Data", "No expenses to chart")
             return
-        fig, ax = plt.subplots()
-        ax.pie(summary.values(), labels=summary.keys(), autopct='%1.1f%%', startangle=90)
-        ax.axis('equal')
-        self.show_chart(fig)
+        def draw(ax):
+            ax.pie(list(summary.values()), labels=list(summary.keys()), autopct='%1.1f%%', startangle=90)
+            ax.axis('equal')
+        self.show_chart("category_pie", draw)
 
     def chart_monthly_bar(self):
         summary = self.tracker.get_monthly_summary()
         if not summary:
             messagebox.showwarning("No Data", "No expenses to chart")
             return
-        months = list(summary.keys())
-        amounts = list(summary.values())
-        fig, ax = plt.subplots()
-        ax.bar(months, amounts)
-        ax.set_ylabel("Amount ($)")
-        ax.set_title("Monthly Expenses")
-        plt.xticks(rotation=45)
-        self.show_chart(fig)
-
-    def show_chart(self, fig):
-        plt.tight_layout()
-        chart_path = os.path.join(self.storage.user_dir, "temp_chart.png")
-        fig.savefig(chart_path)
-        plt.close(fig)
-        img = Image.open(chart_path)
-        img.thumbnail((500,300))
-        self.chart_img = ImageTk.PhotoImage(img)
-        self.chart_label.config(image=self.chart_img)
+        def draw(ax):
+            ax.bar(list(summary.keys()), list(summary.values()))
+            ax.set_ylabel("Amount ($)")
+            ax.set_title("Monthly Expenses")
+            ax.tick_params(axis="x", labelrotation=45)
+        self.show_chart("monthly_bar", draw)
+
+    def chart_rolling(self):
+        if not self.tracker.count():
+            messagebox.showwarning("No Data", "No expenses to chart")
+            return
+        self.with_analytics(self.draw_rolling)
+
+    def draw_rolling(self):
+        today = datetime.now().toordinal()
+        series = self.tracker.get_analytics().rolling(today - 89, today)
+        labels = [datetime.fromordinal(day).strftime("%m-%d") for day, total in series]
+        totals = [total for day, total in series]
+        def draw(ax):
+            ax.plot(range(len(totals)), totals)
+            ax.fill_between(range(len(totals)), totals, alpha=0.2)
+            ax.set_xticks(range(0, len(labels), 15), labels[::15])
+            ax.set_ylabel("Amount ($)")
+            ax.set_title("Rolling 30-Day Spending")
+        self.show_chart(("rolling_30", today), draw)
+
+    def chart_forecast(self):
+        if not self.tracker.count():
+            messagebox.showwarning("No Data", "No expenses to chart")
+            return
+        self.with_analytics(self.draw_forecast)
+
+    def draw_forecast(self):
+        analytics = self.tracker.get_analytics()
+        today = datetime.now().toordinal()
+        first, last = analytics.month_bounds(today)
+        # With budgets set, only the budgeted categories are charted, against their combined limit
+        categories = list(self.tracker.budgets) or [None]
+        spent = [sum(values) for values in zip(*[[total for day, total in analytics.cumulative(first, today, category)]
+                                                   for category in categories])]
+        projected = sum(analytics.projection(today, category) for category in categories)
+        budget = sum(self.tracker.budgets.values())
+        title = datetime.fromordinal(today).strftime("%B %Y Forecast")
+        if budget:
+            title += " (budgeted categories)"
+        def draw(ax):
+            ax.plot(range(1, len(spent) + 1), spent, label="Spent")
+            ax.plot([len(spent), last - first + 1], [spent[-1], projected], linestyle="--", label="Projected")
+            if budget:
+                ax.axhline(budget, color="red", linestyle=":", label="Budgets")
+            ax.set_xlim(1, last - first + 1)
+            ax.set_xlabel("Day of month")
+            ax.set_ylabel("Amount ($)")
+            ax.set_title(title)
+            ax.legend(fontsize="small")
+        self.show_chart(("forecast", today, tuple(sorted(self.tracker.budgets.items()))), draw)
+
+    def show_chart(self, kind, draw):
+        # Charts are rendered in memory and cached until the tracker's data changes
+        key = (self.tracker.version, kind)
+        if key in self.chart_cache:
+            self.chart_img = self.chart_cache[key]
+            self.chart_label.config(image=self.chart_img)
+            return
+        @instrumented("show_chart", lambda png, progress: (None, len(png)))
+        def work(progress):
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            with self.figure_lock:
+                if self.figure is None:
+                    self.figure = Figure(figsize=(4, 3), dpi=100)
+                    FigureCanvasAgg(self.figure)
+                self.figure.clear()
+                draw(self.figure.add_subplot())
+                self.figure.tight_layout()
+                buf = io.BytesIO()
+                self.figure.savefig(buf, format="png")
+            return buf.getvalue()
+        def done(png):
+            # PhotoImage has to be created on the Tk thread
+            image = tk.PhotoImage(data=base64.b64encode(png))
+            self.chart_cache = {k: v for k, v in self.chart_cache.items() if k[0] == key[0]}
+            self.chart_cache[key] = image
+            self.chart_img = image
+            self.chart_label.config(image=self.chart_img)
+        # One key for all charts: only the most recent click gets displayed
+        self.runner.submit("chart", work, done, self.show_task_error)
 
 # ---------- Main ----------
 def main(root=None):
+    first_start = root is None
     if root is None:
+        mark_startup("imports")
         root = tk.Tk()
         root.title("BudgetBase v1.0.0")
         root.geometry("900x700")
+        mark_startup("tk root")
         setup_styles()
     # Show user selection screen
     def on_user_selected(user_id):
@@ -479,7 +5081,30 @@ def main(root=None):
     def on_login_success(storage, user_id):
         ExpenseTrackerGUI(root, storage, user_id)
     UserSelectScreen(root, on_user_selected)
+    if first_start:
+        # Set BUDGETBASE_STARTUP_REPORT=1 to print timings, or pass
+        # --startup-report to print them and exit once the first window is up
+        exit_after_report = "--startup-report" in sys.argv
+        def on_first_window():
+            mark_startup("first window")
+            if exit_after_report or os.environ.get("BUDGETBASE_STARTUP_REPORT"):
+                print(startup_report())
+            if exit_after_report:
+                root.destroy()
+            else:
+                preload_modules()
+        root.after_idle(on_first_window)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    # Needed by the household report's worker processes in the packaged .exe
+    import multiprocessing
+    multiprocessing.freeze_support()
+    if "--household-report" in sys.argv:
+        pins = read_household_pins(SecureStorage.list_users())
+        if pins is None:
+            print("Set BUDGETBASE_PINS to a JSON object of user to PIN when stdin is not a terminal", file=sys.stderr)
+            sys.exit(2)
+        print(json.dumps(household_report(pins), indent=2))
+    else:
+        main()
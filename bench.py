@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import app
+
+# Headless benchmarks for the storage and report paths of ExpenseTracker.
+#
+#   python bench.py --rows 10000 100000 --backends journal sqlite --output results.json
+#   python bench.py --rows 10000 100000 --compare results.json
+#
+# Every run builds its data in a temporary SecureStorage.BASE_DIR, so real
+# user data is never touched and no display is needed.
+
+DESCRIPTIONS = ["Coffee", "Groceries", "Rent", "Bus ticket", "Fuel", "Lunch", "Pharmacy",
+                "Cinema", "Electricity", "Internet", "Gym", "Books", "Taxi", "Dinner out"]
+
+
+def generate_expenses(rows, categories=8, days=365 * 3, seed=1):
+    # Date-ordered rows spread over `days` days ending today, like a real history
+    rng = random.Random(seed)
+    names = [f"Category {i + 1}" for i in range(categories)]
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    step = (end - start).total_seconds() / max(rows, 1)
+    for i in range(rows):
+        yield {
+            "date": (start + timedelta(seconds=int(i * step))).strftime("%Y-%m-%d %H:%M:%S"),
+            "description": rng.choice(DESCRIPTIONS),
+            "amount": round(rng.uniform(1, 250), 2),
+            "category": rng.choice(names)
+        }
+
+
+def write_dataset(storage, expenses):
+    # Streams straight to disk so multi-million row datasets never sit in memory as a list
+    backend = storage.backend
+    if isinstance(backend, app.SqliteBackend):
+        with backend.lock, backend.conn:
+            backend.conn.executemany(
+                "INSERT INTO expenses (date, description, amount, category) VALUES (?, ?, ?, ?)",
+                ((e["date"], e["description"], e["amount"], e["category"]) for e in expenses))
+            backend.add_tokens(backend.conn.execute("SELECT id, description FROM expenses").fetchall())
+        return
+    if isinstance(backend, (app.PartitionedBackend, app.BinaryBackend)):
+        backend.save(expenses)
+        return
+    with open(storage.data_file, "w") as f:
+        f.write("[")
+        for i, exp in enumerate(expenses):
+            f.write(("," if i else "") + json.dumps(exp))
+        f.write("]")
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def per_call(count, fn):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count
+
+
+def run_case(backend, rows, columnar, args):
+    base_dir = tempfile.mkdtemp(prefix="budgetbase_bench_")
+    app.SecureStorage.BASE_DIR = base_dir
+    try:
+        storage = app.SecureStorage("bench", backend=backend)
+        write_dataset(storage, generate_expenses(rows, args.categories, args.days, args.seed))
+        timings = {}
+        # First load has no aggregate cache yet, so it includes the rebuild
+        start = time.perf_counter()
+        tracker = app.ExpenseTracker(storage, columnar=columnar)
+        timings["first_load"] = time.perf_counter() - start
+        timings["load_expenses"] = best_of(args.repeat, tracker.load_expenses)
+        timings["rebuild_aggregates"] = best_of(args.repeat, tracker.rebuild_aggregates)
+        timings["get_summary_by_category"] = per_call(args.ops, tracker.get_summary_by_category)
+        timings["get_monthly_summary"] = per_call(args.ops, tracker.get_monthly_summary)
+        # First query builds the in-memory index; later ones reuse it
+        month_start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        timings["query_first"] = best_of(1, lambda: tracker.query(start=month_start).count())
+        timings["query_month"] = per_call(args.ops, lambda: tracker.query(start=month_start).count())
+        timings["query_text"] = per_call(args.ops, lambda: tracker.query(categories=["Category 1"], text="bus").count())
+        def build_analytics():
+            tracker.analytics = None
+            tracker.get_analytics()
+        timings["build_analytics"] = best_of(args.repeat, build_analytics)
+        today = datetime.now().toordinal()
+        timings["window_total"] = per_call(args.ops, lambda: tracker.get_analytics().window(today - 29, today, "Category 1"))
+        # The analytics stay built, so the changes below include keeping them up to date
+        timings["add_expense"] = per_call(args.ops, lambda: tracker.add_expense("Bench", 9.99, "Category 1"))
+        timings["delete_last_expense"] = per_call(args.ops, tracker.delete_last_expense)
+        # Edits and deletes in the middle of the history, by ID
+        middle = [row["id"] for row in tracker.get_expense_rows(rows // 2, rows // 2 + args.ops)]
+        ids = iter(middle)
+        timings["update_expense"] = per_call(len(middle), lambda: tracker.update_expense(next(ids), amount=1.0))
+        ids = iter(middle)
+        timings["delete_expense"] = per_call(len(middle), lambda: tracker.delete_expense(next(ids)))
+        tracker.autoflush = False
+        def batched_adds():
+            for _ in range(args.ops):
+                tracker.add_expense("Bench", 9.99, "Category 1")
+            tracker.flush()
+        timings["add_expense_batched"] = best_of(1, batched_adds) / args.ops
+        tracker.autoflush = True
+        export_path = os.path.join(base_dir, "export.csv")
+        timings["export_csv"] = best_of(args.repeat, lambda: tracker.export_csv(export_path))
+        storage.close()
+        return {"backend": backend, "rows": rows, "columnar": columnar, "timings": timings}
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def case_key(result):
+    return f"{result['backend']}/{result['rows']}/{'columnar' if result['columnar'] else 'rows'}"
+
+
+def compare(results, baseline, threshold, min_delta=0.0001):
+    # Flags every timing that got slower than the baseline by more than `threshold`;
+    # differences under min_delta seconds are noise on sub-millisecond operations
+    previous = {case_key(r): r["timings"] for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for op, seconds in result["timings"].items():
+            if op in old and old[op] > 0 and seconds > old[op] * (1 + threshold) and seconds - old[op] > min_delta:
+                regressions.append({"case": case_key(result), "op": op, "baseline": old[op],
+                                    "current": seconds, "ratio": seconds / old[op]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ExpenseTracker storage and report paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="dataset sizes to run (10k to 10M)")
+    parser.add_argument("--backends", nargs="+", default=["journal", "sqlite", "partitioned", "binary"], choices=sorted(app.BACKENDS))
+    parser.add_argument("--columnar", action="store_true", help="also run in-memory backends with ColumnarExpenses")
+    parser.add_argument("--categories", type=int, default=8, help="category cardinality")
+    parser.add_argument("--days", type=int, default=365 * 3, help="date span of the generated history")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the best is kept")
+    parser.add_argument("--ops", type=int, default=100, help="calls averaged for per-call timings")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --output run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        for backend in args.backends:
+            modes = [False, True] if args.columnar and app.BACKENDS[backend].in_memory else [False]
+            for columnar in modes:
+                result = run_case(backend, rows, columnar, args)
+                results.append(result)
+                print(case_key(result), json.dumps({op: round(s * 1000, 3) for op, s in result["timings"].items()}),
+                      "(ms)", file=sys.stderr)
+
+    report = {
+        "meta": {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "platform": platform.platform(), "categories": args.categories, "days": args.days,
+                 "seed": args.seed, "repeat": args.repeat, "ops": args.ops},
+        "results": results
+    }
+    if args.compare:
+        with open(args.compare, "r") as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold, args.min_delta_ms / 1000)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['case']} {regression['op']}: "
+              f"{regression['baseline'] * 1000:.3f} ms -> {regression['current'] * 1000:.3f} ms "
+              f"({regression['ratio']:.2f}x)", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+import argparse
+import getpass
+import json
+import os
+import sys
+from datetime import datetime
+
+from app import SecureStorage, ExpenseTracker, BACKENDS, DIAGNOSTICS, parse_csv_amount, parse_csv_date
+
+# Headless access to a user's expenses, for scripted ingestion and reports.
+# Everything is read as JSON lines and written as JSON lines.
+#
+#   BUDGETBASE_PIN=1234 python cli.py alice add < expenses.jsonl
+#   BUDGETBASE_PIN=1234 python cli.py alice add --csv statement.csv
+#   BUDGETBASE_PIN=1234 python cli.py alice query --start 2024-01-01 --category Food
+#   BUDGETBASE_PIN=1234 python cli.py alice query --text coffee --min 5 --limit 20
+#   BUDGETBASE_PIN=1234 python cli.py alice summary --by month
+#   BUDGETBASE_PIN=1234 python cli.py alice update 42 --amount 12.50 --category Food
+#   BUDGETBASE_PIN=1234 python cli.py alice delete 42
+#   BUDGETBASE_PIN=1234 python cli.py alice export out.csv --start 2024-01-01 --end 2024-12-31
+#   BUDGETBASE_PIN=1234 python cli.py alice batch < commands.jsonl
+#   BUDGETBASE_PIN=1234 python cli.py alice convert binary
+#   BUDGETBASE_PIN=1234 python cli.py alice budget --set Food 400
+#   BUDGETBASE_PIN=1234 python cli.py alice trends
+#
+# The PIN comes from BUDGETBASE_PIN, or is prompted for on a terminal.
+
+
+class CliError(Exception):
+    pass
+
+
+def check_record(record):
+    # JSON input can hold anything: fields must be strings, and amounts may also be numbers
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    for key in ("description", "category", "date"):
+        if record.get(key) is not None and not isinstance(record[key], str):
+            raise ValueError(f"'{key}' must be a string")
+    amount = record.get("amount")
+    if amount is not None and (isinstance(amount, bool) or not isinstance(amount, (int, float, str))):
+        raise ValueError("'amount' must be a number or a string")
+    return record
+
+
+def check_day(value):
+    # --start and --end are compared with stored dates as text, so they must be real YYYY-MM-DD days
+    if value is not None:
+        try:
+            datetime.strptime(value, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            raise ValueError(f"dates must be YYYY-MM-DD, not {value!r}")
+    return value
+
+
+def check_categories(value):
+    # A batch line may name one category as a string; the tracker wants a list
+    if value is None or (isinstance(value, list) and all(isinstance(c, str) for c in value)):
+        return value
+    if isinstance(value, str):
+        return [value]
+    raise ValueError("'category' must be a string or a list of strings")
+
+
+def check_limit(category, value):
+    # Same rule as the GUI's budget dialog: a positive amount
+    try:
+        limit = parse_csv_amount(value)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        raise CliError(f"Invalid budget for {category}: {value!r}")
+    return limit
+
+
+def day_argument(value):
+    try:
+        return check_day(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+class Session:
+    # One login, one load and one final save per process, however many operations run
+    def __init__(self, user, pin, backend=None):
+        if user not in SecureStorage.list_users():
+            raise CliError(f"Unknown user '{user}'")
+        self.storage = SecureStorage(user)
+        if not self.storage.pin_exists() or not self.storage.check_pin(pin):
+            raise CliError("Invalid PIN")
+        # --backend only confirms where the data is; moving it is the convert command's job
+        if backend is not None and backend != self.storage.backend_name:
+            raise CliError(f"'{user}' keeps expenses in the '{self.storage.backend_name}' backend; "
+                           f"run 'python cli.py {user} convert {backend}' to move them")
+        self.alerts = []
+        try:
+            self.tracker = ExpenseTracker(self.storage)
+        except Exception as e:
+            raise CliError(f"Could not load expenses: {e}")
+        self.tracker.autoflush = False
+        self.tracker.on_budget_alert = self.alerts.append
+        self.new_categories = []
+
+    def add(self, record):
+        check_record(record)
+        if record.get("amount") is None:
+            raise ValueError("missing 'amount'")
+        description = (record.get("description") or "").strip()
+        category = (record.get("category") or "").strip() or "Other"
+        amount = parse_csv_amount(str(record["amount"]))
+        date = parse_csv_date(record["date"]) if record.get("date") else None
+        self.tracker.add_expense(description, amount, category, date)
+        if category not in self.new_categories:
+            self.new_categories.append(category)
+
+    def update(self, expense_id, record):
+        # Only the fields present in record change
+        check_record(record)
+        fields = {}
+        if record.get("description") is not None:
+            fields["description"] = str(record["description"]).strip()
+        if record.get("amount") is not None:
+            fields["amount"] = parse_csv_amount(str(record["amount"]))
+        if record.get("category") is not None:
+            fields["category"] = str(record["category"]).strip() or "Other"
+            if fields["category"] not in self.new_categories:
+                self.new_categories.append(fields["category"])
+        if record.get("date") is not None:
+            fields["date"] = parse_csv_date(record["date"])
+        return self.tracker.update_expense(int(expense_id), **fields) is not None
+
+    def convert(self, backend):
+        # Copies everything into the new backend, which the user then keeps using
+        self.tracker.flush()
+        self.storage.convert_backend(backend)
+        self.tracker = ExpenseTracker(self.storage)
+        self.tracker.autoflush = False
+        self.tracker.on_budget_alert = self.alerts.append
+
+    def take_alerts(self):
+        # Budget alerts raised since the last call, the latest one per category and month
+        latest = {(alert["category"], alert["month"]): alert for alert in self.alerts}
+        self.alerts.clear()
+        return [dict(alert, spent=round(alert["spent"], 2)) for alert in latest.values()]
+
+    def close(self):
+        self.tracker.flush()
+        categories = self.storage.load_categories()
+        missing = [c for c in self.new_categories if c not in categories]
+        if missing:
+            self.storage.save_categories(categories + missing)
+        self.storage.close()
+
+
+def emit(record, out):
+    out.write(json.dumps(record) + "\n")
+
+
+def read_json_lines(paths):
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, "r")
+        try:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield path, number, line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def cmd_add(session, args, out):
+    added, errors = 0, 0
+    # With only --csv given, stdin is left alone
+    paths = args.files or ([] if args.csv else ["-"])
+    for path, number, line in read_json_lines(paths):
+        try:
+            session.add(json.loads(line))
+        except (ValueError, KeyError) as e:
+            errors += 1
+            emit({"error": f"{path}:{number}: {e}"}, out)
+            continue
+        added += 1
+    for path in args.csv or []:
+        result = session.tracker.import_csv(path)
+        added += result["imported"]
+        errors += result["skipped"]
+        for line, error in result["errors"]:
+            emit({"error": f"{path}:{line}: {error}"}, out)
+    emit({"added": added, "errors": errors}, out)
+    for alert in session.take_alerts():
+        emit({"budget_alert": alert}, out)
+
+
+def cmd_query(session, args, out):
+    result = session.tracker.query(args.start, args.end, args.category, args.min, args.max, args.text)
+    rows = result if args.limit is None else result.get_expense_rows(0, args.limit)
+    for exp in rows:
+        emit(exp, out)
+
+
+def cmd_summary(session, args, out):
+    if args.by == "category":
+        for category, total in session.tracker.get_summary_by_category().items():
+            emit({"category": category, "total": round(total, 2)}, out)
+    else:
+        for month, total in session.tracker.get_monthly_summary().items():
+            emit({"month": month, "total": round(total, 2)}, out)
+
+
+def cmd_export(session, args, out):
+    count = session.tracker.export_csv(args.path, args.start, args.end, args.category)
+    emit({"exported": count, "path": os.path.abspath(args.path)}, out)
+
+
+def cmd_delete_last(session, args, out):
+    emit({"deleted": session.tracker.delete_last_expense()}, out)
+
+
+def cmd_update(session, args, out):
+    emit({"id": args.id, "updated": session.update(args.id, vars(args))}, out)
+
+
+def cmd_delete(session, args, out):
+    emit({"id": args.id, "deleted": session.tracker.delete_expense(int(args.id)) is not None}, out)
+
+
+def cmd_budget(session, args, out):
+    budgets = dict(session.tracker.budgets)
+    for category, limit in args.set or []:
+        budgets[category] = check_limit(category, limit)
+    for category in args.clear or []:
+        budgets.pop(category, None)
+    if args.set or args.clear:
+        session.tracker.set_budgets(budgets)
+    for status in session.tracker.budget_status():
+        emit({key: round(value, 2) if isinstance(value, float) else value for key, value in status.items()}, out)
+
+
+def cmd_trends(session, args, out):
+    analytics = session.tracker.get_analytics()
+    day = datetime.now().toordinal()
+    for category in args.category or [None]:
+        spending = {key: round(value, 2) for key, value in analytics.spending(day, category).items()}
+        emit(dict(spending, category=category) if category else spending, out)
+
+
+def cmd_convert(session, args, out):
+    session.convert(args.target)
+    emit({"backend": args.target, "count": session.tracker.count()}, out)
+
+
+def cmd_batch(session, args, out):
+    # Each input line is {"cmd": ..., plus that command's options}; all of them share the session
+    for path, number, line in read_json_lines(args.files or ["-"]):
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ValueError("expected a JSON object")
+            name = command.pop("cmd")
+            if name == "add":
+                session.add(command)
+                emit({"cmd": "add", "ok": True}, out)
+                for alert in session.take_alerts():
+                    emit({"budget_alert": alert}, out)
+                continue
+            if name not in BATCH_COMMANDS:
+                raise ValueError(f"unknown command '{name}'")
+            if name in ("update", "delete") and command.get("id") is None:
+                raise ValueError(f"'{name}' needs an 'id'")
+            options = argparse.Namespace(**{**BATCH_DEFAULTS, **command})
+            check_day(options.start)
+            check_day(options.end)
+            options.category = check_categories(options.category)
+            BATCH_COMMANDS[name](session, options, out)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            emit({"error": f"{path}:{number}: {e}"}, out)
+
+
+BATCH_COMMANDS = {"query": cmd_query, "summary": cmd_summary, "export": cmd_export, "delete_last": cmd_delete_last,
+                  "update": cmd_update, "delete": cmd_delete}
+BATCH_DEFAULTS = {"start": None, "end": None, "category": None, "min": None, "max": None, "text": None,
+                  "limit": None, "by": "category", "description": None, "amount": None, "date": None}
+
+
+def add_filters(parser):
+    parser.add_argument("--start", type=day_argument, help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", type=day_argument, help="last date to include (YYYY-MM-DD)")
+    parser.add_argument("--category", action="append", help="only this category (repeatable)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless BudgetBase access. Output is JSON lines.")
+    parser.add_argument("user")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="fail unless the user's data is in this storage backend")
+    parser.add_argument("--diagnostics", action="store_true", help="print timings of storage and report paths to stderr as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add expenses from JSON lines (stdin or files) and/or CSV files")
+    add.add_argument("files", nargs="*", help="JSON-lines files; '-' or nothing reads stdin")
+    add.add_argument("--csv", action="append", help="CSV file to import (repeatable)")
+    add.set_defaults(func=cmd_add)
+
+    query = commands.add_parser("query", help="print matching expenses")
+    add_filters(query)
+    query.add_argument("--min", type=float, help="smallest amount to include")
+    query.add_argument("--max", type=float, help="largest amount to include")
+    query.add_argument("--text", help="words the description must contain (prefix match)")
+    query.add_argument("--limit", type=int)
+    query.set_defaults(func=cmd_query)
+
+    summary = commands.add_parser("summary", help="print totals by category or month")
+    summary.add_argument("--by", choices=["category", "month"], default="category")
+    summary.set_defaults(func=cmd_summary)
+
+    export = commands.add_parser("export", help="write matching expenses to a CSV file")
+    export.add_argument("path")
+    add_filters(export)
+    export.set_defaults(func=cmd_export)
+
+    update = commands.add_parser("update", help="change fields of one expense, by its id")
+    update.add_argument("id", type=int)
+    update.add_argument("--description")
+    update.add_argument("--amount")
+    update.add_argument("--category")
+    update.add_argument("--date")
+    update.set_defaults(func=cmd_update)
+
+    delete = commands.add_parser("delete", help="delete one expense, by its id")
+    delete.add_argument("id", type=int)
+    delete.set_defaults(func=cmd_delete)
+
+    budget = commands.add_parser("budget", help="set monthly budgets and print this month's status")
+    budget.add_argument("--set", nargs=2, action="append", metavar=("CATEGORY", "AMOUNT"))
+    budget.add_argument("--clear", action="append", metavar="CATEGORY")
+    budget.set_defaults(func=cmd_budget)
+
+    trends = commands.add_parser("trends", help="print today's, 7-day, 30-day and month-to-date spend with a projection")
+    trends.add_argument("--category", action="append", help="only this category (repeatable)")
+    trends.set_defaults(func=cmd_trends)
+
+    convert = commands.add_parser("convert", help="move the user's expenses to another storage backend")
+    # Not "backend": that name is taken by the --backend option
+    convert.add_argument("target", choices=sorted(BACKENDS), help="backend to move to")
+    convert.set_defaults(func=cmd_convert)
+
+    batch = commands.add_parser("batch", help="run JSON-lines commands from stdin or files in one session")
+    batch.add_argument("files", nargs="*")
+    batch.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    pin = os.environ.get("BUDGETBASE_PIN")
+    if pin is None:
+        if not sys.stdin.isatty():
+            print("Set BUDGETBASE_PIN when stdin is not a terminal", file=sys.stderr)
+            return 2
+        pin = getpass.getpass("PIN: ")
+    if args.diagnostics:
+        DIAGNOSTICS.enabled = True
+    try:
+        session = Session(args.user, pin, args.backend)
+    except CliError as e:
+        print(e, file=sys.stderr)
+        return 2
+    try:
+        args.func(session, args, sys.stdout)
+    except CliError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        session.close()
+        if args.diagnostics:
+            json.dump(DIAGNOSTICS.report(), sys.stderr, indent=2)
+            print(file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
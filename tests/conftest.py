@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture
+def base_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.SecureStorage, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(app.SecureStorage, "user_cache", None)
+    return str(tmp_path)
@@ -0,0 +1,176 @@
+import random
+from datetime import datetime
+
+import pytest
+
+import app
+
+BACKENDS = ["json", "journal", "sqlite", "partitioned", "binary"]
+
+
+def ordinal(date):
+    return datetime.fromisoformat(date).toordinal()
+
+
+def brute_window(expenses, first, last, category=None):
+    return sum(e["amount"] for e in expenses
+               if first <= ordinal(e["date"][:10]) <= last and (category is None or e["category"] == category))
+
+
+# ---------- DayTotals ----------
+def test_day_totals_match_brute_force():
+    rnd = random.Random(18)
+    base = ordinal("2024-06-01")
+    totals = app.DayTotals()
+    days = {}
+    for step in range(2000):
+        # Mostly near the start, now and then far outside the tree to force a rebuild
+        day = base + (rnd.randint(-2000, 2000) if rnd.random() < 0.02 else rnd.randint(-60, 60))
+        if days and rnd.random() < 0.3:
+            day = rnd.choice(list(days))
+            amount = -days[day] if rnd.random() < 0.5 else -rnd.uniform(0, days[day])
+        else:
+            amount = round(rnd.uniform(1, 100), 2)
+        totals.add(day, amount)
+        days[day] = days.get(day, 0.0) + amount
+        if step % 20 == 0:
+            first = base + rnd.randint(-2100, 2100)
+            last = first + rnd.randint(0, 400)
+            expected = sum(total for d, total in days.items() if first <= d <= last)
+            assert totals.total(first, last) == pytest.approx(expected, abs=1e-6)
+            assert totals.prefix(last) == pytest.approx(sum(t for d, t in days.items() if d <= last), abs=1e-6)
+    rebuilt = app.DayTotals(dict(totals.days))
+    for first in range(base - 100, base + 100, 7):
+        assert rebuilt.total(first, first + 30) == pytest.approx(totals.total(first, first + 30), abs=1e-6)
+
+
+def test_empty_day_totals():
+    totals = app.DayTotals()
+    assert totals.total(700000, 800000) == 0.0
+    totals.add(738000, 5.0)
+    totals.add(738000, -5.0)
+    assert totals.days == {}
+    assert totals.total(737000, 739000) == pytest.approx(0.0)
+
+
+# ---------- ExpenseAnalytics ----------
+def random_expenses(rnd, n):
+    return [{"id": i, "description": f"e{i}", "amount": round(rnd.uniform(1, 80), 2),
+             "category": rnd.choice("ABC"),
+             "date": f"2024-{rnd.randint(1, 5):02d}-{rnd.randint(1, 28):02d} 12:00:00"}
+            for i in range(1, n + 1)]
+
+
+def test_analytics_windows():
+    rnd = random.Random(3)
+    expenses = random_expenses(rnd, 400)
+    analytics = app.ExpenseAnalytics.from_expenses(expenses)
+    today = ordinal("2024-03-14")
+    for category in [None, "A", "B", "C", "Missing"]:
+        spending = analytics.spending(today, category)
+        first, last = ordinal("2024-03-01"), ordinal("2024-03-31")
+        assert spending["today"] == pytest.approx(brute_window(expenses, today, today, category))
+        assert spending["last_7_days"] == pytest.approx(brute_window(expenses, today - 6, today, category))
+        assert spending["last_30_days"] == pytest.approx(brute_window(expenses, today - 29, today, category))
+        assert spending["month_to_date"] == pytest.approx(brute_window(expenses, first, today, category))
+        rate = brute_window(expenses, today - 29, today, category) / 30
+        assert spending["projected_month"] == pytest.approx(spending["month_to_date"] + rate * (last - today))
+        rolling = analytics.rolling(today - 10, today, 30, category)
+        assert [day for day, total in rolling] == list(range(today - 10, today + 1))
+        for day, total in rolling:
+            assert total == pytest.approx(brute_window(expenses, day - 29, day, category))
+        cumulative = analytics.cumulative(first, today, category)
+        for day, total in cumulative:
+            assert total == pytest.approx(brute_window(expenses, first, day, category))
+
+
+def test_month_bounds():
+    assert app.ExpenseAnalytics.month_bounds(ordinal("2024-02-10")) == (ordinal("2024-02-01"), ordinal("2024-02-29"))
+    assert app.ExpenseAnalytics.month_bounds(ordinal("2023-12-31")) == (ordinal("2023-12-01"), ordinal("2023-12-31"))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_tracker_analytics_follow_edits(base_dir, backend):
+    rnd = random.Random(backend)
+    tracker = app.ExpenseTracker(app.SecureStorage("u", backend))
+    for expense in random_expenses(rnd, 150):
+        tracker.add_expense(expense["description"], expense["amount"], expense["category"], expense["date"])
+    analytics = tracker.get_analytics()
+    for step in range(150):
+        ids = [e["id"] for e in tracker.get_expenses()]
+        if rnd.random() < 0.4:
+            tracker.add_expense("new", rnd.randint(1, 50), rnd.choice("ABC"), f"2024-04-{rnd.randint(1, 28):02d}")
+        elif rnd.random() < 0.6:
+            tracker.update_expense(rnd.choice(ids), amount=rnd.randint(1, 50), category=rnd.choice("ABC"),
+                                   date=f"2024-0{rnd.randint(1, 5)}-{rnd.randint(1, 28):02d}")
+        else:
+            tracker.delete_expense(rnd.choice(ids))
+    assert tracker.get_analytics() is analytics
+    expenses = tracker.get_expenses()
+    for category in [None, "A", "B", "C"]:
+        for month in range(1, 6):
+            first, last = app.ExpenseAnalytics.month_bounds(ordinal(f"2024-{month:02d}-01"))
+            assert analytics.window(first, last, category) == pytest.approx(brute_window(expenses, first, last, category))
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_prepared_analytics_dropped_after_a_change(base_dir, backend):
+    tracker = app.ExpenseTracker(app.SecureStorage("u", backend))
+    tracker.add_expense("coffee", 3, "Food", "2024-01-05")
+    build = tracker.prepare_analytics()
+    tracker.add_expense("lunch", 9, "Food", "2024-01-05")
+    assert not tracker.install_analytics(build())
+    build = tracker.prepare_analytics()
+    assert tracker.install_analytics(build())
+    assert tracker.prepare_analytics() is None
+    day = ordinal("2024-01-05")
+    assert tracker.get_analytics().window(day, day, "Food") == pytest.approx(12)
+
+
+# ---------- Budget alerts ----------
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_budget_alerts(base_dir, tmp_path, backend):
+    tracker = app.ExpenseTracker(app.SecureStorage("u", backend))
+    alerts = []
+    tracker.on_budget_alert = alerts.append
+    tracker.set_budgets({"Food": 50})
+    tracker.add_expense("groceries", 30, "Food", "2024-01-05")
+    tracker.add_expense("rent", 900, "Housing", "2024-01-06")
+    assert alerts == []
+    tracker.add_expense("dinner", 25, "Food", "2024-02-10")
+    assert alerts == []
+    dinner = tracker.add_expense("dinner", 25, "Food", "2024-01-10")
+    assert alerts == [{"category": "Food", "month": "2024-01", "budget": 50.0, "spent": 55.0}]
+    tracker.update_expense(dinner, amount=10)
+    assert len(alerts) == 1
+    tracker.update_expense(dinner, date="2024-02-11", amount=30)
+    assert alerts[-1] == {"category": "Food", "month": "2024-02", "budget": 50.0, "spent": 55.0}
+    tracker.delete_expense(dinner)
+
+    # An import raises one alert per budgeted category and month it takes over
+    alerts.clear()
+    path = tmp_path / "in.csv"
+    path.write_text("date,description,amount,category\n"
+                    "2024-03-01,a,40,Food\n2024-03-02,b,40,Food\n2024-03-03,c,40,Food\n"
+                    "2024-01-20,d,30,Food\n2024-04-01,e,10,Food\n")
+    tracker.import_csv(str(path))
+    assert sorted((a["month"], a["spent"]) for a in alerts) == [("2024-01", 60.0), ("2024-03", 120.0)]
+
+
+def test_budget_status(base_dir):
+    tracker = app.ExpenseTracker(app.SecureStorage("u", "sqlite"))
+    tracker.set_budgets({"Food": 100, "Fun": 500})
+    tracker.add_expense("groceries", 60, "Food", "2024-03-02")
+    tracker.add_expense("groceries", 50, "Food", "2024-03-09")
+    tracker.add_expense("groceries", 30, "Food", "2024-02-20")
+    tracker.add_expense("game", 10, "Fun", "2024-03-10")
+    status = {s["category"]: s for s in tracker.budget_status(datetime(2024, 3, 10))}
+    food = status["Food"]
+    assert food["spent"] == pytest.approx(110)
+    assert food["over"] and food["projected_over"]
+    # 140 over the last 30 days at 21 days left in March
+    assert food["projected"] == pytest.approx(110 + 140 / 30 * 21)
+    fun = status["Fun"]
+    assert fun["spent"] == pytest.approx(10)
+    assert not fun["over"] and not fun["projected_over"]
+    assert app.SecureStorage("u", "sqlite").load_budgets() == {"Food": 100.0, "Fun": 500.0}
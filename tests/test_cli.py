@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import app
+import cli
+
+
+@pytest.fixture
+def user(base_dir, monkeypatch):
+    storage = app.SecureStorage("alice", "sqlite")
+    storage.save_pin("1234")
+    monkeypatch.setenv("BUDGETBASE_PIN", "1234")
+    return "alice"
+
+
+def run(capsys, *argv):
+    status = cli.main(list(argv))
+    out, err = capsys.readouterr()
+    return status, [json.loads(line) for line in out.splitlines()], err
+
+
+def write_lines(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text("".join(line + "\n" for line in lines))
+    return str(path)
+
+
+def test_add_reports_bad_lines_and_keeps_the_rest(user, tmp_path, capsys):
+    path = write_lines(tmp_path, "in.jsonl", [
+        '{"description": "coffee", "amount": "3.50", "category": "Food", "date": "2024-01-05"}',
+        'not json',
+        '[1, 2]',
+        '{"description": "no amount"}',
+        '{"description": "bool", "amount": true}',
+        '{"description": null, "amount": 7, "category": null, "date": "2024-01-06"}',
+    ])
+    status, out, err = run(capsys, user, "add", path)
+    assert status == 0
+    assert out[-1] == {"added": 2, "errors": 4}
+    assert [line["error"].split(":")[1] for line in out[:-1]] == ["2", "3", "4", "5"]
+
+    status, out, err = run(capsys, user, "query")
+    assert [(row["description"], row["category"], row["amount"]) for row in out] == [("coffee", "Food", 3.5), ("", "Other", 7.0)]
+
+
+def test_query_filters(user, tmp_path, capsys):
+    path = write_lines(tmp_path, "in.jsonl", [json.dumps(row) for row in [
+        {"description": "coffee beans", "amount": 12, "category": "Food", "date": "2024-01-05"},
+        {"description": "bus pass", "amount": 40, "category": "Travel", "date": "2024-02-01"},
+        {"description": "coffee cup", "amount": 4, "category": "Food", "date": "2024-02-03"},
+    ]])
+    run(capsys, user, "add", path)
+    status, out, err = run(capsys, user, "query", "--text", "cof", "--start", "2024-02-01")
+    assert [row["description"] for row in out] == ["coffee cup"]
+    status, out, err = run(capsys, user, "query", "--category", "Food", "--min", "5")
+    assert [row["description"] for row in out] == ["coffee beans"]
+    with pytest.raises(SystemExit):
+        cli.main([user, "query", "--start", "2024-13-01"])
+
+
+def test_budget_rejects_bad_limits(user, capsys):
+    for limit in ("abc", "0", "-5"):
+        status, out, err = run(capsys, user, "budget", "--set", "Food", limit)
+        assert status == 2
+        assert "Invalid budget for Food" in err
+    assert app.SecureStorage("alice").load_budgets() == {}
+    status, out, err = run(capsys, user, "budget", "--set", "Food", "$1,200")
+    assert status == 0
+    assert out[0]["category"] == "Food" and out[0]["budget"] == 1200
+
+
+def test_batch(user, tmp_path, capsys):
+    path = write_lines(tmp_path, "batch.jsonl", [
+        '{"cmd": "add", "description": "lunch", "amount": 9, "category": "Food", "date": "2024-03-01"}',
+        '{"cmd": "add", "description": "train", "amount": 30, "category": "Travel", "date": "2024-03-02"}',
+        '{"cmd": "query", "category": "Food"}',
+        '{"cmd": "query", "category": ["Food", "Travel"], "limit": 1}',
+        '{"cmd": "query", "category": 5}',
+        '{"cmd": "query", "start": "March"}',
+        '{"cmd": "update", "amount": 3}',
+        '{"cmd": "nope"}',
+        '"add"',
+        '{"cmd": "update", "id": 1, "amount": 11}',
+        '{"cmd": "summary"}',
+    ])
+    status, out, err = run(capsys, user, "batch", path)
+    assert status == 0
+    assert out[:2] == [{"cmd": "add", "ok": True}] * 2
+    assert [row["description"] for row in out[2:4]] == ["lunch", "lunch"]
+    errors = [line["error"] for line in out if "error" in line]
+    assert [error.split(":")[1] for error in errors] == ["5", "6", "7", "8", "9"]
+    assert "'category' must be a string or a list of strings" in errors[0]
+    assert "'update' needs an 'id'" in errors[2]
+    assert out[-3] == {"id": 1, "updated": True}
+    assert sorted(out[-2:], key=lambda line: line["category"]) == [{"category": "Food", "total": 11.0},
+                                                                  {"category": "Travel", "total": 30.0}]
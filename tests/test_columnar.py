@@ -0,0 +1,33 @@
+import app
+
+ROWS = [
+    {"id": 1, "date": "2024-01-05", "description": "plain day", "amount": 5.0, "category": "A"},
+    {"id": 2, "date": "2024-01-05 10:30:00", "description": "seconds", "amount": 2.5, "category": "B"},
+    {"id": 3, "date": "2024-01-06 10:30:00.250000", "description": "fraction", "amount": 1.0, "category": "A"},
+    {"id": 4, "date": "2024-01-07T08:00:00", "description": "iso", "amount": 3.0, "category": "A"},
+]
+
+
+def test_dates_come_back_as_stored():
+    store = app.ColumnarExpenses(ROWS)
+    assert list(store) == ROWS
+    assert store.copy()[:] == ROWS
+    store[2] = dict(ROWS[2], date="2024-02-01")
+    del store[0]
+    assert list(store) == [ROWS[1], dict(ROWS[2], date="2024-02-01"), ROWS[3]]
+    assert store.odd_dates == {4: "2024-01-07T08:00:00"}
+    assert store.day_groups() == {("B", app.ExpenseAnalytics.day("2024-01-05")): 2.5,
+                                  ("A", app.ExpenseAnalytics.day("2024-02-01")): 1.0,
+                                  ("A", app.ExpenseAnalytics.day("2024-01-07")): 3.0}
+
+
+def test_columnar_tracker_saves_dates_unchanged(base_dir):
+    storage = app.SecureStorage("u", "json")
+    tracker = app.ExpenseTracker(storage, columnar=True)
+    for row in ROWS:
+        tracker.add_expense(row["description"], row["amount"], row["category"], row["date"])
+    tracker.save_expenses()
+    storage.close()
+    storage = app.SecureStorage("u")
+    assert [row["date"] for row in app.ExpenseTracker(storage).get_expenses()] == [row["date"] for row in ROWS]
+    storage.close()
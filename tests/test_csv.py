@@ -0,0 +1,117 @@
+import pytest
+
+import app
+
+
+def write_csv(tmp_path, text, name="statement.csv"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def read_all(path, chunk_size=5000):
+    expenses, errors = [], []
+    for chunk, chunk_errors in app.read_expenses_csv(path, chunk_size=chunk_size):
+        expenses.extend(chunk)
+        errors.extend(chunk_errors)
+    return expenses, errors
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-03-05", "2024-03-05 00:00:00"),
+    ("2024-03-05 14:30:00", "2024-03-05 14:30:00"),
+    ("03/05/2024", "2024-03-05 00:00:00"),
+    ("03/05/2024 14:30:00", "2024-03-05 14:30:00"),
+    ("05.03.2024", "2024-03-05 00:00:00"),
+    (" 2024-03-05 ", "2024-03-05 00:00:00"),
+])
+def test_parse_csv_date(value, expected):
+    assert app.parse_csv_date(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "2024-13-01", "yesterday", "2024/03/05"])
+def test_parse_csv_date_rejects(value):
+    with pytest.raises(ValueError):
+        app.parse_csv_date(value)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12.50", 12.5),
+    ("$1,234.56", 1234.56),
+    (" 7 ", 7.0),
+])
+def test_parse_csv_amount(value, expected):
+    assert app.parse_csv_amount(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "abc", "nan", "inf", "-5", "0", "-0.01", "$-3"])
+def test_parse_csv_amount_rejects(value):
+    with pytest.raises(ValueError):
+        app.parse_csv_amount(value)
+
+
+def test_read_reports_skipped_rows_by_line(tmp_path):
+    path = write_csv(tmp_path, "\n".join([
+        "Date,Description,Amount,Category",
+        "2024-01-05,coffee,3.50,Food",
+        "2024-01-06,refund,-5,",
+        "not a date,bus,2.75,Transport",
+        "2024-01-07,free sample,0,Food",
+        "2024-01-08,book,abc,Books",
+        "01/09/2024,lunch,\"$1,200.00\",",
+        "",
+    ]))
+    expenses, errors = read_all(path)
+    assert expenses == [
+        {"date": "2024-01-05 00:00:00", "description": "coffee", "amount": 3.5, "category": "Food"},
+        {"date": "2024-01-09 00:00:00", "description": "lunch", "amount": 1200.0, "category": "Other"},
+    ]
+    assert [line for line, error in errors] == [3, 4, 5, 6]
+    assert "positive" in errors[0][1]
+    assert "positive" in errors[2][1]
+
+
+def test_read_chunks_keep_line_numbers(tmp_path):
+    lines = ["date,amount"] + [f"2024-01-{i % 28 + 1:02d},{-1 if i % 4 == 0 else i}" for i in range(1, 40)]
+    path = write_csv(tmp_path, "\n".join(lines) + "\n")
+    chunks = list(app.read_expenses_csv(path, chunk_size=5))
+    assert len(chunks) > 1
+    expenses, errors = read_all(path, chunk_size=5)
+    assert len(expenses) == 30
+    assert [line for line, error in errors] == [i + 1 for i in range(1, 40) if i % 4 == 0]
+
+
+def test_read_missing_columns(tmp_path):
+    path = write_csv(tmp_path, "description,category\ncoffee,Food\n")
+    with pytest.raises(ValueError, match="amount, date"):
+        read_all(path)
+
+
+def test_read_empty_file(tmp_path):
+    assert read_all(write_csv(tmp_path, "")) == ([], [])
+
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sqlite", "partitioned", "binary"])
+def test_import_csv(base_dir, tmp_path, backend):
+    storage = app.SecureStorage("u", backend)
+    tracker = app.ExpenseTracker(storage)
+    tracker.add_expense("seed", 10, "Food", "2024-01-01")
+    path = write_csv(tmp_path, "\n".join([
+        "date,description,amount,category",
+        "2024-02-01,rent,900,Housing",
+        "2024-02-02,refund,-5,",
+        "2024-02-03,snack,2.25,Food",
+        "bad,row,1,Food",
+        "",
+    ]))
+    result = tracker.import_csv(path)
+    assert result["imported"] == 2
+    assert result["skipped"] == 2
+    assert [line for line, error in result["errors"]] == [3, 5]
+    assert sorted(e["amount"] for e in tracker.get_expenses()) == [2.25, 10, 900]
+    assert "Housing" in storage.load_categories()
+    assert tracker.get_summary_by_category() == pytest.approx({"Food": 12.25, "Housing": 900})
+    storage.close()
+
+    fresh = app.ExpenseTracker(app.SecureStorage("u", backend))
+    assert sorted(e["amount"] for e in fresh.get_expenses()) == [2.25, 10, 900]
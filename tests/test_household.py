@@ -0,0 +1,75 @@
+import pytest
+
+import app
+
+
+def test_merge_summaries():
+    report = app.merge_summaries([
+        {"user": "bob", "count": 2, "categories": {"Food": [1, 5.0], "Rent": [1, 500.0]},
+         "months": {"2024-02": [1, 500.0], "2024-01": [1, 5.0]}},
+        {"user": "carol", "error": "Invalid PIN"},
+        {"user": "alice", "count": 3, "categories": {"Food": [3, 12.5]},
+         "months": {"2024-01": [2, 10.0], "2024-03": [1, 2.5]}},
+    ])
+    assert list(report["users"]) == ["alice", "bob", "carol"]
+    assert report["users"]["alice"] == {"count": 3, "total": 12.5}
+    assert report["users"]["bob"] == {"count": 2, "total": 505.0}
+    assert report["users"]["carol"] == {"error": "Invalid PIN"}
+    assert report["count"] == 5
+    assert report["total"] == pytest.approx(517.5)
+    assert report["categories"] == {"Food": [4, 17.5], "Rent": [1, 500.0]}
+    assert list(report["months"]) == ["2024-01", "2024-02", "2024-03"]
+    assert report["months"]["2024-01"] == [3, 15.0]
+
+
+def test_merge_no_summaries():
+    assert app.merge_summaries([]) == {"count": 0, "total": 0.0, "users": {}, "categories": {}, "months": {}}
+
+
+def make_user(user_id, pin, backend, expenses):
+    storage = app.SecureStorage(user_id, backend)
+    if pin is not None:
+        storage.save_pin(pin)
+    tracker = app.ExpenseTracker(storage)
+    for description, amount, category, date in expenses:
+        tracker.add_expense(description, amount, category, date)
+    tracker.flush()
+    storage.close()
+
+
+@pytest.fixture
+def household(base_dir):
+    make_user("alice", "1111", "sqlite", [("coffee", 3.5, "Food", "2024-01-05"), ("rent", 900, "Housing", "2024-02-01")])
+    make_user("bob", "2222", "binary", [("lunch", 12, "Food", "2024-01-09"), ("bus", 2.75, "Transport", "2024-03-02")])
+    make_user("carol", "3333", "json", [("gym", 40, "Health", "2024-02-14")])
+    make_user("dave", None, "journal", [("book", 15, "Books", "2024-01-20")])
+    return base_dir
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_household_report(household, processes):
+    progress = []
+    pins = {"alice": "1111", "bob": "2222", "carol": "0000", "dave": "1234", "nobody": "1"}
+    report = app.household_report(pins, processes=processes, progress=progress.append)
+    assert report["users"] == {
+        "alice": {"count": 2, "total": 903.5},
+        "bob": {"count": 2, "total": 14.75},
+        "carol": {"error": "Invalid PIN"},
+        "dave": {"error": "Invalid PIN"},
+    }
+    assert report["count"] == 4
+    assert report["total"] == pytest.approx(918.25)
+    assert report["categories"] == {"Food": [2, 15.5], "Housing": [1, 900.0], "Transport": [1, 2.75]}
+    assert report["months"] == {"2024-01": [2, 15.5], "2024-02": [1, 900.0], "2024-03": [1, 2.75]}
+    assert progress[-1] == 1.0
+
+
+def test_household_report_leaves_out_users_without_pins(household):
+    report = app.household_report({"carol": "3333"})
+    assert report["users"] == {"carol": {"count": 1, "total": 40.0}}
+    assert report["categories"] == {"Health": [1, 40.0]}
+
+
+def test_read_household_pins_from_env(monkeypatch):
+    monkeypatch.setenv("BUDGETBASE_PINS", '{"alice": "1111"}')
+    assert app.read_household_pins(["alice", "bob"]) == {"alice": "1111"}
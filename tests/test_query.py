@@ -0,0 +1,143 @@
+import random
+
+import pytest
+
+import app
+
+BACKENDS = ["json", "journal", "sqlite", "partitioned", "binary"]
+WORDS = ["coffee", "coffeehouse", "rent", "bus", "lunch", "groceries", "gym"]
+CATEGORIES = ["Food", "Transport", "Housing", "Health"]
+
+
+def random_expense(rnd, expense_id):
+    words = rnd.sample(WORDS, rnd.randint(1, 3))
+    return {
+        "id": expense_id,
+        "description": " ".join(words).title() + f" #{expense_id}",
+        "amount": round(rnd.uniform(1, 200), 2),
+        "category": rnd.choice(CATEGORIES),
+        "date": f"2024-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00",
+    }
+
+
+def random_options(rnd):
+    options = {}
+    if rnd.random() < 0.4:
+        options["start"] = f"2024-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d}"
+    if rnd.random() < 0.4:
+        options["end"] = f"2024-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d}"
+    if rnd.random() < 0.4:
+        options["categories"] = rnd.sample(CATEGORIES + ["Missing"], rnd.randint(1, 2))
+    if rnd.random() < 0.3:
+        options["min_amount"] = rnd.randint(0, 150)
+    if rnd.random() < 0.3:
+        options["max_amount"] = rnd.randint(50, 200)
+    if rnd.random() < 0.5:
+        options["text"] = " ".join(word[:rnd.randint(1, len(word))] for word in rnd.sample(WORDS, rnd.randint(1, 2)))
+    return options
+
+
+def brute_ids(rows, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+    # Checks every row against every filter, in ID order
+    low, high = app.date_bounds(start, end)
+    words = app.tokenize(text or "")
+    return sorted(row["id"] for row in rows
+                  if (low is None or row["date"] >= low) and (high is None or row["date"] < high)
+                  and (not categories or row["category"] in categories)
+                  and (min_amount is None or row["amount"] >= min_amount)
+                  and (max_amount is None or row["amount"] <= max_amount)
+                  and all(any(token.startswith(word) for token in app.tokenize(row["description"])) for word in words))
+
+
+@pytest.mark.parametrize("intersect", [False, True])
+def test_index_search_matches_brute_force(intersect):
+    rnd = random.Random(12)
+    rows = {i: random_expense(rnd, i) for i in range(1, 301)}
+    fetched = []
+
+    def fetch(ids):
+        assert ids == sorted(ids)
+        fetched.append(len(ids))
+        return [rows[i] for i in ids]
+
+    index = app.ExpenseIndex.build(rnd.sample(list(rows.values()), len(rows)))
+    for _ in range(200):
+        options = random_options(rnd)
+        assert index.search(fetch, intersect=intersect, **options) == brute_ids(rows.values(), **options)
+
+
+def test_index_add_and_remove_match_rebuild():
+    rnd = random.Random(5)
+    rows = {}
+    index = app.ExpenseIndex()
+    next_id = 1
+    for step in range(600):
+        if rows and rnd.random() < 0.35:
+            expense = rows.pop(rnd.choice(list(rows)))
+            index.remove(expense)
+        else:
+            # Now and then an older ID comes back, as undo restores a delete
+            expense_id = next_id if rnd.random() < 0.8 or not next_id > 1 else rnd.randint(1, next_id - 1)
+            if expense_id in rows:
+                continue
+            next_id = max(next_id, expense_id + 1)
+            rows[expense_id] = random_expense(rnd, expense_id)
+            index.add(rows[expense_id])
+        if step % 50 == 0:
+            rebuilt = app.ExpenseIndex.build(rows.values())
+            assert index.ids == rebuilt.ids
+            assert index.categories == rebuilt.categories
+            assert index.tokens == rebuilt.tokens
+            assert index.vocabulary == rebuilt.vocabulary
+            assert index.dates == rebuilt.dates
+            assert sorted(index.date_ids) == sorted(rebuilt.date_ids)
+    fetch = lambda ids: [rows[i] for i in ids]
+    for _ in range(100):
+        options = random_options(rnd)
+        assert index.search(fetch, **options) == brute_ids(rows.values(), **options)
+
+
+def test_prefix_search():
+    rows = [{"id": 1, "description": "Coffee at work", "amount": 3, "category": "Food", "date": "2024-01-01 00:00:00"},
+            {"id": 2, "description": "Coffeehouse beans", "amount": 12, "category": "Food", "date": "2024-01-02 00:00:00"},
+            {"id": 3, "description": "Bus to work", "amount": 2, "category": "Transport", "date": "2024-01-03 00:00:00"}]
+    index = app.ExpenseIndex.build(rows)
+    fetch = lambda ids: [rows[i - 1] for i in ids]
+    assert index.search(fetch, text="coff") == [1, 2]
+    assert index.search(fetch, text="coffeeh") == [2]
+    assert index.search(fetch, text="WORK co") == [1]
+    assert index.search(fetch, text="tea") == []
+    assert index.search(fetch, categories=["Food"], max_amount=5) == [1]
+    assert index.search(fetch, start="2024-01-02", end="2024-01-02") == [2]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_tracker_query_matches_brute_force(base_dir, backend):
+    rnd = random.Random(backend)
+    storage = app.SecureStorage("u", backend)
+    tracker = app.ExpenseTracker(storage)
+    for i in range(250):
+        expense = random_expense(rnd, i)
+        tracker.add_expense(expense["description"], expense["amount"], expense["category"], expense["date"])
+    for expense_id in rnd.sample(range(1, 251), 40):
+        tracker.delete_expense(expense_id)
+    for expense_id in rnd.sample([e["id"] for e in tracker.get_expenses()], 40):
+        tracker.update_expense(expense_id, amount=rnd.randint(1, 200), category=rnd.choice(CATEGORIES))
+    tracker.flush()
+    storage.close()
+
+    storage = app.SecureStorage("u", backend)
+    tracker = app.ExpenseTracker(storage)
+    rows = tracker.get_expenses()
+    by_id = {row["id"]: row for row in rows}
+    key = getattr(storage.backend, "list_key", lambda row: row["id"])
+    for _ in range(60):
+        options = random_options(rnd)
+        expected = brute_ids(rows, **options)
+        result = tracker.query(**options)
+        assert sorted(result.keys) == expected
+        assert [row["id"] for row in result] == result.keys
+        assert result.keys == [row["id"] for row in sorted((by_id[i] for i in expected), key=key)]
+        assert result.get_expense_rows(2, 5) == [by_id[i] for i in result.keys[2:5]]
+        assert tracker.prepare_query(**options)().keys == result.keys
+    storage.close()
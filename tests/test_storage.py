@@ -0,0 +1,298 @@
+import json
+import multiprocessing
+import os
+import random
+
+import pytest
+
+import app
+
+BACKENDS = ["json", "journal", "sqlite", "partitioned", "binary"]
+
+
+def open_tracker(user, backend=None):
+    storage = app.SecureStorage(user, backend)
+    return storage, app.ExpenseTracker(storage)
+
+
+def rows(tracker):
+    return sorted((e["id"], e["description"], e["amount"], e["category"], e["date"]) for e in tracker.get_expenses())
+
+
+def assert_aggregates(tracker):
+    fresh = app.ExpenseAggregates.from_expenses(tracker.get_expenses())
+    assert tracker.aggregates.count == fresh.count
+    assert tracker.get_summary_by_category() == pytest.approx(fresh.summary_by_category())
+    assert tracker.get_monthly_summary() == pytest.approx(fresh.monthly_summary())
+
+
+# ---------- Concurrent commits ----------
+def add_rows(base_dir, backend, tag, n):
+    app.SecureStorage.BASE_DIR = base_dir
+    storage, tracker = open_tracker("u", backend)
+    tracker.autoflush = False
+    for i in range(n):
+        tracker.add_expense(f"{tag} {i}", i + 1, tag, f"2024-{i % 12 + 1:02d}-05")
+        if i % 7 == 0:
+            tracker.flush()
+    tracker.flush()
+    storage.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_concurrent_commits(base_dir, backend):
+    storage, tracker = open_tracker("u", backend)
+    tracker.add_expense("seed", 1, "S", "2024-01-01")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=add_rows, args=(base_dir, backend, tag, 60)) for tag in "PQR"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    tracker.reload_changes()
+
+    fresh_storage, fresh = open_tracker("u", backend)
+    ids = [row[0] for row in rows(fresh)]
+    assert len(ids) == len(set(ids)) == 181
+    assert rows(tracker) == rows(fresh)
+    assert_aggregates(tracker)
+    assert_aggregates(fresh)
+    storage.close()
+    fresh_storage.close()
+
+
+# ---------- Aggregate cache ----------
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_stale_aggregates_cache(base_dir, backend):
+    # Two trackers on one user: A edits an old row, then B adds without
+    # reloading; B's cache must not describe A's edit as unchanged
+    storage_a, a = open_tracker("u", backend)
+    ids = [a.add_expense(f"e{i}", 5, "Food", "2024-01-05") for i in range(10)]
+    storage_b, b = open_tracker("u", backend)
+    a.update_expense(ids[4], amount=1000)
+    b.add_expense("late", 5, "Food", "2024-01-06")
+    storage_a.close()
+    storage_b.close()
+
+    storage, tracker = open_tracker("u")
+    assert tracker.count() == 11
+    assert tracker.get_summary_by_category() == pytest.approx({"Food": 1050.0})
+    assert_aggregates(tracker)
+    storage.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_aggregates_cache_from_before_an_edit(base_dir, backend):
+    # A crash between the commit and the cache save leaves a cache whose count
+    # and last row still match; only the change token tells it apart
+    storage, tracker = open_tracker("u", backend)
+    ids = [tracker.add_expense(f"e{i}", 5, "Food", "2024-01-05") for i in range(10)]
+    with open(storage.aggregate_file) as f:
+        before = f.read()
+    tracker.update_expense(ids[4], amount=1000)
+    storage.close()
+    with open(storage.aggregate_file, "w") as f:
+        f.write(before)
+
+    storage, tracker = open_tracker("u")
+    assert tracker.get_summary_by_category() == pytest.approx({"Food": 1045.0})
+    storage.close()
+
+
+def test_old_aggregates_cache_is_rebuilt(base_dir):
+    storage, tracker = open_tracker("u", "journal")
+    tracker.add_expense("a", 30, "Food", "2024-01-05")
+    tracker.set_budgets({"Food": 50})
+    storage.close()
+    with open(storage.aggregate_file) as f:
+        data = json.load(f)
+    del data["category_months"]
+    with open(storage.aggregate_file, "w") as f:
+        json.dump(data, f)
+
+    storage, tracker = open_tracker("u")
+    alerts = []
+    tracker.on_budget_alert = alerts.append
+    tracker.add_expense("b", 30, "Food", "2024-01-06")
+    assert [alert["spent"] for alert in alerts] == pytest.approx([60])
+    assert tracker.analytics is None
+    storage.close()
+
+
+# ---------- Crash recovery ----------
+def test_journal_torn_tail(base_dir):
+    storage, tracker = open_tracker("u", "journal")
+    for i in range(3):
+        tracker.add_expense(f"e{i}", 10, "A", "2024-01-05")
+    storage.close()
+    with open(storage.journal_file, "ab") as f:
+        f.write(b'{"seq": 99, "op": "add", "expense": {"desc')
+
+    storage, tracker = open_tracker("u")
+    assert tracker.count() == 3
+    tracker.add_expense("after", 10, "A", "2024-01-06")
+    storage.close()
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["e0", "e1", "e2", "after"]
+    storage.close()
+
+
+def test_binary_torn_commit(base_dir):
+    storage, tracker = open_tracker("u", "binary")
+    for i in range(3):
+        tracker.add_expense(f"e{i}", 10, "A", "2024-01-05")
+    storage.close()
+    # Records appended past the header's count, and a rewrite that stopped
+    # before pointing expenses.bin at its files
+    with open(os.path.join(storage.user_dir, "expenses.1.bin"), "ab") as f:
+        f.write(b"\xff" * 50)
+    for name in ("expenses.2.bin", "expenses.2.heap"):
+        with open(os.path.join(storage.user_dir, name), "wb") as f:
+            f.write(b"partial")
+
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["e0", "e1", "e2"]
+    tracker.add_expense("after", 10, "A", "2024-01-06")
+    tracker.delete_expense(1)
+    storage.close()
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["e1", "e2", "after"]
+    assert_aggregates(tracker)
+    storage.close()
+
+
+def test_binary_rewrite_leaves_open_files_alone(base_dir, monkeypatch):
+    # Windows can't replace or remove a file another process has open, so a
+    # rewrite may only replace expenses.bin, which nobody keeps open
+    storage_a, a = open_tracker("u", "binary")
+    ids = [a.add_expense(f"e{i}", 10, "A", "2024-01-05") for i in range(300)]
+    storage_b, b = open_tracker("u", "binary")
+    b.get_expense_rows(0, 10)
+    held = {os.path.abspath(f.name) for f in (storage_b.backend.file, storage_b.backend.heap)}
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(app.os, "replace", lambda src, dst: (replaced.append(os.path.abspath(dst)), real_replace(src, dst)))
+    for expense_id in ids[:250]:
+        a.delete_expense(expense_id)
+    assert storage_a.backend.generation > 1
+    assert os.path.abspath(storage_a.binary_file) in replaced
+    assert not held & set(replaced)
+    b.reload_changes()
+    assert rows(b) == rows(a) and b.count() == 50
+    generation = storage_a.backend.generation
+    storage_a.close()
+    storage_b.close()
+    assert sorted(name for name in os.listdir(storage_a.user_dir) if name.startswith("expenses.")) == sorted(
+        ["expenses.bin"] + [f"expenses.{generation}.{suffix}" for suffix in ("bin", "heap", "categories.json")])
+
+
+def test_binary_file_from_before_generations(base_dir):
+    storage, tracker = open_tracker("u", "binary")
+    for i in range(3):
+        tracker.add_expense(f"e{i}", 10, "A", "2024-01-05")
+    storage.close()
+    # The records used to live in expenses.bin itself
+    os.replace(os.path.join(storage.user_dir, "expenses.1.bin"), storage.binary_file)
+
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["e0", "e1", "e2"]
+    with open(storage.binary_file) as f:
+        assert json.load(f) == {"generation": 1}
+    tracker.add_expense("after", 10, "A", "2024-01-06")
+    storage.close()
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["e0", "e1", "e2", "after"]
+    storage.close()
+
+
+def test_partition_manifest_mismatch(base_dir):
+    storage, tracker = open_tracker("u", "partitioned")
+    tracker.add_expense("jan", 10, "A", "2024-01-05")
+    tracker.add_expense("feb", 20, "B", "2024-02-05")
+    storage.close()
+    # A row appended without its manifest write, then a torn line
+    path = os.path.join(storage.partition_dir, "2024-01.jsonl")
+    with open(path, "ab") as f:
+        row = {"seq": 3, "date": "2024-01-07", "description": "lost", "amount": 5.0, "category": "A"}
+        f.write(json.dumps(row).encode() + b"\n")
+        f.write(b'{"seq": 4, "date"')
+
+    storage, tracker = open_tracker("u")
+    assert tracker.count() == 3
+    assert tracker.get_summary_by_category() == pytest.approx({"A": 15.0, "B": 20.0})
+    assert tracker.last()["description"] == "lost"
+    tracker.add_expense("after", 1, "A", "2024-01-08")
+    storage.close()
+    storage, tracker = open_tracker("u")
+    assert [row[1] for row in rows(tracker)] == ["jan", "feb", "lost", "after"]
+    assert_aggregates(tracker)
+    storage.close()
+
+
+# ---------- Pending changes ----------
+def brute_query(model, key, start=None, end=None, categories=None, min_amount=None, max_amount=None, text=None):
+    low, high = app.date_bounds(start, end)
+    words = app.tokenize(text or "")
+    matches = [row for row in model.values()
+               if (low is None or row["date"] >= low) and (high is None or row["date"] < high)
+               and (not categories or row["category"] in categories)
+               and (min_amount is None or row["amount"] >= min_amount)
+               and (max_amount is None or row["amount"] <= max_amount)
+               and all(any(token.startswith(word) for token in app.tokenize(row["description"])) for word in words)]
+    return [row["id"] for row in sorted(matches, key=key)]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "partitioned", "binary"])
+def test_reads_see_pending_changes_without_committing(base_dir, backend):
+    rnd = random.Random(7)
+    storage, tracker = open_tracker("u", backend)
+    tracker.autoflush = False
+    key = storage.backend.list_key
+    model, removed = {}, []
+    words = ["coffee", "rent", "bus", "lunch"]
+    for step in range(400):
+        choice = rnd.random()
+        date = f"2024-{rnd.randint(1, 4):02d}-{rnd.randint(1, 28):02d}"
+        if choice < 0.5 or not model:
+            expense_id = tracker.add_expense(f"{rnd.choice(words)} {step}", rnd.randint(1, 50), rnd.choice("AB"), date)
+            model[expense_id] = tracker.get_expense(expense_id)
+        elif choice < 0.7:
+            expense_id = rnd.choice(list(model))
+            tracker.update_expense(expense_id, amount=rnd.randint(1, 50), date=date)
+            model[expense_id] = tracker.get_expense(expense_id)
+        elif choice < 0.85:
+            expense_id = rnd.choice(list(model))
+            removed.append(tracker.delete_expense(expense_id))
+            del model[expense_id]
+        elif removed:
+            expense = removed.pop(rnd.randrange(len(removed)))
+            tracker.restore_expense(expense)
+            model[expense["id"]] = expense
+        if rnd.random() < 0.05:
+            tracker.flush()
+        pending = len(tracker.pending)
+        rows = sorted(model.values(), key=key)
+        assert tracker.count() == len(rows)
+        start = rnd.randint(0, len(rows))
+        assert tracker.get_expense_rows(start, start + 7) == rows[start:start + 7]
+        assert tracker.last() == max(rows, key=lambda row: row["id"], default=None)
+        options = rnd.choice([{}, {"text": rnd.choice(words)[:3]}, {"categories": ["A"], "min_amount": 20},
+                              {"start": "2024-02-01", "end": "2024-03-15"}])
+        result = tracker.query(**options)
+        assert result.keys == brute_query(model, key, **options)
+        assert list(result) == [model[expense_id] for expense_id in result.keys]
+        assert tracker.prepare_query(**options)().keys == result.keys
+        assert len(tracker.pending) == pending
+    assert tracker.get_expenses() == sorted(model.values(), key=key)
+    tracker.flush()
+    assert storage.backend.count() == len(model)
+    newest = max(model)
+    tracker.delete_expense(newest)
+    del model[newest]
+    assert tracker.last() == model[max(model)]
+    tracker.flush()
+    storage.close()
+    storage, tracker = open_tracker("u")
+    assert tracker.get_expenses() == sorted(model.values(), key=key)
+    storage.close()